@@ -0,0 +1,108 @@
+import importlib
+import json
+import pathlib
+import random
+import shutil
+import subprocess
+import sys
+import time
+import typing as t
+
+_src = pathlib.Path(__file__).resolve().parent.parent.joinpath('src')
+
+def load_tool(name: str) -> t.Any:
+    """
+    Imports one of the tools by module name.
+    The script style tools import `utils` as a top level module, so it is aliased to the package's copy first.
+    """
+    if str(_src) not in sys.path:
+        sys.path.insert(0, str(_src))
+    import buildingblocks.tools.utils as u
+    sys.modules.setdefault('utils', u)
+    tools = str(_src.joinpath('buildingblocks', 'tools'))
+    if tools not in sys.path:
+        sys.path.insert(1, tools)
+    if name in ('count_ngrams', 'extract_csv_from_jsonl', 'index_jsonl', 'utils'):
+        return importlib.import_module(f'buildingblocks.tools.{name}')
+    return importlib.import_module(name)
+
+def zipf_words(vocabulary: int, seed: int) -> t.Callable[[int], t.List[str]]:
+    """
+    Returns a function drawing `k` words from a Zipf distribution over `vocabulary` words, the way word frequencies fall off in real text
+    """
+    rng = random.Random(seed)
+    words = [f'w{i}' for i in range(vocabulary)]
+    weights = [1 / (i + 1) ** 1.1 for i in range(vocabulary)]
+    total = 0.0
+    cum_weights = []
+    for weight in weights:
+        total = total + weight
+        cum_weights.append(total)
+    return lambda k: rng.choices(words, cum_weights = cum_weights, k = k)
+
+def make_jsonl(jsonl_out: pathlib.Path, documents: int, lines: int = 10, words: int = 20, vocabulary: int = 50000, seed: int = 0) -> pathlib.Path:
+    """
+    Writes a synthetic `JSONL` corpus, reusing it when it already exists
+    """
+    if jsonl_out.exists():
+        return jsonl_out
+    jsonl_out.parent.mkdir(parents = True, exist_ok = True)
+    draw = zipf_words(vocabulary, seed)
+    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
+        for i in range(documents):
+            text = [' '.join(draw(words)) for _ in range(lines)]
+            fp.write(json.dumps({ 'id' : str(i), 'text' : text }) + '\n')
+    return jsonl_out
+
+def make_txt_folder(folder_out: pathlib.Path, documents: int, lines: int = 10, words: int = 20, seed: int = 0) -> pathlib.Path:
+    """
+    Writes a folder of synthetic `TXT` files, reusing it when it already exists
+    """
+    if folder_out.exists():
+        return folder_out
+    folder_out.mkdir(parents = True)
+    draw = zipf_words(5000, seed)
+    for i in range(documents):
+        with open(folder_out.joinpath(f'doc{i:06}.txt'), 'w', encoding = 'utf-8') as fp:
+            fp.writelines(' '.join(draw(words)) + '\n' for _ in range(lines))
+    return folder_out
+
+def run_tool(name: str, args: t.List[str]) -> float:
+    """
+    Runs one of the tools as `__main__` in a child process, with its command line arguments.
+    Returns the seconds it took.
+    """
+    tool = str(_src.joinpath('buildingblocks', 'tools', f'{name}.py'))
+    code = f'import runpy, sys; sys.path.insert(0, {str(pathlib.Path(__file__).resolve().parent)!r}); import common; common.load_tool("utils"); sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name = "__main__")'
+    elapsed, _, _ = run_child(['-c', code, tool, *args])
+    return elapsed
+
+def list_folder_files(folder_in: pathlib.Path) -> t.Dict[str, bytes]:
+    """
+    Reads every file under the folder, keyed by its name, so two outputs can be compared whatever sub folders they use
+    """
+    return { path.name : path.read_bytes() for path in folder_in.rglob('*') if path.is_file() }
+
+def remove(path: pathlib.Path) -> None:
+    """
+    Removes the file or folder, if it exists, so a tool starts from an empty output
+    """
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+def run_child(args: t.List[str]) -> t.Tuple[float, int, str]:
+    """
+    Runs the python command in a child process.
+    Returns the seconds it took, its peak resident memory in bytes and its output.
+    The child has its own process so each run's peak memory is measured on its own.
+    """
+    code = 'import resource, subprocess, sys; p = subprocess.run(sys.argv[1:], capture_output = True, text = True); sys.stdout.write(p.stdout); sys.stderr.write(p.stderr); print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, file = sys.stderr); sys.exit(p.returncode)'
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code, sys.executable, *args], capture_output = True, text = True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    peak = int(result.stderr.strip().splitlines()[-1]) * 1024
+    return (elapsed, peak, result.stdout)
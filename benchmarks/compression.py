@@ -0,0 +1,44 @@
+import argparse
+import pathlib
+import time
+import common
+
+def main() -> None:
+    """
+    Measures writing and reading a `JSONL` file through `utils.open_file` with each codec and number of compression threads.
+    Throughput is in MB of uncompressed data per second, and every round trip has to give back the original bytes.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--jsonl-in', type = pathlib.Path, default = None, help = 'The corpus, a synthetic one is made when missing')
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-documents', type = int, default = 20000)
+    parser.add_argument('-threads', type = _int_list, default = [1, 4])
+    args = parser.parse_args()
+    u = common.load_tool('utils')
+    jsonl_in = args.jsonl_in or common.make_jsonl(args.temp.joinpath(f'read_{args.documents}.jsonl'), args.documents, lines = 5)
+    data = jsonl_in.read_bytes()
+    mb = len(data) / (1024 * 1024)
+    print(f'{jsonl_in}: {mb:.1f} MB')
+    suffixes = ['', '.gz', '.bz2', '.xz'] + (['.zst'] if u._zstd is not None else [])
+    for suffix in suffixes:
+        for threads in (args.threads if suffix != '' else [1]):
+            file_out = args.temp.joinpath(f'compression.jsonl{suffix}')
+            start = time.perf_counter()
+            with u.open_file(file_out, 'wb', threads = threads) as fp:
+                fp.write(data)
+            written = time.perf_counter() - start
+            start = time.perf_counter()
+            with u.open_file(file_out, 'rb') as fp:
+                read = fp.read()
+            reading = time.perf_counter() - start
+            if read != data:
+                raise ValueError(f'{file_out} did not read back the same bytes')
+            name = suffix[1:] or 'none'
+            print(f'{name:>4} threads {threads}: write {mb / written:7.1f} MB/s, read {mb / reading:7.1f} MB/s, ratio {len(data) / file_out.stat().st_size:.2f}x')
+            file_out.unlink()
+
+def _int_list(text: str) -> list:
+    return [int(item) for item in text.split(',')]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import csv
+import pathlib
+import time
+import typing as t
+import common
+
+def main() -> None:
+    """
+    Measures how many of the exact top n-grams `approx` finds, with and without `verify`, for 1 and 2 workers
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--jsonl-in', type = pathlib.Path, default = None, help = 'The corpus, a synthetic one is made when missing')
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-size', type = int, default = 3)
+    parser.add_argument('-top', type = int, default = 100)
+    parser.add_argument('-memory', type = int, default = None)
+    args = parser.parse_args()
+    jsonl_in = args.jsonl_in or common.make_jsonl(args.temp.joinpath('ngrams.jsonl'), 20000)
+    c = common.load_tool('count_ngrams')
+    exact = _run(c, jsonl_in, args.temp.joinpath('approx_exact.csv'), args.size, args.top, args.memory, 1, False, False)[0]
+    for workers in [1, 2]:
+        for verify in [False, True]:
+            found, elapsed = _run(c, jsonl_in, args.temp.joinpath('approx.csv'), args.size, args.top, args.memory, workers, True, verify)
+            print(f'workers {workers}, verify {verify!s:>5}: {len(found & exact) / len(exact):6.1%} recall, {elapsed:6.1f} s')
+
+def _run(c: t.Any, jsonl_in: pathlib.Path, csv_out: pathlib.Path, size: int, top: int, memory: int | None, workers: int, approx: bool, verify: bool) -> t.Tuple[t.Set[str], float]:
+    start = time.perf_counter()
+    c.count_ngrams(jsonl_in, csv_out, ['text'], size, top, 1000000, False, False, workers = workers, memory = memory, approx = approx, verify = verify, ties = 'truncate')
+    elapsed = time.perf_counter() - start
+    with open(csv_out, 'r', encoding = 'utf-8', newline = '') as fp:
+        return ({ row['ngram'] for row in csv.DictReader(fp) }, elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import pathlib
+import sys
+import common
+
+def main() -> None:
+    """
+    Compares the peak memory of counting n-grams as strings and as interned, packed token ids.
+    Each mode runs in its own process with the same `chunk`, so both hold the same n-grams before caching.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--jsonl-in', type = pathlib.Path, default = None, help = 'The corpus, a synthetic one is made when missing')
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-size', type = int, default = 3)
+    parser.add_argument('-chunk', type = int, default = 1000000)
+    args = parser.parse_args()
+    jsonl_in = args.jsonl_in or common.make_jsonl(args.temp.joinpath('ngrams.jsonl'), 20000)
+    results = {}
+    for mode in ['string', 'intern']:
+        csv_out = args.temp.joinpath(f'ngrams_{mode}.csv')
+        code = f'import sys; sys.path.insert(0, {str(pathlib.Path(__file__).parent)!r}); import common, pathlib; c = common.load_tool("count_ngrams"); c.count_ngrams(pathlib.Path({str(jsonl_in)!r}), pathlib.Path({str(csv_out)!r}), ["text"], {args.size}, 100, {args.chunk}, False, False, intern = {mode == "intern"})'
+        elapsed, peak, _ = common.run_child(['-c', code])
+        results[mode] = (elapsed, peak, csv_out.read_bytes())
+        print(f'{mode:>6}: {peak / (1024 * 1024):8.1f} MB peak, {elapsed:6.1f} s')
+    if results['string'][2] != results['intern'][2]:
+        sys.exit('The two modes counted different n-grams')
+    print(f'intern uses {1 - results["intern"][1] / results["string"][1]:.0%} less peak memory')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import pathlib
+import sys
+import common
+
+def main() -> None:
+    """
+    Compares sending one document at a time to the EPTS workers (`-bs 1`) with sending them in batches.
+    Each tool runs from the command line, and the outputs of both batch sizes have to hold the same documents.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-documents', type = int, default = 20000)
+    parser.add_argument('-files', type = int, default = 3000)
+    parser.add_argument('-spc', type = int, default = 2)
+    parser.add_argument('-bs', type = int, default = 100)
+    args = parser.parse_args()
+    jsonl_in = common.make_jsonl(args.temp.joinpath(f'epts_{args.documents}.jsonl'), args.documents, lines = 5)
+    txt_a = common.make_txt_folder(args.temp.joinpath(f'epts_txt_a_{args.files}'), args.files, seed = 1)
+    txt_b = common.make_txt_folder(args.temp.joinpath(f'epts_txt_b_{args.files}'), args.files, seed = 2)
+    runs = [
+        ('convert_jsonl', lambda out: ['-in', str(jsonl_in), '-out', str(out.with_suffix('.jsonl'))], lambda out: out.with_suffix('.jsonl')),
+        ('combine_txt_to_jsonl', lambda out: ['-in', str(txt_a), '-out', str(out.with_suffix('.jsonl'))], lambda out: out.with_suffix('.jsonl')),
+        ('merge_txt_folders', lambda out: ['-in', f'{txt_a},{txt_b}', '-out', str(out)], lambda out: out),
+        ('extract_txt_from_jsonl', lambda out: ['-in', str(jsonl_in), '-out', str(out), '-e', 'text'], lambda out: out)]
+    for tool, tool_args, output in runs:
+        seconds = {}
+        results = {}
+        for batch_size in [1, args.bs]:
+            out = args.temp.joinpath(f'epts_{tool}_{batch_size}')
+            common.remove(output(out))
+            seconds[batch_size] = common.run_tool(tool, [*tool_args(out), '-spc', str(args.spc), '-bs', str(batch_size)])
+            results[batch_size] = _read_output(output(out))
+        if results[1] != results[args.bs]:
+            sys.exit(f'{tool}: the two batch sizes wrote different documents')
+        print(f'{tool:>22}: -bs 1 {seconds[1]:6.2f} s, -bs {args.bs} {seconds[args.bs]:6.2f} s ({seconds[1] / seconds[args.bs]:.1f}x)')
+
+def _read_output(out: pathlib.Path) -> object:
+    """
+    The workers finish in any order, so the lines of a `JSONL` output are compared as a sorted list
+    """
+    if out.is_dir():
+        return common.list_folder_files(out)
+    return sorted(out.read_bytes().splitlines())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import pathlib
+import sys
+import tarfile
+import typing as t
+import zipfile
+import common
+
+def main() -> None:
+    """
+    Compares the output layouts of the extract tools: a flat folder, a sharded folder, a tar and a zip archive.
+    Every layout has to hold the same file names and bytes.
+    Point `-tmp` at the storage being tuned for, since the gain of the archives depends on how costly its file metadata is.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-documents', type = int, default = 20000)
+    parser.add_argument('-tools', type = lambda text: text.split(','), default = ['extract_txt_from_jsonl', 'extract_itxt_from_jsonl', 'extract_json_from_jsonl'])
+    args = parser.parse_args()
+    jsonl_in = common.make_jsonl(args.temp.joinpath(f'epts_{args.documents}.jsonl'), args.documents, lines = 5)
+    layouts = [('folder', 'out', []), ('sharded', 'out', ['-sh']), ('tar', 'out.tar', []), ('zip', 'out.zip', [])]
+    for tool in args.tools:
+        extract = [] if tool == 'extract_json_from_jsonl' else ['-e', 'text']
+        expected = None
+        timings = []
+        for layout, name, flags in layouts:
+            out = args.temp.joinpath(f'layout_{tool}', name)
+            common.remove(out.parent)
+            seconds = common.run_tool(tool, ['-in', str(jsonl_in), '-out', str(out), *extract, *flags])
+            files = _read_output(out)
+            if expected is None:
+                expected = files
+            elif files != expected:
+                sys.exit(f'{tool}: the {layout} layout holds different files')
+            timings.append(f'{layout} {seconds:.2f} s')
+        print(f'{tool:>23}: {", ".join(timings)}')
+
+def _read_output(out: pathlib.Path) -> t.Dict[str, bytes]:
+    """
+    The files of the output keyed by name, whatever the layout.
+    Error logs are left out, since they sit next to the output rather than in it.
+    """
+    if out.suffix == '.tar':
+        with tarfile.open(out) as tar_ball:
+            return { pathlib.PurePath(info.name).name : tar_ball.extractfile(info).read() for info in tar_ball if info.isfile() }
+    if out.suffix == '.zip':
+        with zipfile.ZipFile(out) as zip_file:
+            return { pathlib.PurePath(info.filename).name : zip_file.read(info) for info in zip_file.infolist() if not info.is_dir() }
+    return common.list_folder_files(out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import pathlib
+import time
+import typing as t
+import common
+import jsonlines as jl
+
+def main() -> None:
+    """
+    Compares reading a `JSONL` file with the jsonlines reader and with `utils.list_jsonl_documents`, using each installed JSON decoder.
+    Every reader has to return the same documents.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--jsonl-in', type = pathlib.Path, default = None, help = 'The corpus, a synthetic one is made when missing')
+    parser.add_argument('-tmp', '--temp', type = pathlib.Path, default = pathlib.Path('bench_tmp'))
+    parser.add_argument('-documents', type = int, default = 20000)
+    parser.add_argument('-repeat', type = int, default = 5)
+    args = parser.parse_args()
+    u = common.load_tool('utils')
+    jsonl_in = args.jsonl_in or common.make_jsonl(args.temp.joinpath(f'read_{args.documents}.jsonl'), args.documents, lines = 5)
+    print(f'{jsonl_in}: {jsonl_in.stat().st_size / (1024 * 1024):.1f} MB')
+    readers: t.Dict[str, t.Callable[[], t.List[dict]]] = { 'jsonlines' : lambda: _read_jsonlines(jsonl_in) }
+    backends = [('json', u._stdlib_loads)]
+    if u.json_backend != 'json':
+        backends.append((u.json_backend, u.json_loads))
+    for backend, loads in backends:
+        readers[backend] = lambda loads = loads: _read_utils(u, jsonl_in, loads)
+    expected = None
+    for name, read in readers.items():
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            documents = read()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if expected is None:
+            expected = documents
+        elif documents != expected:
+            raise ValueError(f'{name} read different documents')
+        print(f'{name:>9}: {best:.3f} s')
+
+def _read_jsonlines(jsonl_in: pathlib.Path) -> t.List[dict]:
+    with jl.open(jsonl_in) as reader:
+        return list(reader)
+
+def _read_utils(u: t.Any, jsonl_in: pathlib.Path, loads: t.Callable[[bytes], t.Any]) -> t.List[dict]:
+    """
+    `list_jsonl_documents` uses the module's decoder, so it is swapped for the one being measured
+    """
+    saved = u.json_loads
+    u.json_loads = loads
+    try:
+        return list(u.list_jsonl_documents(jsonl_in))
+    finally:
+        u.json_loads = saved
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import time
+import common
+import nltk.tokenize
+
+def main() -> None:
+    """
+    Compares calling `nltk.sent_tokenize` / `nltk.word_tokenize` for every line with building the Punkt tokenizer once, as the `nltk` engine does.
+    Short lines are where the per call lookup would matter most.
+    Without the Punkt data, which needs a download, both use the same untrained Punkt model.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-lines', type = int, default = 50000)
+    parser.add_argument('-repeat', type = int, default = 3)
+    args = parser.parse_args()
+    try:
+        punkt = nltk.tokenize.PunktTokenizer('english')
+    except LookupError:
+        punkt = nltk.tokenize.PunktSentenceTokenizer()
+        nltk.tokenize._get_punkt_tokenizer = lambda language = 'english': punkt
+        print('Punkt data not found, using an untrained Punkt model')
+    treebank = nltk.tokenize._treebank_word_tokenizer.tokenize
+    def per_line(line: str) -> list:
+        return [' '.join(nltk.tokenize.word_tokenize(sentence)) for sentence in nltk.tokenize.sent_tokenize(line)]
+    def built_once(line: str) -> list:
+        return [' '.join(word for part in punkt.tokenize(sentence) for word in treebank(part)) for sentence in punkt.tokenize(line)]
+    draw = common.zipf_words(5000, 0)
+    for words in [1, 3, 20]:
+        lines = [' '.join(draw(words)) + '.' for _ in range(args.lines)]
+        for name, tokenize in [('per line', per_line), ('built once', built_once)]:
+            best = min(_time(tokenize, lines) for _ in range(args.repeat))
+            print(f'{words:>2} words/line, {name:>10}: {len(lines) / best:,.0f} lines/sec')
+
+def _time(tokenize, lines: list) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        tokenize(line)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    main()
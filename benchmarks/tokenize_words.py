@@ -0,0 +1,56 @@
+import argparse
+import pathlib
+import time
+import typing as t
+import common
+import nltk.tokenize
+
+def main() -> None:
+    """
+    Compares the `regex` engine's word tokenizer with NLTK's Treebank tokenizer on real English text: the Python documentation topics that ship with Python.
+    The sentences come from the `regex` sentence splitter, since the Punkt model needs a download.
+    The `regex` engine's word caches start empty, so the first pass pays for every new word.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-in', '--txt-in', type = pathlib.Path, default = None, help = 'A UTF-8 text file of paragraphs to use instead')
+    parser.add_argument('-repeat', type = int, default = 5)
+    args = parser.parse_args()
+    tj = common.load_tool('tokenize_jsonl')
+    paragraphs = _list_paragraphs(args.txt_in)
+    sentences = [sentence for paragraph in paragraphs for sentence in tj._regex_sent_tokenize(paragraph)]
+    treebank = nltk.tokenize._treebank_word_tokenizer.tokenize
+    expected = [treebank(sentence) for sentence in sentences]
+    actual = [tj._regex_word_tokenize(sentence) for sentence in sentences]
+    same = sum(1 for e, a in zip(expected, actual) if e == a)
+    print(f'sentences: {len(sentences):,}, identical tokens: {same / len(sentences):.2%}')
+    for e, a, sentence in zip(expected, actual, sentences):
+        if e != a:
+            print(f'  {sentence!r}\n    nltk:  {e}\n    regex: {a}')
+    for cache in tj._word_caches.values():
+        cache.clear()
+    seconds = {}
+    for name, tokenize in [('nltk', treebank), ('regex', tj._regex_word_tokenize)]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for sentence in sentences:
+                tokenize(sentence)
+        seconds[name] = time.perf_counter() - start
+        print(f'{name:>5}: {len(sentences) * args.repeat / seconds[name]:,.0f} sentences/sec')
+    print(f'regex is {seconds["nltk"] / seconds["regex"]:.1f}x faster')
+
+def _list_paragraphs(txt_in: pathlib.Path | None) -> t.List[str]:
+    if txt_in is not None:
+        text = txt_in.read_text(encoding = 'utf-8')
+    else:
+        from pydoc_data.topics import topics
+        text = '\n\n'.join(topics[key] for key in sorted(topics))
+    result = []
+    for paragraph in text.split('\n\n'):
+        paragraph = ' '.join(paragraph.split())
+        letters = sum(1 for c in paragraph if c.isalpha())
+        if paragraph != '' and not paragraph.startswith(('>>>', '...')) and letters > 0.7 * len(paragraph):
+            result.append(paragraph)
+    return result
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ def main() -> None:
     parser = ArgumentParser(prog = 'buildingblocks', description = "Building blocks for text processing")
     subparsers = parser.add_subparsers(help = 'block-commands')
     extract_block(subparsers.add_parser('extract', help = "pull part of a thing into another"))
+    index_block(subparsers.add_parser('index', help = "index a thing for random access"))
     transform_block(subparsers.add_parser('transform', help = "transform one thing into another"))
     args = parser.parse_args()
     print_args(args)
@@ -16,27 +17,48 @@ def main() -> None:
 def extract_block(parser: ArgumentParser) -> None:
     def jsonl_to_csv(parser: ArgumentParser) -> None:
         def run(args: Namespace) -> None:
-            tools.extract_csv_from_jsonl(args.source, args.dest, args.fields)
+            tools.extract_csv_from_jsonl(args.source, args.dest, args.fields, args.workers, args.unordered)
         parser.add_argument('-source', type = pathlib.Path, required = True, help = 'The root folder of the folders containing JSONL files')
         parser.add_argument('-dest', type = pathlib.Path, required = True, help = 'The folder to store the converted CSV file')
         parser.add_argument('-fields',  type = utils.csv_list, default = 'id', help = 'The names of the fields to extract')
+        parser.add_argument('-workers', type = int, default = 1, help = 'The number of worker processes extracting the fields in parallel')
+        parser.add_argument('-unordered', action = 'store_true', help = 'With -workers, writes the rows in the order the workers finish rather than source order')
         parser.set_defaults(run = run)
         parser.set_defaults(cmd = 'extract jsonl_to_csv')
     subparsers = parser.add_subparsers(help = 'sub-commands')
     jsonl_to_csv(subparsers.add_parser('jsonl_to_csv', help = "Pull fields from every JSON object in a JSONL file into a CSV file"))
 
+def index_block(parser: ArgumentParser) -> None:
+    def jsonl(parser: ArgumentParser) -> None:
+        def run(args: Namespace) -> None:
+            tools.index_jsonl(args.source, args.id)
+        parser.add_argument('-source', type = pathlib.Path, required = True, help = 'The JSONL file, or folder of JSONL files, to index')
+        parser.add_argument('-id', type = str, default = None, help = 'The name of the field to also index the documents by')
+        parser.set_defaults(run = run)
+        parser.set_defaults(cmd = 'index jsonl')
+    subparsers = parser.add_subparsers(help = 'sub-commands')
+    jsonl(subparsers.add_parser('jsonl', help = "Writes a sidecar with the byte offset of every document in a JSONL file"))
+
 def transform_block(parser: ArgumentParser) -> None:
     def ngram(parser: ArgumentParser) -> None:
         def run(args: Namespace) -> None:
-            tools.count_ngrams(args.source, args.dest, args.fields, args.size, args.top, args.chunk, args.keep_case, args.keep_punct)
+            tools.count_ngrams(args.source, args.dest, args.fields, args.size, args.top, args.chunk, args.keep_case, args.keep_punct, args.workers, args.compress, args.intern, args.memory, args.approx, args.verify, args.ties, args.store)
         parser.add_argument('-source', type = pathlib.Path, required = True, help = 'The root folder of the folders containing JSONL files')
         parser.add_argument('-dest', type = pathlib.Path, required = True, help = 'The folder to store the converted CSV file')
         parser.add_argument('-fields',  type = utils.csv_list, default = 'text', help = 'The names of the fields to process')
-        parser.add_argument('-size', type = int, default = 1, help = 'The length of the n-gram')
-        parser.add_argument('-top', type = int, default = 10000, help = 'The number of n-grams to save')
+        parser.add_argument('-size', type = utils.int_list, default = '1', help = 'The length(s) of the n-grams, such as 1-5 or 1,3')
+        parser.add_argument('-top', type = int, default = 10000, help = 'The number of n-grams to save per length')
+        parser.add_argument('-ties', choices = ['keep', 'truncate'], default = 'keep', help = 'Keep every n-gram tied with the last of the top, or truncate to exactly top')
         parser.add_argument('-chunk', type = int, default = 10000000, help = 'Controls the amount of n-grams to chunk to disk to prevent OOM')
+        parser.add_argument('-memory', type = utils.byte_size, default = None, help = 'The estimated ram, such as 8G, used by the n-grams before chunking to disk')
+        parser.add_argument('-approx', action = 'store_true', help = 'Estimates the top n-grams in fixed memory without caching to disk')
+        parser.add_argument('-verify', action = 'store_true', help = 'With -approx, counts the candidate n-grams exactly in a second pass')
+        parser.add_argument('-store', type = pathlib.Path, default = None, help = 'A folder keeping the full counts so later runs only count new JSONL files')
         parser.add_argument('-keep_case', action = 'store_true', help = 'Keeps the casing of the fields as-is before converting to tokens')
         parser.add_argument('-keep_punct', action = 'store_true', help = 'Keeps all punctuation of the fields as-is before converting to tokens')
+        parser.add_argument('-workers', type = int, default = 1, help = 'The number of worker processes counting the n-grams in parallel')
+        parser.add_argument('-intern', action = 'store_true', help = 'Counts the n-grams as packed token ids to reduce the ram used per chunk')
+        parser.add_argument('-compress', choices = ['none', 'zlib', 'lzma'], default = 'none', help = 'The compression used on the chunks cached to disk')
         parser.set_defaults(run = run)
         parser.set_defaults(cmd = 'transform ngram')
     subparsers = parser.add_subparsers(help = 'sub-commands')
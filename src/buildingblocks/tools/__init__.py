@@ -1,3 +1,4 @@
 from . import utils
 from .extract_csv_from_jsonl import extract_csv_from_jsonl
 from .count_ngrams import count_ngrams
+from .index_jsonl import index_jsonl
@@ -1,67 +1,102 @@
 import json
+import multiprocessing as mp
 import pathlib
-import jsonlines as jl
 import mp_boilerplate as mpb
 import typing as t
+import common_types as ct
 import utils as u
 from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def combine_json_to_jsonl(folder_in: pathlib.Path, jsonl_out: pathlib.Path, sub_process_count: int) -> None:
+def combine_json_to_jsonl(folder_in: pathlib.Path, jsonl_out: pathlib.Path, sub_process_count: int, batch_size: int = 100, scan_threads: int = 1, recursive: bool = False, patterns: t.List[str] | None = None, shard_documents: int = 0, shard_size: int = 0) -> None:
     """
     Combines a folder of `JSON` files into a single `JSONL` file.
 
     Parameters
     ----------
     folder_in : pathlib.Path
-        Folder containing the source documents
+        Folder, or tar/zip archive, containing the source documents
     jsonl_out : pathlib.Path
         JSONL containing the aggregated corpus
     sub_process_count : int
         The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    scan_threads : int
+        The number of threads checking the files while scanning the folder
+    recursive : bool
+        Also combines the documents in the sub folders
+    patterns : List[str] | None
+        Glob patterns matched against the path of each document relative to the folder.
+        `None` combines all the documents
+    shard_documents : int
+        The number of documents in each shard of the JSONL file, or 0 for no limit
+    shard_size : int
+        The number of bytes in each shard of the JSONL file, or 0 for no limit.
+        With both limits at 0 a single JSONL file is saved
     """
 
     if jsonl_out.exists():
         jsonl_out.unlink()
+    for shard_out in u.list_jsonl_shard_paths(jsonl_out):
+        shard_out.unlink()
 
-    worker = mpb.EPTS(
-        extract = u.list_folder_documents, extract_args = (folder_in, u.is_json_document),
-        transform = _process_document,
-        save = _save_documents_to_jsonl, save_args = (jsonl_out),
-        worker_count = sub_process_count,
-        show_progress = True)
+    if u.is_archive(folder_in):
+        documents = u.list_archive_documents(folder_in, u.is_json_document, recursive, patterns)
+    else:
+        documents = u.list_folder_documents(folder_in, u.is_json_document, scan_threads, recursive, patterns)
+    if shard_documents > 0 or shard_size > 0:
+        worker = mpb.EPTS(
+            extract = u.list_batches, extract_args = (documents, batch_size),
+            transform = _process_shard_batch, transform_init = u.jsonl_shard_writer, transform_init_args = (jsonl_out, shard_documents, shard_size, mp.Value('q', 0)),
+            save = u.save_batch_results, save_args = (u.drain_iterator, (), u.error_log_path(jsonl_out)),
+            worker_count = sub_process_count)
+    else:
+        worker = mpb.EPTS(
+            extract = u.list_batches, extract_args = (documents, batch_size),
+            transform = _process_batch,
+            save = u.save_batch_results, save_args = (u.save_jsonl_batches, (jsonl_out,), u.error_log_path(jsonl_out)),
+            worker_count = sub_process_count)
     worker.start()
     worker.join()
 
 @typechecked
-def _process_document(document_path: str) -> dict:
+def _process_batch(document_paths: t.List[ct.Source]) -> u.batch_result:
     """
-    Converts the JSON file into a JSON object containing the base elements we use in our processes
+    Converts a batch of files into a block of `JSONL` text.
+    A file that fails to convert is logged and skipped.
     """
-    document_path = pathlib.Path(document_path)
-    encoding = u.guess_encoding(document_path)
-    with open(document_path, 'r', encoding = encoding) as fp:
-        obj = json.load(fp)
-    if 'id' not in obj:
-        obj['id'] = document_path.stem
-    return obj
+    errors: t.List[str] = []
+    documents = u.transform_documents(document_paths, _process_document, u.describe_source, errors)
+    return u.batch_result(u.write_jsonl_batch(documents), len(document_paths), errors)
+
+@typechecked
+def _process_shard_batch(state: u.jsonl_shard_writer, document_paths: t.List[ct.Source]) -> u.batch_result:
+    """
+    Converts a batch of files and appends them to the shard of this sub process
+    """
+    result = _process_batch(document_paths)
+    state.write(result.output)
+    result.output = None
+    return result
 
 @typechecked
-def _save_documents_to_jsonl(results: t.Iterator[dict], jsonl_out: pathlib.Path) -> None:
+def _process_document(document_path: ct.Source) -> dict:
     """
-    Writes the relevant data to disk
+    Converts the JSON file into a JSON object containing the base elements we use in our processes
     """
-    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
-        with jl.Writer(fp, compact = True, sort_keys = True) as writer:
-            for item in results:
-                writer.write(item)
+    name, data = u.read_document(document_path)
+    obj = json.loads(data.decode(u.guess_bytes_encoding(data)))
+    if 'id' not in obj:
+        obj['id'] = pathlib.PurePath(name).stem
+    return obj
 
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument(
         '-in', '--folder-in',
-        help = 'Folder containing the source documents',
+        help = 'Folder, or tar/zip archive, containing the source documents',
         type = pathlib.Path,
         required = True)
     parser.add_argument(
@@ -74,10 +109,45 @@ if __name__ == '__main__':
         help = 'The number of sub processes used to transformation from in to out formats',
         type = int,
         default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-st', '--scan-threads',
+        help = 'The number of threads checking the files while scanning the folder',
+        type = int,
+        default = 1)
+    parser.add_argument(
+        '-r', '--recursive',
+        help = 'Also combine the documents in the sub folders',
+        action = 'store_true')
+    parser.add_argument(
+        '-g', '--glob',
+        help = 'Glob patterns matched against the path of each document relative to the folder',
+        type = u.csv_list,
+        default = None)
+    parser.add_argument(
+        '-sd', '--shard-documents',
+        help = 'The number of documents in each shard of the JSONL file',
+        type = int,
+        default = 0)
+    parser.add_argument(
+        '-ss', '--shard-size',
+        help = 'The size of each shard of the JSONL file, such as 512M',
+        type = u.byte_size,
+        default = 0)
     args = parser.parse_args()
     print(' --- combine_json_to_jsonl ---')
     print(f'folder in: {args.folder_in}')
     print(f'JSONL out: {args.jsonl_out}')
     print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
+    print(f'scan threads: {args.scan_threads}')
+    print(f'recursive: {args.recursive}')
+    print(f'glob: {args.glob}')
+    print(f'shard documents: {args.shard_documents}')
+    print(f'shard size: {args.shard_size}')
     print(' ---------')
-    combine_json_to_jsonl(args.folder_in, args.jsonl_out, args.sub_process_count)
+    combine_json_to_jsonl(args.folder_in, args.jsonl_out, args.sub_process_count, args.batch_size, args.scan_threads, args.recursive, args.glob, args.shard_documents, args.shard_size)
@@ -1,3 +1,4 @@
 import typing as t
 
-Document = t.Dict[str, t.Any]
\ No newline at end of file
+Document = t.Dict[str, t.Any]
+Source = t.Union[str, t.Tuple[str, bytes]]
\ No newline at end of file
@@ -1,5 +1,4 @@
 import pathlib
-import jsonlines as jl
 import mp_boilerplate as mpb
 import typing as t
 import utils as u
@@ -7,7 +6,7 @@ from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def convert_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, keep: t.List[str], sub_process_count: int) -> None:
+def convert_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, keep: t.List[str], sub_process_count: int, batch_size: int = 100) -> None:
     """
     Converts a `JSONL` file into a _smaller_ `JSONL` file by keeping only some elements.
 
@@ -21,20 +20,39 @@ def convert_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, keep: t.List[
         The name(s) of the elements to keep
     sub_process_count : int
         The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
     """
 
     if jsonl_out.exists():
         jsonl_out.unlink()
 
     worker = mpb.EPTS(
-        extract = u.list_jsonl_documents, extract_args = (jsonl_in),
-        transform = _convert_document, transform_init = _passthrough, transform_init_args = (keep),
-        save = _save_documents, save_args = (jsonl_out),
-        worker_count = sub_process_count,
-        show_progress = True)
+        extract = u.list_jsonl_batches, extract_args = (jsonl_in, batch_size),
+        transform = _convert_batch, transform_init = _passthrough, transform_init_args = (keep),
+        save = u.save_batch_results, save_args = (u.save_jsonl_batches, (jsonl_out,), u.error_log_path(jsonl_out)),
+        worker_count = sub_process_count)
     worker.start()
     worker.join()
 
+@typechecked
+def _convert_batch(state: t.List[str], batch: bytes) -> u.batch_result:
+    """
+    Converts a batch of raw `JSONL` lines into a block of `JSONL` text.
+    A document that fails to convert is logged and skipped.
+
+    Parameters
+    ----------
+    state : List[str]
+        The elements to keep
+    batch : bytes
+        The raw lines to be converted
+    """
+    errors: t.List[str] = []
+    lines = u.split_jsonl_batch(batch)
+    documents = u.transform_documents(lines, lambda line: _convert_document(state, u.json_loads(line)), u.describe_jsonl_line, errors)
+    return u.batch_result(u.write_jsonl_batch(documents), len(lines), errors)
+
 @typechecked
 def _convert_document(state: t.List[str], document: dict) -> dict:
     """
@@ -60,23 +78,6 @@ def _passthrough(keep: t.List[str]) -> t.List[str]:
     """
     return keep
 
-@typechecked
-def _save_documents(documents: t.Iterator[dict], jsonl_out: pathlib.Path) -> None:
-    """
-    Saves the documents to JSONL
-    
-    Parameters
-    ----------
-    documents : Iterator[dict]
-        The `dict`s to save
-    jsonl_out : pathlib.Path
-        The JSONL file containing all the documents
-    """
-    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
-        with jl.Writer(fp, compact = True, sort_keys = True) as writer:
-            for document in documents:
-                writer.write(document)
-
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument(
@@ -99,11 +100,17 @@ if __name__ == '__main__':
         help = 'The number of sub processes used to transformation from in to out formats',
         type = int,
         default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
     args = parser.parse_args()
     print(' --- convert_jsonl ---')
     print(f'jsonl in: {args.jsonl_in}')
     print(f'jsonl out: {args.jsonl_out}')
     print(f'keep: {args.keep}')
     print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
     print(' ---------')
-    convert_jsonl(args.jsonl_in, args.jsonl_out, args.keep, args.sub_process_count)
+    convert_jsonl(args.jsonl_in, args.jsonl_out, args.keep, args.sub_process_count, args.batch_size)
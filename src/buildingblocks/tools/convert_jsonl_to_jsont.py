@@ -1,13 +1,17 @@
+import multiprocessing as mp
 import pathlib
+import typing as t
+import utils as u
 import utils_jsonl as ul
 import utils_jsont as ut
 from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def convert_jsonl_to_jsont(jsonl_in: pathlib.Path, jsont_out: pathlib.Path) -> None:
+def convert_jsonl_to_jsont(jsonl_in: pathlib.Path, jsont_out: pathlib.Path, sub_process_count: int = 1, batch_size: int = 100, validate: bool = False, canonical: bool = False) -> None:
     """
     Converts a `JSONL` file into a `JSONT` file.
+    By default each line is copied into its tar member as-is, without decoding the document.
 
     Parameters
     ----------
@@ -15,11 +19,47 @@ def convert_jsonl_to_jsont(jsonl_in: pathlib.Path, jsont_out: pathlib.Path) -> N
         JSONL file containing the aggregated corpus
     jsont_out : pathlib.Path
         JSONT file containing the aggregated corpus
+    sub_process_count : int
+        The number of sub processes used to validate or encode the documents
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    validate : bool
+        Checks each line is a JSON object before copying it
+    canonical : bool
+        Decodes each line and re-encodes it with sorted keys
     """
     if jsont_out.exists():
         jsont_out.unlink()
-    documents = ul.list_documents(jsonl_in)
-    ut.save_documents(jsont_out, documents)
+    encode = _encode_batch if canonical else _validate_batch
+    if not canonical and not validate:
+        payloads = u.list_jsonl_payloads(jsonl_in)
+        ut.save_payloads(jsont_out, payloads)
+    elif sub_process_count > 1:
+        with mp.Pool(sub_process_count) as pool:
+            batches = pool.imap(encode, u.list_jsonl_batches(jsonl_in, batch_size))
+            payloads = (payload for batch in batches for payload in batch)
+            ut.save_payloads(jsont_out, payloads)
+    elif canonical:
+        documents = ul.list_documents(jsonl_in)
+        ut.save_documents(jsont_out, documents)
+    else:
+        payloads = (u.validate_json_document(payload) for payload in u.list_jsonl_payloads(jsonl_in))
+        ut.save_payloads(jsont_out, payloads)
+
+@typechecked
+def _encode_batch(batch: bytes) -> t.List[bytes]:
+    """
+    Encodes a batch of raw `JSONL` lines into canonical `JSONT` payloads
+    """
+    return [ut.encode_document(document) for document in u.read_jsonl_batch(batch)]
+
+@typechecked
+def _validate_batch(batch: bytes) -> t.List[bytes]:
+    """
+    Checks a batch of raw `JSONL` lines, returning them as `JSONT` payloads as-is
+    """
+    lines = (line.strip() for line in batch.split(b'\n'))
+    return [u.validate_json_document(line) for line in lines if len(line) > 0]
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -33,9 +73,31 @@ if __name__ == '__main__':
         help = 'The JSONT file containing all the documents',
         type = pathlib.Path,
         required = True)
+    parser.add_argument(
+        '-spc', '--sub-process-count',
+        help = 'The number of sub processes used to encode the documents',
+        type = int,
+        default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-validate', '--validate',
+        help = 'Check each line is a JSON object before copying it',
+        action = 'store_true')
+    parser.add_argument(
+        '-canonical', '--canonical',
+        help = 'Re-encode each document with sorted keys instead of copying the line',
+        action = 'store_true')
     args = parser.parse_args()
     print(' --- convert_jsonl ---')
     print(f'jsonl in: {args.jsonl_in}')
     print(f'jsont out: {args.jsont_out}')
+    print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
+    print(f'validate: {args.validate}')
+    print(f'canonical: {args.canonical}')
     print(' ---------')
-    convert_jsonl_to_jsont(args.jsonl_in, args.jsont_out)
+    convert_jsonl_to_jsont(args.jsonl_in, args.jsont_out, args.sub_process_count, args.batch_size, args.validate, args.canonical)
@@ -1,13 +1,17 @@
+import multiprocessing as mp
 import pathlib
+import typing as t
+import utils as u
 import utils_jsonl as ul
 import utils_jsont as ut
 from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def convert_jsont_to_jsonl(jsont_in: pathlib.Path, jsonl_out: pathlib.Path) -> None:
+def convert_jsont_to_jsonl(jsont_in: pathlib.Path, jsonl_out: pathlib.Path, sub_process_count: int = 1, validate: bool = False, canonical: bool = False) -> None:
     """
     Converts a `JSONT` file into a `JSONL` file.
+    By default each tar member is copied onto its line as-is, without decoding the document.
 
     Parameters
     ----------
@@ -15,11 +19,62 @@ def convert_jsont_to_jsonl(jsont_in: pathlib.Path, jsonl_out: pathlib.Path) -> N
         JSONT file containing the aggregated corpus
     jsonl_out : pathlib.Path
         JSONL file containing the aggregated corpus
+    sub_process_count : int
+        The number of sub processes used to convert ranges of the documents.
+        The ranges come from the member index of the JSONT file, so compressed JSONT files are always converted in a single process
+    validate : bool
+        Checks each member is a JSON object before copying it
+    canonical : bool
+        Decodes each member and re-encodes it the way `jsonlines` writes it, with sorted keys
     """
     if jsonl_out.exists():
         jsonl_out.unlink()
-    documents = ut.list_documents(jsont_in)
-    ul.save_documents(jsonl_out, documents)
+    if sub_process_count > 1 and u.compression(jsont_in) is None:
+        ranges = [(str(jsont_in), start, end, validate, canonical) for start, end in ut.split_documents(jsont_in, sub_process_count * 4)]
+        with mp.Pool(sub_process_count) as pool:
+            blocks = pool.imap(_convert_range, ranges)
+            u.save_jsonl_lines(blocks, jsonl_out)
+    elif canonical:
+        documents = ut.list_documents(jsont_in)
+        ul.save_documents(jsonl_out, documents)
+    else:
+        lines = (_payload_line(payload, validate) for payload in ut.list_payloads(jsont_in))
+        u.save_jsonl_lines(lines, jsonl_out)
+
+@typechecked
+def _convert_range(document_range: t.Tuple[str, int, int, bool, bool]) -> bytes:
+    """
+    Converts a range of the documents in the `JSONT` file into a block of `JSONL` lines
+
+    Parameters
+    ----------
+    document_range : tuple
+        [0] The JSONT file
+        [1] The number of the first document
+        [2] The number of the document after the last one
+        [3] Checks each member is a JSON object
+        [4] Re-encodes each document
+    """
+    jsont_in = pathlib.Path(document_range[0])
+    if document_range[4]:
+        documents = ut.list_documents(jsont_in, document_range[1], document_range[2])
+        return u.write_jsonl_batch(documents).encode('utf-8')
+    payloads = ut.list_payloads(jsont_in, document_range[1], document_range[2])
+    return b''.join([_payload_line(payload, document_range[3]) for payload in payloads])
+
+def _payload_line(payload: bytes, validate: bool) -> bytes:
+    """
+    Turns a `JSONT` payload into a `JSONL` line.
+    Payloads spread over several lines are the only ones decoded, so they fit on one.
+    """
+    payload = payload.strip()
+    if validate:
+        u.validate_json_document(payload)
+    if len(payload) == 0:
+        return b''
+    if b'\n' in payload or b'\r' in payload:
+        return u.write_jsonl_batch([u.json_loads(payload)]).encode('utf-8')
+    return payload + b'\n'
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -33,9 +88,25 @@ if __name__ == '__main__':
         help = 'The JSONL file containing all the documents',
         type = pathlib.Path,
         required = True)
+    parser.add_argument(
+        '-spc', '--sub-process-count',
+        help = 'The number of sub processes used to convert the documents',
+        type = int,
+        default = 1)
+    parser.add_argument(
+        '-validate', '--validate',
+        help = 'Check each member is a JSON object before copying it',
+        action = 'store_true')
+    parser.add_argument(
+        '-canonical', '--canonical',
+        help = 'Re-encode each document with sorted keys instead of copying the member',
+        action = 'store_true')
     args = parser.parse_args()
     print(' --- convert_jsonl ---')
     print(f'jsont in: {args.jsont_in}')
     print(f'jsonl out: {args.jsonl_out}')
+    print(f'sub process count: {args.sub_process_count}')
+    print(f'validate: {args.validate}')
+    print(f'canonical: {args.canonical}')
     print(' ---------')
-    convert_jsont_to_jsonl(args.jsont_in, args.jsonl_out)
+    convert_jsont_to_jsonl(args.jsont_in, args.jsonl_out, args.sub_process_count, args.validate, args.canonical)
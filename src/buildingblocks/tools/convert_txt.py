@@ -1,6 +1,7 @@
 import pathlib
 import mp_boilerplate as mpb
 import typing as t
+import common_types as ct
 import utils as u
 from argparse import ArgumentParser
 from typeguard import typechecked
@@ -13,7 +14,7 @@ def convert_txt(folder_in: pathlib.Path, folder_out: pathlib.Path, stem: str, ma
     Parameters
     ----------
     folder_in : pathlib.Path
-        Folder containing the source documents
+        Folder, or tar/zip archive, containing the source documents
     folder_out : pathlib.Path
         The folder containing all the aggreated documents
     stem : str
@@ -27,7 +28,7 @@ def convert_txt(folder_in: pathlib.Path, folder_out: pathlib.Path, stem: str, ma
     folder_out.mkdir(parents = True, exist_ok = True)
 
     worker = mpb.EPTS(
-        extract = u.list_folder_documents, extract_args = (folder_in, u.is_txt_document),
+        extract = u.list_archive_documents if u.is_archive(folder_in) else u.list_folder_documents, extract_args = (folder_in, u.is_txt_document),
         transform = _process_document,
         save = _save_documents, save_args = (folder_out, stem, max_lines),
         worker_count = sub_process_count,
@@ -36,18 +37,13 @@ def convert_txt(folder_in: pathlib.Path, folder_out: pathlib.Path, stem: str, ma
     worker.join()
 
 @typechecked
-def _process_document(document_path: str) -> dict:
+def _process_document(document_path: ct.Source) -> dict:
     """
     Converts the flat text file into a JSON object containing the base elements we use in our processes
     """
-    document_path = pathlib.Path(document_path)
-    encoding = u.guess_encoding(document_path)
-    with open(document_path, 'r', encoding = encoding) as fp:
-        lines = fp.readlines()
-    if encoding == 'utf-8' and lines[0][0] == '\ufeff':
-        lines[0] = lines[0][1:]
-    lines = [line.strip() for line in lines]
-    json = { 'id' : document_path.stem, 'lines' : lines }
+    name, data = u.read_document(document_path)
+    lines = u.read_txt_lines(data)
+    json = { 'id' : pathlib.PurePath(name).stem, 'lines' : lines }
     return json
 
 @typechecked
@@ -96,7 +92,7 @@ if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument(
         '-in', '--folder-in',
-        help = 'Folder containing the source documents',
+        help = 'Folder, or tar/zip archive, containing the source documents',
         type = pathlib.Path,
         required = True)
     parser.add_argument(
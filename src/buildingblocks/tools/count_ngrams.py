@@ -1,29 +1,116 @@
+import array
 import csv
+import gzip
+import hashlib
+import heapq
+import json
+import lzma
+import math
 import multiprocessing as mp
+import os
 import pathlib
 import progressbar as pb
 import shutil
 import string
 import typing as t
-from sys import maxsize as MAX_SIZE
+import sys
 from uuid import uuid4
 from . import common_types as ct
 from . import utils as u
 
+class _count_settings:
+    def __init__(self, cache_dir: pathlib.Path, fields: t.List[str], sizes: t.List[int], chunk_size: int, memory: int | None, keep_case: bool, keep_punct: bool, codec: str, intern: bool):
+        self.cache_dir = cache_dir
+        self.fields = fields
+        self.sizes = sizes
+        self.chunk_size = chunk_size
+        self.memory = memory
+        self.keep_case = keep_case
+        self.keep_punct = keep_punct
+        self.codec = codec
+        self.intern = intern
+
+class _count_arg:
+    def __init__(self, source: pathlib.Path, start: int, end: int | None, settings: _count_settings):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.settings = settings
+
+class _approx_arg:
+    def __init__(self, shards: t.List[t.Tuple[pathlib.Path, int, int | None]], fields: t.List[str], sizes: t.List[int], keep_case: bool, keep_punct: bool, width: int, capacity: int, candidates: t.Dict[int, t.Set[str]] | None, show_progress: bool):
+        self.shards = shards
+        self.fields = fields
+        self.sizes = sizes
+        self.keep_case = keep_case
+        self.keep_punct = keep_punct
+        self.width = width
+        self.capacity = capacity
+        self.candidates = candidates
+        self.show_progress = show_progress
+
+class _sketch:
+    """
+    A count-min sketch for estimating any n-gram's count paired with a table of the heavy hitter candidates.
+    The candidates are the n-grams with the largest estimates.
+    Any n-gram seen more than `threshold` times is a candidate.
+    """
+    def __init__(self, width: int, depth: int, capacity: int):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.total = 0
+        self.threshold = 0
+        self.table = array.array('Q', bytes(8 * width * depth))
+        self.heavy: t.Dict[str, int] = {}
+
+class _memory_stats:
+    def __init__(self):
+        self.peak = 0
+
 class _merge_arg:
-    def __init__(self, chunk_1: pathlib.Path, chunk_2: pathlib.Path, cache_dir: pathlib.Path):
-        self.chunk_1 = chunk_1
-        self.chunk_2 = chunk_2
+    def __init__(self, chunks: t.List[pathlib.Path], cache_dir: pathlib.Path, codec: str):
+        self.chunks = chunks
         self.cache_dir = cache_dir
+        self.codec = codec
+
+class _vocabulary:
+    def __init__(self):
+        self.ids: t.Dict[str, int] = {}
+        self.tokens: t.List[str] = []
+        self.token_bytes = 0
+
+class _packed_table:
+    """
+    The counts of one size of n-gram as packed token ids.
+    New n-grams are counted in a small pending dict, which is moved into sorted runs when full.
+    A run holds its keys as fixed width big-endian bytes, which sort the same as the packed ints, and its counts as a compact array.
+    """
+    def __init__(self, size: int):
+        self.width = size * _id_bytes
+        self.key_bytes = sys.getsizeof(1 << (8 * self.width - 1))
+        self.pending: t.Dict[int, int] = {}
+        self.runs: t.List[t.Tuple[bytes, array.array]] = []
+
+    @property
+    def entries(self) -> int:
+        return len(self.pending) + sum(len(counts) for _, counts in self.runs)
 
-class _ngram:
-    def __init__(self, gram: str, count: int):
-        self.gram = gram
-        self.count = count
+_ngram = t.Tuple[str, int]
+T = t.TypeVar('T')
 
 _trans = str.maketrans(dict.fromkeys(string.punctuation, ' '))
+_min_shard_size = 16 * 1024 * 1024
+_block_size = 1024 * 1024
+_chunk_suffixes = { 'none' : '.bin', 'zlib' : '.bin.gz', 'lzma' : '.bin.xz' }
+_id_bytes = 4
+_pending_size = 1 << 16
+_sketch_depth = 4
+_sketch_width = 1 << 20
+_sketch_capacity = 1 << 16
+_candidate_bytes = 256
 
-def count_ngrams(source: pathlib.Path, dest: pathlib.Path, fields: t.List[str], size: int, top: int, chunk_size: int, keep_case: bool, keep_punct: bool) -> None:
+def count_ngrams(source: pathlib.Path, dest: pathlib.Path, fields: t.List[str], size: int | t.List[int], top: int, chunk_size: int, keep_case: bool, keep_punct: bool, workers: int = 1, codec: str = 'none', intern: bool = False, memory: int | None = None, approx: bool = False, verify: bool = False, ties: str = 'keep', store: pathlib.Path | None = None) -> None:
     """
     Calculate the n-grams for a `JSONL` file.
 
@@ -33,45 +120,214 @@ def count_ngrams(source: pathlib.Path, dest: pathlib.Path, fields: t.List[str],
         JSONL file containing the aggregated corpus
     dest : pathlib.Path
         The csv file containing the n-grams
-    size :  int
-        The size of the n-grams
+    size :  int | List[int]
+        The size(s) of the n-grams.
+        All sizes are counted in a single pass over the corpus
     top : int
-        The amount of top n-grams for saving
+        The amount of top n-grams for saving, per size
     fields : List[str]
         The field(s) used to extract n-grams
     chunk_size: int
-        The amount of n-grams to aggregate before cacheing
+        The amount of n-grams to aggregate before cacheing.
+        Applies to each worker separately
     keep_case: bool
         Keeps the casing of the fields as-is before converting to tokens
     keep_punct: bool
         Keeps all punctuation of the fields as-is before converting to tokens
+    workers: int
+        The number of worker processes counting the n-grams in parallel
+    codec: str
+        The compression used on the cached chunks: 'none', 'zlib' or 'lzma'
+    intern: bool
+        Counts the n-grams as packed token ids, cached to disk as ids.
+        The n-gram text is only built for the top n-grams, or once per distinct n-gram with several workers or a store
+    memory: int | None
+        The estimated bytes of n-grams to aggregate before cacheing, split evenly between the workers.
+        Caching happens at whichever of `chunk_size` or `memory` is reached first.
+        With `approx`, the fixed size of the sketches and their candidate tables, split evenly between the workers
+    approx: bool
+        Estimates the top n-grams in fixed memory using a count-min sketch and a heavy hitter table instead of counting every n-gram.
+        Nothing is cached to disk
+    verify: bool
+        With `approx`, makes a second pass over the corpus to count the candidate n-grams exactly
+    ties: str
+        'keep' saves every n-gram tied with the last of the `top`.
+        'truncate' saves exactly `top`, preferring the lexicographically smaller n-grams
+    store: pathlib.Path | None
+        A folder keeping the full sorted counts between runs.
+        Source files already counted into the store are skipped and the new counts are merged into it
     """
     if dest.exists():
         dest.unlink()
-    cache_dir = dest.parent.joinpath(f'tmp_{dest.name}')
-    cache_dir.mkdir(parents = True, exist_ok = True)
     if source.is_file():
         source_files = [source]
     else:
-        source_files = (pathlib.Path(path) for path in u.list_folder_documents(source, u.is_jsonl_document))
-    doc_collections = (u.list_jsonl_documents(file) for file in source_files)
-    docs = (x for y in doc_collections for x in y)
-    docs = u.progress_overlay(docs, 'Reading Document #')
-    ngram_collections = (_collect_ngrams_in_doc(doc, fields, size, keep_case, keep_punct) for doc in docs)
-    chunks = _chunk_ngram_collections(ngram_collections, chunk_size)
-    chunks = (_sort_ngram_chunk(x) for x in chunks)
-    chunks = (_write_ngram_chunk(x, cache_dir) for x in chunks)
-    chunks = list(chunks)
-    chunk = _merge_ngram_chunks(chunks, cache_dir, 1)
-    ngrams = _read_ngram_chunk(chunk)
-    ngrams = u.progress_overlay(ngrams, 'Reviewing N-Grams #')
-    ngrams = _keep_top_ngrams(ngrams, top)    
-    ngrams = sorted(ngrams, key = lambda ng: ng.count, reverse = True)
-    _write_ngrams(ngrams, dest, size)    
-    shutil.rmtree(cache_dir)
-
-def _collect_ngrams_in_doc(document: ct.Document, fields: t.List[str], size: int, keep_case: bool, keep_punct: bool) -> t.Dict[str,int]:
-    result: t.Dict[str,int] = {}
+        source_files = [pathlib.Path(path) for path in u.list_folder_documents(source, u.is_jsonl_document)]
+    sizes = [size] if isinstance(size, int) else sorted(set(size))
+    if approx:
+        if store is not None:
+            raise ValueError('A store can only be kept for exact counts')
+        results = _count_ngrams_approx(source_files, fields, sizes, top, keep_case, keep_punct, workers, memory, verify, ties)
+    else:
+        cache_dir = dest.parent.joinpath(f'tmp_{dest.name}')
+        cache_dir.mkdir(parents = True, exist_ok = True)
+        worker_memory = memory // workers if memory is not None else None
+        settings = _count_settings(cache_dir, fields, sizes, chunk_size, worker_memory, keep_case, keep_punct, codec, intern)
+        manifest = None
+        if store is not None:
+            manifest = _load_ngram_store(store, fields, sizes, keep_case, keep_punct)
+            source_files = _list_new_sources(source_files, manifest)
+        results = _count_ngrams_exact(source_files, settings, top, workers, ties, store, manifest)
+        if store is not None:
+            for file in source_files:
+                manifest['sources'][str(file.resolve())] = file.stat().st_size
+            _save_ngram_store_manifest(store, manifest)
+            _remove_stale_store_files(store, manifest)
+        shutil.rmtree(cache_dir)
+    _write_ngrams(results, dest)
+
+def _count_ngrams_exact(source_files: t.List[pathlib.Path], settings: _count_settings, top: int, workers: int, ties: str, store: pathlib.Path | None, manifest: t.Dict[str, t.Any] | None) -> t.Dict[int, t.List[_ngram]]:
+    """
+    Counts every n-gram exactly, caching sorted chunks to disk and merging them.
+    With a `store`, the merged counts are written to new files of the next generation and recorded in the `manifest`.
+    The files of the previous generation are left in place until the manifest is saved.
+    """
+    results: t.Dict[int, t.List[_ngram]] = {}
+    if workers > 1:
+        chunks, peak = _count_ngrams_parallel(source_files, settings, workers)
+    else:
+        doc_collections = (u.list_jsonl_documents(file, fields = settings.fields) for file in source_files)
+        docs = (x for y in doc_collections for x in y)
+        docs = u.progress_overlay(docs, 'Reading Document #')
+        if settings.intern and store is None:
+            # A single worker's ids agree across all of its chunks, so only the text of the top n-grams is ever built
+            vocab, packed_chunks, peak = _pack_ngrams_in_docs(docs, settings)
+            print(f'Peak n-gram table size: {peak / (1024 * 1024):,.1f} MB (estimated, per worker)')
+            for size in settings.sizes:
+                ngrams = _merge_packed_chunks([chunk for chunk_size, chunk in packed_chunks if chunk_size == size], size, settings)
+                ngrams = u.progress_overlay(ngrams, f'Reviewing {size}-Grams #')
+                results[size] = _keep_top_packed_ngrams(ngrams, size, vocab, top, ties)
+            return results
+        chunks, peak = _count_ngrams_in_docs(docs, settings)
+    print(f'Peak n-gram table size: {peak / (1024 * 1024):,.1f} MB (estimated, per worker)')
+    if manifest is not None:
+        manifest['generation'] = manifest['generation'] + 1
+    for size in settings.sizes:
+        size_chunks = [chunk for chunk_size, chunk in chunks if chunk_size == size]
+        if store is None:
+            ngrams = _merge_ngram_chunks(size_chunks, settings.cache_dir, workers, settings.codec)
+            ngrams = u.progress_overlay(ngrams, f'Reviewing {size}-Grams #')
+            results[size] = _keep_top_ngrams(ngrams, top, ties)
+        else:
+            old_file = manifest['files'].get(str(size))
+            old_file = store.joinpath(old_file) if old_file is not None else None
+            new_file = store.joinpath(f'{size}.{manifest["generation"]}{_chunk_suffixes[settings.codec]}')
+            ngrams = _merge_ngram_chunks(size_chunks, settings.cache_dir, workers, settings.codec, old_file)
+            ngrams = _write_ngram_file(ngrams, new_file)
+            ngrams = u.progress_overlay(ngrams, f'Reviewing {size}-Grams #')
+            results[size] = _keep_top_ngrams(ngrams, top, ties)
+            # The store file is written as the n-grams pass through, so any the top-k selection left unread still have to go to it
+            for _ in ngrams:
+                pass
+            manifest['files'][str(size)] = new_file.name
+    return results
+
+def _load_ngram_store(store: pathlib.Path, fields: t.List[str], sizes: t.List[int], keep_case: bool, keep_punct: bool) -> t.Dict[str, t.Any]:
+    """
+    Loads the store's manifest, checking it was built with the same settings.
+    A missing store starts out empty.
+    The manifest is the single commit point of the store: it names the sources counted and the files holding their counts.
+    Any other n-gram file in the store was left by a run that stopped before saving the manifest, so it is removed.
+    """
+    store.mkdir(parents = True, exist_ok = True)
+    settings = { 'fields' : fields, 'sizes' : sizes, 'keep_case' : keep_case, 'keep_punct' : keep_punct }
+    manifest_file = store.joinpath('manifest.json')
+    if not manifest_file.exists():
+        manifest = { **settings, 'sources' : {}, 'files' : {}, 'generation' : 0 }
+    else:
+        with open(manifest_file, 'r', encoding = 'utf-8') as fp:
+            manifest = json.load(fp)
+        for key, value in settings.items():
+            if manifest[key] != value:
+                raise ValueError(f'The store at {store} was built with {key} = {manifest[key]}, not {value}')
+        if 'files' not in manifest:
+            manifest['files'] = { str(size) : f'{size}{suffix}' for size in sizes for suffix in _chunk_suffixes.values() if store.joinpath(f'{size}{suffix}').exists() }
+            manifest['generation'] = 0
+    _remove_stale_store_files(store, manifest)
+    return manifest
+
+def _save_ngram_store_manifest(store: pathlib.Path, manifest: t.Dict[str, t.Any]) -> None:
+    manifest_file = store.joinpath('manifest.json')
+    tmp_file = store.joinpath('tmp_manifest.json')
+    with open(tmp_file, 'w', encoding = 'utf-8') as fp:
+        json.dump(manifest, fp, indent = 2, sort_keys = True)
+    os.replace(tmp_file, manifest_file)
+
+def _list_new_sources(source_files: t.List[pathlib.Path], manifest: t.Dict[str, t.Any]) -> t.List[pathlib.Path]:
+    """
+    The source files not yet counted into the store.
+    A counted file whose size has since changed can not be refreshed, so it is an error.
+    """
+    result: t.List[pathlib.Path] = []
+    for file in source_files:
+        key = str(file.resolve())
+        if key not in manifest['sources']:
+            result.append(file)
+        elif manifest['sources'][key] != file.stat().st_size:
+            raise ValueError(f'{file} has changed since it was counted into the store')
+    return result
+
+def _remove_stale_store_files(store: pathlib.Path, manifest: t.Dict[str, t.Any]) -> None:
+    """
+    Removes the n-gram files in the store that the manifest does not name
+    """
+    keep = set(manifest['files'].values())
+    for file in store.iterdir():
+        if file.name not in keep and file.name.endswith(tuple(_chunk_suffixes.values())):
+            file.unlink()
+
+def _list_shards(source_files: t.List[pathlib.Path], workers: int) -> t.List[t.Tuple[pathlib.Path, int, int | None]]:
+    total_size = sum(file.stat().st_size for file in source_files)
+    shard_size = max(_min_shard_size, total_size // (workers * 4))
+    return list(u.list_jsonl_shards(source_files, shard_size))
+
+def _count_ngrams_parallel(source_files: t.List[pathlib.Path], settings: _count_settings, workers: int) -> t.Tuple[t.List[t.Tuple[int, pathlib.Path]], int]:
+    shards = _list_shards(source_files, workers)
+    args = [_count_arg(shard[0], shard[1], shard[2], settings) for shard in shards]
+    chunks: t.List[t.Tuple[int, pathlib.Path]] = []
+    peak = 0
+    with mp.Pool(workers) as pool:
+        results = pool.imap_unordered(_count_ngram_shard, args)
+        results = u.progress_overlay(results, 'Counting Shard #')
+        for shard_chunks, shard_peak in results:
+            chunks.extend(shard_chunks)
+            peak = max(peak, shard_peak)
+    return (chunks, peak)
+
+def _count_ngram_shard(args: _count_arg) -> t.Tuple[t.List[t.Tuple[int, pathlib.Path]], int]:
+    docs = u.list_jsonl_documents(args.source, args.start, args.end, args.settings.fields)
+    return _count_ngrams_in_docs(docs, args.settings)
+
+def _count_ngrams_in_docs(docs: t.Iterator[ct.Document], settings: _count_settings) -> t.Tuple[t.List[t.Tuple[int, pathlib.Path]], int]:
+    """
+    Counts the n-grams in the documents, caching them to disk as one sorted chunk per size
+    """
+    if settings.intern:
+        return _count_packed_ngrams_in_docs(docs, settings)
+    stats = _memory_stats()
+    ngram_collections = (_collect_ngrams_in_doc(doc, settings.fields, settings.sizes, settings.keep_case, settings.keep_punct) for doc in docs)
+    chunks: t.List[t.Tuple[int, pathlib.Path]] = []
+    for tables in _chunk_ngram_collections(ngram_collections, settings.chunk_size, settings.memory, stats):
+        for size, table in tables.items():
+            if len(table) > 0:
+                ngrams = iter(sorted(table.items()))
+                chunks.append((size, _write_ngram_chunk(ngrams, settings.cache_dir, settings.codec)))
+    return (chunks, stats.peak)
+
+def _list_tokens_in_doc(document: ct.Document, fields: t.List[str], keep_case: bool, keep_punct: bool) -> t.Iterator[t.List[str]]:
+    """
+    Lists the tokens of each line in the fields of the document
+    """
     for field in fields:
         if field in document:
             for line in document[field]:
@@ -79,149 +335,638 @@ def _collect_ngrams_in_doc(document: ct.Document, fields: t.List[str], size: int
                     line = line.upper()
                 if not keep_punct:
                     line = line.translate(_trans)
-                tokens = line.split()
-                for i in range(len(tokens) - size + 1):
-                    ngram = ' '.join(tokens[i:(i+size)])
-                    if ngram not in result:
-                        result[ngram] = 0
-                    result[ngram] = result[ngram] + 1
+                yield line.split()
+
+def _collect_ngrams_in_doc(document: ct.Document, fields: t.List[str], sizes: t.List[int], keep_case: bool, keep_punct: bool) -> t.Dict[int, t.Dict[str, int]]:
+    result: t.Dict[int, t.Dict[str, int]] = { size : {} for size in sizes }
+    for tokens in _list_tokens_in_doc(document, fields, keep_case, keep_punct):
+        for size in sizes:
+            counts = result[size]
+            for i in range(len(tokens) - size + 1):
+                ngram = ' '.join(tokens[i:(i+size)])
+                if ngram not in counts:
+                    counts[ngram] = 0
+                counts[ngram] = counts[ngram] + 1
     return result
 
-def _chunk_ngram_collections(ngram_collections: t.Iterator[t.Dict[str,int]], chunk_size: int) -> t.Iterator[t.Dict[str,int]]:
-    tmp: t.Dict[str,int] = {}
-    for ngrams in ngram_collections:
-        for ngram, count in ngrams.items():
-            if ngram not in tmp:
-                tmp[ngram] = 0
-            tmp[ngram] = tmp[ngram] + count
-        if len(tmp) > chunk_size:
+def _count_packed_ngrams_in_docs(docs: t.Iterator[ct.Document], settings: _count_settings) -> t.Tuple[t.List[t.Tuple[int, pathlib.Path]], int]:
+    """
+    Counts the n-grams as packed token ids, then turns them into text chunks the same as `_count_ngrams_in_docs`.
+    The text of each distinct n-gram is built once, after the packed chunks are merged.
+    """
+    vocab, packed_chunks, peak = _pack_ngrams_in_docs(docs, settings)
+    chunks: t.List[t.Tuple[int, pathlib.Path]] = []
+    for size in settings.sizes:
+        ngrams = _merge_packed_chunks([chunk for chunk_size, chunk in packed_chunks if chunk_size == size], size, settings)
+        chunks.extend((size, chunk) for chunk in _unpack_ngram_chunks(ngrams, size, vocab, settings))
+    return (chunks, peak)
+
+def _pack_ngrams_in_docs(docs: t.Iterator[ct.Document], settings: _count_settings) -> t.Tuple[_vocabulary, t.List[t.Tuple[int, pathlib.Path]], int]:
+    """
+    Counts the n-grams as token ids packed into an int, `_id_bytes` per token, caching them to disk as sorted packed chunks.
+    The vocabulary is kept for the whole run, so the ids of every chunk agree and no text is built until the end.
+    The vocabulary itself is not cached, so `memory` is compared with what the tables hold on top of it, though never less than half of `memory`.
+    """
+    stats = _memory_stats()
+    vocab = _vocabulary()
+    tables = { size : _packed_table(size) for size in settings.sizes }
+    chunks: t.List[t.Tuple[int, pathlib.Path]] = []
+    for doc in docs:
+        for tokens in _list_tokens_in_doc(doc, settings.fields, settings.keep_case, settings.keep_punct):
+            _collect_packed_ngrams(tokens, vocab, tables)
+        vocab_bytes = _estimate_vocabulary_size(vocab)
+        table_bytes = _estimate_packed_size(tables)
+        if vocab_bytes + table_bytes > stats.peak:
+            stats.peak = vocab_bytes + table_bytes
+        if sum(table.entries for table in tables.values()) > settings.chunk_size or (settings.memory is not None and table_bytes > max(settings.memory - vocab_bytes, settings.memory // 2)):
+            chunks.extend(_cache_packed_tables(tables, settings))
+    chunks.extend(_cache_packed_tables(tables, settings))
+    return (vocab, chunks, stats.peak)
+
+def _collect_packed_ngrams(tokens: t.List[str], vocab: _vocabulary, tables: t.Dict[int, _packed_table]) -> None:
+    """
+    Counts the n-grams of the line as the token ids packed into a single int.
+    The packed value is rolled forward one token at a time rather than rebuilt for each position.
+    Smaller sizes are the low bits of the largest size's packed value.
+    """
+    ids = vocab.ids
+    bits = 8 * _id_bytes
+    mask = (1 << (bits * max(tables.keys()))) - 1
+    targets = [(size - 1, (1 << (bits * size)) - 1, table) for size, table in tables.items()]
+    packed = 0
+    for i in range(len(tokens)):
+        token = tokens[i]
+        token_id = ids.get(token)
+        if token_id is None:
+            token_id = len(vocab.tokens)
+            if token_id >> bits != 0:
+                raise ValueError(f'intern can only count {1 << bits} distinct tokens')
+            ids[token] = token_id
+            vocab.tokens.append(token)
+            vocab.token_bytes = vocab.token_bytes + sys.getsizeof(token)
+        packed = ((packed << bits) | token_id) & mask
+        for offset, size_mask, table in targets:
+            if i >= offset:
+                key = packed & size_mask
+                pending = table.pending
+                pending[key] = pending.get(key, 0) + 1
+    for _, _, table in targets:
+        if len(table.pending) >= _pending_size:
+            _flush_packed_table(table)
+
+def _flush_packed_table(table: _packed_table) -> None:
+    """
+    Moves the pending n-grams into a new sorted run.
+    The last two runs are merged while the older one is no more than twice the size of the newer, so there are only ever a few runs.
+    """
+    if len(table.pending) == 0:
+        return
+    keys = sorted(table.pending.keys())
+    counts = array.array('Q', (table.pending[key] for key in keys))
+    width = table.width
+    table.pending = {}
+    table.runs.append((b''.join(key.to_bytes(width, 'big') for key in keys), counts))
+    while len(table.runs) > 1 and len(table.runs[-2][1]) <= 2 * len(table.runs[-1][1]):
+        newer = table.runs.pop()
+        older = table.runs.pop()
+        table.runs.append(_merge_packed_runs([older, newer], width))
+
+def _merge_packed_runs(runs: t.List[t.Tuple[bytes, array.array]], width: int) -> t.Tuple[bytes, array.array]:
+    keys = bytearray()
+    counts = array.array('Q')
+    for key, count in _list_packed_ngrams(runs, width):
+        keys += key.to_bytes(width, 'big')
+        counts.append(count)
+    return (bytes(keys), counts)
+
+def _list_packed_ngrams(runs: t.List[t.Tuple[bytes, array.array]], width: int) -> t.Iterator[t.Tuple[int, int]]:
+    """
+    Lists the n-grams of the sorted runs in packed order, summing the duplicates
+    """
+    return _aggregate_ngrams_chunk(heapq.merge(*(_list_packed_run(keys, counts, width) for keys, counts in runs)))
+
+def _list_packed_run(keys: bytes, counts: array.array, width: int) -> t.Iterator[t.Tuple[int, int]]:
+    from_bytes = int.from_bytes
+    for i in range(len(counts)):
+        yield (from_bytes(keys[(i * width):((i + 1) * width)], 'big'), counts[i])
+
+def _estimate_vocabulary_size(vocab: _vocabulary) -> int:
+    return sys.getsizeof(vocab.ids) + sys.getsizeof(vocab.tokens) + vocab.token_bytes
+
+def _estimate_packed_size(tables: t.Dict[int, _packed_table]) -> int:
+    """
+    The runs' keys and counts plus the pending dicts with their keys
+    """
+    result = 0
+    for table in tables.values():
+        result = result + sys.getsizeof(table.pending) + len(table.pending) * table.key_bytes
+        result = result + sum(len(keys) + counts.itemsize * len(counts) for keys, counts in table.runs)
+    return result
+
+def _cache_packed_tables(tables: t.Dict[int, _packed_table], settings: _count_settings) -> t.List[t.Tuple[int, pathlib.Path]]:
+    """
+    Caches each table to disk as one sorted packed chunk, emptying the tables
+    """
+    chunks: t.List[t.Tuple[int, pathlib.Path]] = []
+    for size, table in tables.items():
+        _flush_packed_table(table)
+        runs = table.runs
+        table.runs = []
+        if len(runs) > 0:
+            chunks.append((size, _write_packed_chunk(_list_packed_ngrams(runs, table.width), table.width, settings.cache_dir, settings.codec)))
+    return chunks
+
+def _write_packed_chunk(ngrams: t.Iterator[t.Tuple[int, int]], width: int, cache_dir: pathlib.Path, codec: str) -> pathlib.Path:
+    """
+    Writes the packed n-grams as fixed length records: `width` bytes of big-endian key, varint count
+    """
+    file_name = cache_dir.joinpath(f'tmp_{uuid4()}{_chunk_suffixes[codec]}')
+    buffer = bytearray()
+    with _open_ngram_chunk(file_name, 'wb') as fp:
+        for key, count in ngrams:
+            buffer += key.to_bytes(width, 'big')
+            _write_varint(buffer, count)
+            if len(buffer) >= _block_size:
+                fp.write(buffer)
+                buffer.clear()
+        fp.write(buffer)
+    return file_name
+
+def _read_packed_chunk(chunk: pathlib.Path, width: int) -> t.Iterator[t.Tuple[int, int]]:
+    """
+    Reads the records written by `_write_packed_chunk` a block at a time, deleting the chunk once read.
+    Records split across a block boundary are carried over into the next block.
+    """
+    from_bytes = int.from_bytes
+    with _open_ngram_chunk(chunk, 'rb') as fp:
+        data = b''
+        block = fp.read(_block_size)
+        while len(block) > 0:
+            data = data + block
+            data_len = len(data)
+            pos = 0
+            while pos + width < data_len:
+                start = pos
+                key = from_bytes(data[pos:(pos+width)], 'big')
+                pos = pos + width
+                count = data[pos]
+                pos = pos + 1
+                if count >= 0x80:
+                    count, pos = _read_varint(data, pos - 1)
+                    if pos < 0:
+                        pos = start
+                        break
+                yield (key, count)
+            data = data[pos:]
+            block = fp.read(_block_size)
+        if len(data) > 0:
+            raise ValueError(f'{chunk} ends in a partial record')
+    chunk.unlink()
+
+def _merge_packed_chunks(chunks: t.List[pathlib.Path], size: int, settings: _count_settings) -> t.Iterator[t.Tuple[int, int]]:
+    """
+    Merges the sorted packed chunks of one size into a single stream in packed order, summing the duplicates.
+    When there are more chunks than files we can safely hold open, batches of chunks are merged back to disk first.
+    """
+    width = size * _id_bytes
+    fan_in = _max_fan_in()
+    while len(chunks) > fan_in:
+        chunks = [_write_packed_chunk(_aggregate_ngrams_chunk(heapq.merge(*(_read_packed_chunk(chunk, width) for chunk in chunks[i:(i+fan_in)]))), width, settings.cache_dir, settings.codec) for i in range(0, len(chunks), fan_in)]
+    return _aggregate_ngrams_chunk(heapq.merge(*(_read_packed_chunk(chunk, width) for chunk in chunks)))
+
+def _unpack_ngram_chunks(ngrams: t.Iterator[t.Tuple[int, int]], size: int, vocab: _vocabulary, settings: _count_settings) -> t.Iterator[pathlib.Path]:
+    """
+    Writes the packed n-grams out as sorted text chunks.
+    Each chunk takes up to `chunk_size` n-grams, or `memory` of their text, the same bounds as counting the text directly.
+    """
+    items: t.List[_ngram] = []
+    key_bytes = 0
+    for packed, count in ngrams:
+        gram = _unpack_ngram(packed, size, vocab)
+        items.append((gram, count))
+        key_bytes = key_bytes + sys.getsizeof(gram)
+        if len(items) >= settings.chunk_size or (settings.memory is not None and key_bytes > settings.memory):
+            items.sort()
+            yield _write_ngram_chunk(iter(items), settings.cache_dir, settings.codec)
+            items = []
+            key_bytes = 0
+    if len(items) > 0:
+        items.sort()
+        yield _write_ngram_chunk(iter(items), settings.cache_dir, settings.codec)
+
+def _keep_top_packed_ngrams(ngrams: t.Iterator[t.Tuple[int, int]], size: int, vocab: _vocabulary, top: int, ties: str) -> t.List[_ngram]:
+    """
+    Selects the `top` most frequent packed n-grams, only building the text of the ones kept.
+    Packed order is not gram order, so every n-gram tied with the smallest kept count is kept first.
+    Their text then decides the ties, the same as `_keep_top_ngrams` on text.
+    """
+    candidates = _keep_top_ngrams(ngrams, top, 'keep')
+    ngrams = sorted((_unpack_ngram(packed, size, vocab), count) for packed, count in candidates)
+    return _keep_top_ngrams(iter(ngrams), top, ties)
+
+def _unpack_ngram(packed: int, size: int, vocab: _vocabulary) -> str:
+    tokens = vocab.tokens
+    bits = 8 * _id_bytes
+    mask = (1 << bits) - 1
+    words = [tokens[(packed >> (bits * (size - 1 - i))) & mask] for i in range(size)]
+    return ' '.join(words)
+
+def _chunk_ngram_collections(ngram_collections: t.Iterator[t.Dict[int, t.Dict[str, int]]], chunk_size: int, memory: int | None, stats: _memory_stats) -> t.Iterator[t.Dict[int, t.Dict[str, int]]]:
+    """
+    Aggregates the n-grams of every size until there are more than `chunk_size` of them or their estimated size is over `memory`.
+    The estimate is the dicts' own tables plus each key's object size.
+    """
+    tmp: t.Dict[int, t.Dict[str, int]] = {}
+    key_bytes = 0
+    for collection in ngram_collections:
+        for size, ngrams in collection.items():
+            if size not in tmp:
+                tmp[size] = {}
+            table = tmp[size]
+            for ngram, count in ngrams.items():
+                if ngram not in table:
+                    table[ngram] = 0
+                    key_bytes = key_bytes + sys.getsizeof(ngram)
+                table[ngram] = table[ngram] + count
+        estimate = _estimate_table_size(tmp, key_bytes)
+        if estimate > stats.peak:
+            stats.peak = estimate
+        if sum(len(table) for table in tmp.values()) > chunk_size or (memory is not None and estimate > memory):
             yield tmp
-            tmp: t.Dict[str,int] = {}
+            tmp: t.Dict[int, t.Dict[str, int]] = {}
+            key_bytes = 0
     if len(tmp) > 0:
         yield tmp
 
-def _sort_ngram_chunk(ngrams: t.Dict[str,int]) -> t.Iterator[_ngram]:
-    for ngram, count in sorted(ngrams.items(), key = lambda a: a[0]):
-        yield _ngram(ngram, count)
+def _estimate_table_size(tables: t.Dict[int, t.Dict[str, int]], key_bytes: int) -> int:
+    return key_bytes + sum(sys.getsizeof(table) for table in tables.values())
 
-def _write_ngram_chunk(ngrams: t.Iterator[_ngram], cache_dir: pathlib.Path) -> pathlib.Path:
-    file_name = cache_dir.joinpath(f'tmp_{uuid4()}.csv')
-    with open(file_name, 'w', encoding = 'utf-8', newline = '') as fp:
-        writer = csv.writer(fp, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_ALL)
-        for curr in ngrams:
-            writer.writerow([curr.gram, curr.count])
+def _open_ngram_chunk(chunk: pathlib.Path, mode: str) -> t.BinaryIO:
+    """
+    Opens the chunk using the compression implied by its suffix
+    """
+    if chunk.suffix == '.gz':
+        return gzip.open(chunk, mode, compresslevel = 1)
+    elif chunk.suffix == '.xz':
+        return lzma.open(chunk, mode, preset = 1 if 'w' in mode else None)
+    else:
+        return open(chunk, mode)
+
+def _write_ngram_chunk(ngrams: t.Iterator[_ngram], cache_dir: pathlib.Path, codec: str) -> pathlib.Path:
+    """
+    Writes the n-grams as length prefixed records: varint byte length, UTF-8 bytes, varint count
+    """
+    file_name = cache_dir.joinpath(f'tmp_{uuid4()}{_chunk_suffixes[codec]}')
+    for _ in _write_ngram_file(ngrams, file_name):
+        pass
     return file_name
 
-def _merge_ngram_chunks(chunks: t.List[pathlib.Path], cache_dir: pathlib.Path, sub_process_count: int) -> pathlib.Path:
-    widgets = ['N-Gram Chunks Left ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
-    with pb.ProgressBar(widgets = widgets, initial_value = len(chunks)) as bar:
-        with mp.Pool() as pool:
-            bar.update(len(chunks), force = True)            
-            while len(chunks) > 1:
-                pairs = (pair for pair in _pair_ngram_chunks(chunks))
-                args = (_merge_arg(p[0], p[1], cache_dir) for p in pairs)
-                args = list(args)
-                chunks = [chunk for chunk in pool.imap_unordered(_merge_ngram_chunk_pair, args)]
-                bar.update(len(chunks))
-    return chunks[0]
-
-def _pair_ngram_chunks(chunks: t.List[pathlib.Path]) -> t.Iterator[t.List[pathlib.Path]]:
-    t1: pathlib.Path | None = None
-    for chunk in chunks:
-        if t1 is None:
-            t1 = chunk
-        else:
-            yield [t1, chunk]
-            t1 = None
-    if t1 is not None:
-         yield [t1, None]
-
-def _merge_ngram_chunk_pair(args: _merge_arg) -> pathlib.Path:
-    if args.chunk_2 is None:
-        return args.chunk_1
-    chunks = [args.chunk_1, args.chunk_2]
-    ngrams = _read_ngram_chunks(chunks)
+def _write_ngram_file(ngrams: t.Iterator[_ngram], file_name: pathlib.Path) -> t.Iterator[_ngram]:
+    """
+    Writes the n-grams to the file as they pass through
+    """
+    buffer = bytearray()
+    with _open_ngram_chunk(file_name, 'wb') as fp:
+        for ngram in ngrams:
+            data = ngram[0].encode('utf-8')
+            _write_varint(buffer, len(data))
+            buffer += data
+            _write_varint(buffer, ngram[1])
+            if len(buffer) >= _block_size:
+                fp.write(buffer)
+                buffer.clear()
+            yield ngram
+        fp.write(buffer)
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value = value >> 7
+    buffer.append(value)
+
+def _merge_ngram_chunks(chunks: t.List[pathlib.Path], cache_dir: pathlib.Path, sub_process_count: int, codec: str, store_file: pathlib.Path | None = None) -> t.Iterator[_ngram]:
+    """
+    Merges the sorted chunks into a single sorted stream of n-grams, summing the duplicates.
+    When there are more chunks than files we can safely hold open, batches of chunks are merged back to disk first.
+    The `store_file` is merged in last and, unlike the chunks, is not deleted once read.
+    """
+    fan_in = _max_fan_in() - (1 if store_file is not None else 0)
+    if len(chunks) > fan_in:
+        widgets = ['N-Gram Chunks Left ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
+        with pb.ProgressBar(widgets = widgets, initial_value = len(chunks)) as bar:
+            with mp.Pool(sub_process_count) as pool:
+                bar.update(len(chunks), force = True)
+                while len(chunks) > fan_in:
+                    args = [_merge_arg(chunks[i:(i+fan_in)], cache_dir, codec) for i in range(0, len(chunks), fan_in)]
+                    chunks = [chunk for chunk in pool.imap_unordered(_merge_ngram_chunk_batch, args)]
+                    bar.update(len(chunks))
+    readers = [_read_ngram_chunk(chunk) for chunk in chunks]
+    if store_file is not None:
+        readers.append(_read_ngram_chunk(store_file, False))
+    ngrams = heapq.merge(*readers)
     ngrams = _aggregate_ngrams_chunk(ngrams)
-    file_name = _write_ngram_chunk(ngrams, args.cache_dir)
+    return ngrams
+
+def _max_fan_in() -> int:
+    """
+    The most chunks to hold open at once, leaving head room under the OS file handle limit
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY:
+            soft = 8192
+    except ImportError:
+        soft = 512
+    return max(2, min(4096, soft // 2))
+
+def _merge_ngram_chunk_batch(args: _merge_arg) -> pathlib.Path:
+    if len(args.chunks) == 1:
+        return args.chunks[0]
+    ngrams = _read_ngram_chunks(args.chunks)
+    ngrams = _aggregate_ngrams_chunk(ngrams)
+    file_name = _write_ngram_chunk(ngrams, args.cache_dir, args.codec)
     return file_name
 
 def _read_ngram_chunks(chunks: t.List[pathlib.Path]) -> t.Iterator[_ngram]:
     readers = [_read_ngram_chunk(chunk) for chunk in chunks]
-    current = [next(reader) for reader in readers]
-    cnt = len(current)
-    while cnt > 0:
-        i = _min_index(current)
-        yield current[i]
-        current[i] = next(readers[i], None)
-        if current[i] is None:
-            cnt = cnt - 1
-
-def _min_index(ngrams: t.List[_ngram]) -> int:
-    len_ngs = len(ngrams)
-    for i in range(len_ngs):
-        if ngrams[i] is not None:
-            min_ng = ngrams[i].gram
-            min_i = i
-            break
-    for i in range(min_i + 1, len_ngs):
-        curr = ngrams[i]
-        if curr is not None and curr.gram < min_ng:
-            min_ng = curr.gram
-            min_i = i
-    return min_i
-
-def _read_ngram_chunk(chunk: pathlib.Path) -> t.Iterator[_ngram]:
-    with open(chunk, 'r', encoding = 'utf-8') as fp:
-        reader = csv.reader(fp, delimiter = ',', quotechar = '"')
-        for item in reader:
-            yield _ngram(item[0], int(item[1]))
-    chunk.unlink()
+    return heapq.merge(*readers)
+
+def _read_ngram_chunk(chunk: pathlib.Path, delete: bool = True) -> t.Iterator[_ngram]:
+    """
+    Reads the records written by `_write_ngram_chunk` a block at a time.
+    Records split across a block boundary are carried over into the next block.
+    """
+    with _open_ngram_chunk(chunk, 'rb') as fp:
+        data = b''
+        block = fp.read(_block_size)
+        while len(block) > 0:
+            data = data + block
+            data_len = len(data)
+            pos = 0
+            while pos < data_len:
+                start = pos
+                length = data[pos]
+                pos = pos + 1
+                if length >= 0x80:
+                    length, pos = _read_varint(data, start)
+                    if pos < 0:
+                        pos = start
+                        break
+                if pos + length >= data_len:
+                    pos = start
+                    break
+                gram = data[pos:(pos+length)].decode('utf-8')
+                pos = pos + length
+                count = data[pos]
+                pos = pos + 1
+                if count >= 0x80:
+                    count, pos = _read_varint(data, pos - 1)
+                    if pos < 0:
+                        pos = start
+                        break
+                yield (gram, count)
+            data = data[pos:]
+            block = fp.read(_block_size)
+        if len(data) > 0:
+            raise ValueError(f'{chunk} ends in a partial record')
+    if delete:
+        chunk.unlink()
+
+def _read_varint(data: bytes, pos: int) -> t.Tuple[int, int]:
+    """
+    Decodes the varint starting at `pos`.
+    Returns the value and the position after it, or a position of -1 when the data ends first.
+    """
+    result = 0
+    shift = 0
+    data_len = len(data)
+    while pos < data_len:
+        b = data[pos]
+        pos = pos + 1
+        result = result | ((b & 0x7F) << shift)
+        if b < 0x80:
+            return (result, pos)
+        shift = shift + 7
+    return (0, -1)
 
 def _aggregate_ngrams_chunk(ngrams: t.Iterator[_ngram]) -> t.Iterator[_ngram]:
-    prev = None
-    for ngram in ngrams:
-        if prev is None:
-            prev = ngram
-        elif prev.gram == ngram.gram:
-            prev.count = prev.count + ngram.count
+    prev_gram = None
+    prev_count = 0
+    for gram, count in ngrams:
+        if gram == prev_gram:
+            prev_count = prev_count + count
         else:
-            yield prev
-            prev = ngram
-    if prev is not None:
-        yield prev
-
-def _keep_top_ngrams(ngrams: t.Iterator[_ngram], top: int) -> t.Iterator[_ngram]:
-    def _add(results: t.Dict[int, t.List[_ngram]], ngram: _ngram):
-        if ngram.count not in results:
-            results[ngram.count] = []
-        results[ngram.count].append(ngram)
+            if prev_gram is not None:
+                yield (prev_gram, prev_count)
+            prev_gram = gram
+            prev_count = count
+    if prev_gram is not None:
+        yield (prev_gram, prev_count)
+
+def _count_ngrams_approx(source_files: t.List[pathlib.Path], fields: t.List[str], sizes: t.List[int], top: int, keep_case: bool, keep_punct: bool, workers: int, memory: int | None, verify: bool, ties: str) -> t.Dict[int, t.List[_ngram]]:
+    """
+    Estimates the top n-grams of each size in fixed memory.
+    Half of each sketch's share of `memory` goes to the count-min table and half to the candidates.
+    The count-min sketch overcounts any n-gram by at most e / width * total, with probability 1 - e ^ -depth.
+    The candidates of every worker are pooled and ranked on the merged sketch before any are dropped.
+    """
+    if memory is None:
+        width = _sketch_width
+        capacity = _sketch_capacity
+    else:
+        budget = memory // (workers * len(sizes) * 2)
+        width = max(1024, budget // (8 * _sketch_depth))
+        capacity = budget // _candidate_bytes
+    capacity = max(capacity, top)
+    if workers > 1:
+        shard_lists = [[shard] for shard in _list_shards(source_files, workers)]
+    else:
+        shard_lists = [[(file, 0, None) for file in source_files]]
+    args = [_approx_arg(shards, fields, sizes, keep_case, keep_punct, width, capacity, None, workers == 1) for shards in shard_lists]
+    sketches: t.Dict[int, _sketch] = {}
+    for shard_sketches in _map_shards(_sketch_shard, args, workers):
+        for size, sketch in shard_sketches.items():
+            if size in sketches:
+                _merge_sketches(sketches[size], sketch)
+            else:
+                sketches[size] = sketch
+    for sketch in sketches.values():
+        _rank_candidates(sketch)
+    exact: t.Dict[int, t.Dict[str, int]] = {}
+    if verify:
+        candidates = { size : set(sketch.heavy.keys()) for size, sketch in sketches.items() }
+        for arg in args:
+            arg.candidates = candidates
+        for shard_counts in _map_shards(_verify_shard, args, workers):
+            for size, counts in shard_counts.items():
+                totals = exact.setdefault(size, {})
+                for gram, count in counts.items():
+                    totals[gram] = totals.get(gram, 0) + count
     results: t.Dict[int, t.List[_ngram]] = {}
-    cnt = 0
-    mn = MAX_SIZE
-    for ngram in ngrams:
-        if cnt < top:
-            _add(results, ngram)
-            cnt = cnt + 1
-            if ngram.count < mn:
-                mn = ngram.count
-        elif ngram.count == mn:
-            _add(results, ngram)
-            cnt = cnt + 1
-        elif ngram.count > mn:
-            _add(results, ngram)
-            cnt = cnt + 1
-            t1 = len(results[mn])
-            if cnt - t1 >= top:
-                del results[mn]
-                cnt = cnt - t1
-                mn = min(results.keys())
-    for best_ngrams in results.values():
-        for ngram in best_ngrams:
-            yield ngram
+    for size in sizes:
+        sketch = sketches[size]
+        over = int(math.e * sketch.total / sketch.width)
+        if verify:
+            ngrams = exact.get(size, {}).items()
+            print(f'{size}-grams: {sketch.total:,} seen. Candidate counts are exact. Any n-gram seen more than {sketch.threshold:,} times is a candidate')
+        else:
+            ngrams = sketch.heavy.items()
+            confidence = 1 - math.e ** -sketch.depth
+            print(f'{size}-grams: {sketch.total:,} seen. Counts are over by at most {over:,} ({confidence:.1%} confidence). Any n-gram seen more than {sketch.threshold:,} times is a candidate')
+        results[size] = _keep_top_ngrams(iter(sorted(ngrams)), top, ties)
+    return results
+
+def _map_shards(fn: t.Callable[[_approx_arg], T], args: t.List[_approx_arg], workers: int) -> t.Iterator[T]:
+    if workers > 1:
+        with mp.Pool(workers) as pool:
+            results = pool.imap_unordered(fn, args)
+            for result in u.progress_overlay(results, 'Counting Shard #'):
+                yield result
+    else:
+        for arg in args:
+            yield fn(arg)
+
+def _list_approx_docs(args: _approx_arg) -> t.Iterator[ct.Document]:
+    doc_collections = (u.list_jsonl_documents(shard[0], shard[1], shard[2], args.fields) for shard in args.shards)
+    docs = (x for y in doc_collections for x in y)
+    if args.show_progress:
+        docs = u.progress_overlay(docs, 'Reading Document #')
+    return docs
 
-def _write_ngrams(ngrams: t.List[_ngram], csv_out: pathlib.Path, size: int) -> None:
+def _sketch_shard(args: _approx_arg) -> t.Dict[int, _sketch]:
+    sketches = { size : _sketch(args.width, _sketch_depth, args.capacity) for size in args.sizes }
+    for doc in _list_approx_docs(args):
+        collection = _collect_ngrams_in_doc(doc, args.fields, args.sizes, args.keep_case, args.keep_punct)
+        for size, ngrams in collection.items():
+            sketch = sketches[size]
+            for gram, count in ngrams.items():
+                _sketch_add(sketch, gram, count)
+    return sketches
+
+def _verify_shard(args: _approx_arg) -> t.Dict[int, t.Dict[str, int]]:
+    result: t.Dict[int, t.Dict[str, int]] = { size : {} for size in args.sizes }
+    for doc in _list_approx_docs(args):
+        collection = _collect_ngrams_in_doc(doc, args.fields, args.sizes, args.keep_case, args.keep_punct)
+        for size, ngrams in collection.items():
+            candidates = args.candidates[size]
+            counts = result[size]
+            for gram, count in ngrams.items():
+                if gram in candidates:
+                    counts[gram] = counts.get(gram, 0) + count
+    return result
+
+def _sketch_rows(sketch: _sketch, gram: str) -> t.List[int]:
+    """
+    The table index of the n-gram in each row of the count-min sketch.
+    blake2b is used over `hash()` so the sketches built in separate processes agree.
+    """
+    digest = hashlib.blake2b(gram.encode('utf-8'), digest_size = 4 * sketch.depth).digest()
+    hashes = memoryview(digest).cast('I')
+    return [row * sketch.width + hashes[row] % sketch.width for row in range(sketch.depth)]
+
+def _sketch_add(sketch: _sketch, gram: str, count: int) -> None:
+    """
+    Adds the n-gram to the count-min table, then to the candidates when its estimate is over the threshold.
+    Once there are twice `capacity` candidates they are cut back to `capacity`.
+    """
+    sketch.total = sketch.total + count
+    table = sketch.table
+    estimate = -1
+    for i in _sketch_rows(sketch, gram):
+        value = table[i] + count
+        table[i] = value
+        if estimate < 0 or value < estimate:
+            estimate = value
+    heavy = sketch.heavy
+    if gram in heavy or estimate > sketch.threshold:
+        heavy[gram] = estimate
+        if len(heavy) >= 2 * sketch.capacity:
+            _prune_candidates(sketch)
+
+def _prune_candidates(sketch: _sketch) -> None:
+    """
+    Keeps the `capacity` candidates with the largest estimates.
+    The threshold is raised to the largest estimate dropped.
+    Estimates never undercount, so any n-gram seen more than the final threshold is a candidate at the end.
+    """
+    ranked = sorted(sketch.heavy.items(), key = lambda item: item[1], reverse = True)
+    if len(ranked) > sketch.capacity:
+        sketch.threshold = max(sketch.threshold, ranked[sketch.capacity][1])
+        ranked = ranked[:sketch.capacity]
+    sketch.heavy = dict(ranked)
+
+def _sketch_estimate(sketch: _sketch, gram: str) -> int:
+    table = sketch.table
+    return min(table[i] for i in _sketch_rows(sketch, gram))
+
+def _merge_sketches(into: _sketch, other: _sketch) -> None:
+    """
+    Adds `other` into `into`, pooling the candidates of both.
+    An n-gram seen more than the sum of the thresholds was seen more than the threshold of at least one sketch, so it is in the pool.
+    The pooled candidates are only ranked, and cut back to capacity, by `_rank_candidates` once every sketch is merged.
+    """
+    into.total = into.total + other.total
+    into.threshold = into.threshold + other.threshold
+    for i in range(len(into.table)):
+        into.table[i] = into.table[i] + other.table[i]
+    heavy = into.heavy
+    for gram in other.heavy.keys():
+        heavy[gram] = 0
+
+def _rank_candidates(sketch: _sketch) -> None:
+    """
+    Estimates every candidate on the final table, then keeps the `capacity` largest
+    """
+    sketch.heavy = { gram : _sketch_estimate(sketch, gram) for gram in sketch.heavy.keys() }
+    _prune_candidates(sketch)
+
+def _keep_top_ngrams(ngrams: t.Iterator[_ngram], top: int, ties: str) -> t.List[_ngram]:
+    """
+    Selects the `top` most frequent n-grams using a bounded min-heap.
+    The n-grams must arrive in gram order so the arrival order breaks ties lexicographically.
+
+    Parameters
+    ----------
+    ngrams : Iterator[(str, int)]
+        The n-grams, in gram order
+    top : int
+        The amount of n-grams to keep
+    ties : str
+        'keep' also keeps every n-gram tied with the smallest kept count.
+        'truncate' keeps exactly `top`, preferring the lexicographically smaller n-grams
+
+    Returns
+    -------
+    The kept n-grams ordered by count descending, then gram
+    """
+    if top <= 0:
+        return []
+    heap:t.List[t.Tuple[int, int, str]] = []
+    tied: t.List[t.Tuple[int, int, str]] = []
+    keep_ties = ties == 'keep'
+    seq = 0
+    for gram, count in ngrams:
+        seq = seq - 1
+        if len(heap) < top:
+            heapq.heappush(heap, (count, seq, gram))
+        elif count > heap[0][0]:
+            dropped = heapq.heapreplace(heap, (count, seq, gram))
+            if keep_ties:
+                if dropped[0] == heap[0][0]:
+                    tied.append(dropped)
+                elif len(tied) > 0:
+                    tied = []
+        elif keep_ties and count == heap[0][0]:
+            tied.append((count, seq, gram))
+    result = [(item[2], item[0]) for item in heap + tied]
+    result.sort(key = lambda ng: (-ng[1], ng[0]))
+    return result
+
+def _write_ngrams(results: t.Dict[int, t.List[_ngram]], csv_out: pathlib.Path) -> None:
     with open(csv_out, 'w', encoding = 'utf-8', newline = '') as fp:
         writer = csv.writer(fp, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_ALL)
         writer.writerow(['n', 'count', 'ngram'])
-        for ngram in ngrams:
-            writer.writerow([size, ngram.count, ngram.gram])
+        for size, ngrams in results.items():
+            for ngram in ngrams:
+                writer.writerow([size, ngram[1], ngram[0]])
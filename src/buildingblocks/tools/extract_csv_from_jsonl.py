@@ -1,10 +1,21 @@
 import csv
+import io
+import multiprocessing as mp
 import pathlib
 import typing as t
 from . import common_types as ct
 from . import utils as u
 
-def extract_csv_from_jsonl(source: pathlib.Path, dest: pathlib.Path, fields: t.List[str]) -> None:
+class _extract_arg:
+    def __init__(self, source: pathlib.Path, start: int, end: int | None, fields: t.List[str]):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.fields = fields
+
+_shard_size = 8 * 1024 * 1024
+
+def extract_csv_from_jsonl(source: pathlib.Path, dest: pathlib.Path, fields: t.List[str], workers: int = 1, unordered: bool = False) -> None:
     """
     Extracts a `CSV` file from a `JSONL` file. 
 
@@ -16,6 +27,10 @@ def extract_csv_from_jsonl(source: pathlib.Path, dest: pathlib.Path, fields: t.L
         The CSV file containing all the documents
     fields : List[str]
         The name(s) of the fields to extract
+    workers : int
+        The number of worker processes extracting the fields in parallel
+    unordered : bool
+        With more than 1 worker, writes the rows as soon as any worker is done with them instead of in source order
     """
 
     if dest.exists():
@@ -24,15 +39,44 @@ def extract_csv_from_jsonl(source: pathlib.Path, dest: pathlib.Path, fields: t.L
     if source.is_file():
         source_files = [source]
     else:
-        source_files = (pathlib.Path(path) for path in u.list_folder_documents(source, u.is_jsonl_document))
-        
-    doc_collections = (u.list_jsonl_documents(file) for file in source_files)
+        source_files = [pathlib.Path(path) for path in u.list_folder_documents(source, u.is_jsonl_document)]
+
+    if workers > 1:
+        _extract_csv_parallel(source_files, dest, fields, workers, unordered)
+        return
+
+    doc_collections = (u.list_jsonl_documents(file, fields = fields) for file in source_files)
     docs = (x for y in doc_collections for x in y)
     docs = (_extract_document(doc, fields) for doc in docs)
     docs = _save_documents(dest, fields, docs)
     docs = u.progress_overlay(docs, 'Processing Document #')
     for _ in docs: pass
 
+def _extract_csv_parallel(source_files: t.List[pathlib.Path], dest: pathlib.Path, fields: t.List[str], workers: int, unordered: bool) -> None:
+    """
+    Extracts the rows of byte ranges of the source files in worker processes.
+    Each worker formats its range as a block of CSV text, and the blocks are concatenated here.
+    In source order, the output is byte for byte the same as the serial output.
+    """
+    shards = u.list_jsonl_shards(source_files, _shard_size)
+    args = (_extract_arg(shard[0], shard[1], shard[2], fields) for shard in shards)
+    with mp.Pool(workers) as pool:
+        blocks = pool.imap_unordered(_extract_shard, args) if unordered else pool.imap(_extract_shard, args)
+        blocks = u.progress_overlay(blocks, 'Processing Shard #')
+        with open(dest, 'w', encoding = 'utf-8', newline = '') as fp:
+            writer = csv.writer(fp, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_ALL)
+            writer.writerow(fields)
+            for block in blocks:
+                fp.write(block)
+
+def _extract_shard(args: _extract_arg) -> str:
+    docs = u.list_jsonl_documents(args.source, args.start, args.end, args.fields)
+    docs = (_extract_document(doc, args.fields) for doc in docs)
+    with io.StringIO(newline = '') as fp:
+        writer = csv.writer(fp, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_ALL)
+        writer.writerows(_document_row(document, args.fields) for document in docs)
+        return fp.getvalue()
+
 def _extract_document(document: ct.Document, fields: t.List[str]) -> ct.Document:
     """
     Extracts parts of the document 
@@ -77,9 +121,22 @@ def _save_documents(dest: pathlib.Path, fields: t.List[str], documents: t.Iterat
         writer = csv.writer(fp, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_ALL)    
         writer.writerow(fields)
         for document in documents:
-            row = [None] * len(fields)
-            for i in range(0, len(fields)):
-                if fields[i] in document:
-                    row[i] = document[fields[i]]
-            writer.writerow(row)
+            writer.writerow(_document_row(document, fields))
             yield document
+
+def _document_row(document: ct.Document, fields: t.List[str]) -> t.List[t.Any]:
+    """
+    Lays out the document as a CSV row
+
+    Parameters
+    ----------
+    document : dict
+        The document to be saved
+    fields : List[str]
+        The name(s) of the fields, in column order
+    """
+    row = [None] * len(fields)
+    for i in range(0, len(fields)):
+        if fields[i] in document:
+            row[i] = document[fields[i]]
+    return row
@@ -1,12 +1,13 @@
 import pathlib
 import json
-import progressbar as pb
+import mp_boilerplate as mpb
+import typing as t
 import utils as u
 from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def extract_json_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id_element: str) -> None:
+def extract_json_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id_element: str, sub_process_count: int = 1, batch_size: int = 100, sharded: bool = False, raw: bool = False) -> None:
     """
     Extracts a folder of `JSON` files from a a `JSONL` file.
 
@@ -15,24 +16,85 @@ def extract_json_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id
     jsonl_in : pathlib.Path
         The JSONL containing all the documents
     folder_out : pathlib.Path
-        The folder containing all the documents after being extracted
+        The folder containing all the documents after being extracted.
+        A name such as 'corpus.tar', 'corpus.tar.gz' or 'corpus.zip' saves them to an archive instead
     id_element : str
         The name of the element to use as a file name
+    sub_process_count : int
+        The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    sharded : bool
+        Spreads the documents over hash-prefix sub folders of the output folder
+    raw : bool
+        Saves each line as-is, only decoding the id, rather than re-encoding the document with sorted keys
     """
 
-    folder_out.mkdir(parents = True, exist_ok = True)
-    
-    bar_i = 0
-    widgets = [ 'Saving JSONL # ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
-    with pb.ProgressBar(widgets = widgets) as bar:
-        documents = u.list_jsonl_documents(jsonl_in)
-        for document in documents:
-            if id_element in document:
-                file_name = folder_out.joinpath(f'./{document[id_element]}.json')
-                with open(file_name, 'w', encoding = 'utf-8') as fp:
-                    json.dump(document, fp, sort_keys = True, indent = None)
-                bar_i = bar_i + 1
-                bar.update(bar_i)
+    layout = u.output_layout(folder_out, sharded)
+    u.make_output(folder_out, layout)
+
+    worker = mpb.EPTS(
+        extract = u.list_jsonl_batches, extract_args = (jsonl_in, batch_size),
+        transform = _save_json_batch, transform_init = _passthrough, transform_init_args = (str(folder_out), id_element, layout, raw),
+        save = u.save_batch_results, save_args = (u.save_archive_documents if layout == 'archive' else u.drain_iterator, (folder_out,) if layout == 'archive' else (), u.error_log_path(folder_out)),
+        worker_count = sub_process_count)
+    worker.start()
+    worker.join()
+
+@typechecked
+def _save_json_batch(state: t.Tuple[str, str, str, bool], batch: bytes) -> u.batch_result:
+    """
+    Saves the `JSON` documents in a batch of raw `JSONL` lines.
+    For an archive, the documents are returned to be added to it instead.
+    A document that fails to render or save is logged and skipped.
+
+    Parameters
+    ----------
+    state : tuple
+        [0] The output folder
+        [1] The element to use as a file name
+        [2] The output layout
+        [3] Saves the lines as-is
+    batch : bytes
+        The raw lines to be saved
+    """
+    errors: t.List[str] = []
+    lines = u.split_jsonl_batch(batch)
+    if state[3]:
+        documents = u.transform_documents(lines, lambda line: _render_raw_document(state[1], line), u.describe_jsonl_line, errors)
+    else:
+        documents = u.transform_documents(lines, lambda line: _render_json_document(state[1], u.json_loads(line)), u.describe_jsonl_line, errors)
+    output = u.save_named_documents(state[0], [document for document in documents if document is not None], state[2], errors)
+    return u.batch_result(output, len(lines), errors)
+
+def _render_json_document(id_element: str, document: dict) -> t.Optional[t.Tuple[str, str]]:
+    """
+    Renders the document with sorted keys, returning its file name and text
+    """
+    if id_element in document:
+        return (f'{document[id_element]}.json', json.dumps(document, sort_keys = True, indent = None))
+    return None
+
+def _render_raw_document(id_element: str, line: bytes) -> t.Optional[t.Tuple[str, str]]:
+    """
+    Renders the raw line as-is, returning its file name and text.
+    Only the id is decoded, using the projecting decoder unless a faster full decoder is installed.
+    """
+    if u.json_backend == 'json':
+        document = u.project_json(line, {id_element})
+    else:
+        document = u.json_loads(line)
+    if id_element in document:
+        return (f'{document[id_element]}.json', line.decode('utf-8'))
+    return None
+
+@typechecked
+def _passthrough(folder_out: str, id_element: str, layout: str, raw: bool) -> t.Tuple[str, str, str, bool]:
+    """
+    Pass the state from the main thread to the single document processing function
+    """
+    result = (folder_out, id_element, layout, raw)
+    return result
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -43,7 +105,7 @@ if __name__ == '__main__':
         required = True)
     parser.add_argument(
         '-out', '--folder-out',
-        help = 'The folder containing all the documents after being extracted',
+        help = 'The folder, or tar/zip archive, containing all the documents after being extracted',
         type = pathlib.Path,
         required = True)
     parser.add_argument(
@@ -51,10 +113,32 @@ if __name__ == '__main__':
         help = 'The name of the element to use as a file name',
         type = str,
         default = 'id')
+    parser.add_argument(
+        '-spc', '--sub-process-count',
+        help = 'The number of sub processes used to transformation from in to out formats',
+        type = int,
+        default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-sh', '--sharded',
+        help = 'Spread the documents over hash-prefix sub folders of the output folder',
+        action = 'store_true')
+    parser.add_argument(
+        '-raw', '--raw',
+        help = 'Save each line as-is, only decoding the id',
+        action = 'store_true')
     args = parser.parse_args()
     print(' --- extract_json_from_jsonl ---')
     print(f'jsonl in: {args.jsonl_in}')
     print(f'folder out: {args.folder_out}')
     print(f'id element: {args.id_element}')
+    print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
+    print(f'sharded: {args.sharded}')
+    print(f'raw: {args.raw}')
     print(' ---------')
-    extract_json_from_jsonl(args.jsonl_in, args.folder_out, args.id_element)
+    extract_json_from_jsonl(args.jsonl_in, args.folder_out, args.id_element, args.sub_process_count, args.batch_size, args.sharded, args.raw)
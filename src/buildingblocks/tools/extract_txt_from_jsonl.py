@@ -7,7 +7,7 @@ from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def extract_txt_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id_element: str, extract: t.List[str], sub_process_count: int) -> None:
+def extract_txt_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id_element: str, extract: t.List[str], sub_process_count: int, batch_size: int = 100, sharded: bool = False) -> None:
     """
     Extracts a folder of `TXT` files from a `JSONL` file.
 
@@ -16,30 +16,55 @@ def extract_txt_from_jsonl(jsonl_in: pathlib.Path, folder_out: pathlib.Path, id_
     jsonl_in : pathlib.Path
         The JSONL containing all the documents
     folder_out : pathlib.Path
-        The folder containing all the documents after being extracted
+        The folder containing all the documents after being extracted.
+        A name such as 'corpus.tar', 'corpus.tar.gz' or 'corpus.zip' saves them to an archive instead
     id_element : str
         The name of the element to use as a file name
     extract : List[str]
         The name(s) of the elements to extract
     sub_process_count : int
         The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    sharded : bool
+        Spreads the documents over hash-prefix sub folders of the output folder
     """
 
-    folder_out.mkdir(parents = True, exist_ok = True)
+    layout = u.output_layout(folder_out, sharded)
+    u.make_output(folder_out, layout)
 
     worker = mpb.EPTS(
-        extract = u.list_jsonl_documents, extract_args = (jsonl_in),
-        transform = _save_txt_document, transform_init = _passthrough, transform_init_args = (str(folder_out), id_element, extract),
-        save = u.drain_iterator,
-        worker_count = sub_process_count,
-        show_progress = True)
+        extract = u.list_jsonl_batches, extract_args = (jsonl_in, batch_size),
+        transform = _save_txt_batch, transform_init = _passthrough, transform_init_args = (str(folder_out), id_element, extract, layout),
+        save = u.save_batch_results, save_args = (u.save_archive_documents if layout == 'archive' else u.drain_iterator, (folder_out,) if layout == 'archive' else (), u.error_log_path(folder_out)),
+        worker_count = sub_process_count)
     worker.start()
     worker.join()
 
 @typechecked
-def _save_txt_document(state:t.Tuple[str, str, t.List[str]], document: dict) -> int:
+def _save_txt_batch(state: t.Tuple[str, str, t.List[str], str], batch: bytes) -> u.batch_result:
     """
-    Saves the `TXT` document
+    Saves the `TXT` documents in a batch of raw `JSONL` lines.
+    For an archive, the documents are returned to be added to it instead.
+    A document that fails to render or save is logged and skipped.
+
+    Parameters
+    ----------
+    state : tuple
+        See `_render_txt_document`
+    batch : bytes
+        The raw lines to be saved
+    """
+    errors: t.List[str] = []
+    lines = u.split_jsonl_batch(batch)
+    documents = u.transform_documents(lines, lambda line: _render_txt_document(state, u.json_loads(line)), u.describe_jsonl_line, errors)
+    output = u.save_named_documents(state[0], [document for document in documents if document is not None], state[3], errors)
+    return u.batch_result(output, len(lines), errors)
+
+@typechecked
+def _render_txt_document(state: t.Tuple[str, str, t.List[str], str], document: dict) -> t.Optional[t.Tuple[str, str]]:
+    """
+    Renders the `TXT` document, returning its file name and text
 
     Parameters
     ----------
@@ -47,19 +72,19 @@ def _save_txt_document(state:t.Tuple[str, str, t.List[str]], document: dict) ->
         [0] The output folder
         [1] The element to use as a file name
         [2] The elements to extract
+        [3] The output layout
     document : dict
         The document to be saved
     """
     if state[1] in document:
-        file_name = pathlib.Path(state[0]).joinpath(f'./{document[state[1]]}.txt')
-        with open(file_name, 'w', encoding = 'utf-8') as fp:
-            for elm in state[2]:
-                if elm in document:
-                    lines = _value_to_lines(document[elm])
-                else:
-                    lines = _value_to_lines(None)
-                fp.writelines(lines)
-    return 0
+        lines: t.List[str] = []
+        for elm in state[2]:
+            if elm in document:
+                lines.extend(_value_to_lines(document[elm]))
+            else:
+                lines.extend(_value_to_lines(None))
+        return (f'{document[state[1]]}.txt', ''.join(lines))
+    return None
 
 @typechecked
 def _value_to_lines(value: t.Any) -> t.List[str]:
@@ -79,11 +104,11 @@ def _value_to_lines(value: t.Any) -> t.List[str]:
         return [f'{value}\n']
 
 @typechecked
-def _passthrough(folder_out: str, id_element: str, extract: t.List[str]) -> t.Tuple[str, str, t.List[str]]:
+def _passthrough(folder_out: str, id_element: str, extract: t.List[str], layout: str) -> t.Tuple[str, str, t.List[str], str]:
     """
     Pass the state from the main thread to the single document processing function
     """
-    result = (folder_out, id_element, extract)
+    result = (folder_out, id_element, extract, layout)
     return result
 
 if __name__ == '__main__':
@@ -95,7 +120,7 @@ if __name__ == '__main__':
         required = True)
     parser.add_argument(
         '-out', '--folder-out',
-        help = 'The folder containing all the documents after being extracted',
+        help = 'The folder, or tar/zip archive, containing all the documents after being extracted',
         type = pathlib.Path,
         required = True)
     parser.add_argument(
@@ -113,6 +138,15 @@ if __name__ == '__main__':
         help = 'The number of sub processes used to transformation from in to out formats',
         type = int,
         default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-sh', '--sharded',
+        help = 'Spread the documents over hash-prefix sub folders of the output folder',
+        action = 'store_true')
     args = parser.parse_args()
     print(' --- extract_txt_from_jsonl ---')
     print(f'jsonl in: {args.jsonl_in}')
@@ -120,5 +154,7 @@ if __name__ == '__main__':
     print(f'id element: {args.id_element}')
     print(f'extract: {args.extract}')
     print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
+    print(f'sharded: {args.sharded}')
     print(' ---------')
-    extract_txt_from_jsonl(args.jsonl_in, args.folder_out, args.id_element, args.extract, args.sub_process_count)
+    extract_txt_from_jsonl(args.jsonl_in, args.folder_out, args.id_element, args.extract, args.sub_process_count, args.batch_size, args.sharded)
@@ -0,0 +1,60 @@
+import pathlib
+import typing as t
+from . import utils as u
+
+def index_jsonl(source: pathlib.Path, id_field: str | None = None) -> None:
+    """
+    Writes an index sidecar next to each `JSONL` file.
+    The sidecar holds the byte offset of every document so later reads can seek straight to a document, or split the file, without a scan.
+
+    Parameters
+    ----------
+    source : pathlib.Path
+        The JSONL file, or folder of JSONL files, to index
+    id_field : str | None
+        The name of the field to also index the documents by.
+        `None` only indexes the offsets
+    """
+
+    if source.is_file():
+        source_files = [source]
+    else:
+        source_files = [pathlib.Path(path) for path in u.list_folder_documents(source, u.is_jsonl_document)]
+
+    for source_file in source_files:
+        if u.compression(source_file) is not None or u.guess_encoding(source_file) != 'utf-8':
+            print(f'skipped {source_file}: only uncompressed utf-8 files can be indexed')
+            continue
+        offsets: t.List[int] = []
+        ids: t.List[str | None] | None = None if id_field is None else []
+        lines = u.list_jsonl_line_offsets(source_file)
+        lines = u.progress_overlay(lines, f'Indexing {source_file.name} Line #')
+        for offset, line in lines:
+            line = line.strip()
+            if len(line) > 0:
+                offsets.append(offset)
+                if ids is not None:
+                    ids.append(_read_id(line, id_field))
+        offsets.append(source_file.stat().st_size)
+        u.save_jsonl_index(source_file, offsets, ids)
+        print(f'{source_file}: {len(offsets) - 1} documents')
+
+def _read_id(line: bytes, id_field: str) -> str | None:
+    """
+    Reads the id of the document, as a string
+
+    Parameters
+    ----------
+    line : bytes
+        The raw JSON of the document
+    id_field : str
+        The name of the field containing the id
+    """
+    if u.json_backend == 'json':
+        document = u.project_json(line, {id_field})
+    else:
+        document = u.json_loads(line)
+    if id_field not in document:
+        return None
+    value = document[id_field]
+    return value if type(value) == str else str(value)
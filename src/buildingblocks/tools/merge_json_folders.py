@@ -7,7 +7,7 @@ from argparse import ArgumentParser
 from typeguard import typechecked
 
 @typechecked
-def merge_json_folders(folders_in: t.List[pathlib.Path], folder_out: pathlib.Path, sub_process_count: int) -> None:
+def merge_json_folders(folders_in: t.List[pathlib.Path], folder_out: pathlib.Path, sub_process_count: int, batch_size: int = 100, scan_threads: int = 1) -> None:
     """
     Merges _several_ folders of `JSON` files into a _single_ folder of `JSON` files based on their file name.
 
@@ -19,19 +19,39 @@ def merge_json_folders(folders_in: t.List[pathlib.Path], folder_out: pathlib.Pat
         Folder containing the merged documents
     sub_process_count : int
         The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    scan_threads : int
+        The number of threads checking the files while scanning the folders
     """
 
     folder_out.mkdir(parents = True, exist_ok = True)
 
     worker = mpb.EPTS(
-        extract = u.list_merged_folder_documents, extract_args = (folders_in, u.is_json_document),
-        transform = _merge_documents, transform_init = _passthrough, transform_init_args = (str(folder_out)),
-        save = u.drain_iterator,
-        worker_count = sub_process_count,
-        show_progress = True)
+        extract = u.list_batches, extract_args = (u.list_merged_folder_documents(folders_in, u.is_json_document, scan_threads), batch_size),
+        transform = _merge_batch, transform_init = _passthrough, transform_init_args = (str(folder_out)),
+        save = u.save_batch_results, save_args = (u.drain_iterator, (), u.error_log_path(folder_out)),
+        worker_count = sub_process_count)
     worker.start()
     worker.join()
 
+@typechecked
+def _merge_batch(state: str, batch: t.List[t.List[str]]) -> u.batch_result:
+    """
+    Merges each set of documents in the batch.
+    A set that fails to merge is logged and skipped so the rest of the batch is still merged.
+
+    Parameters
+    ----------
+    state : str
+        The output folder
+    batch : list[list[str]]
+        The sets of documents to be merged
+    """
+    errors: t.List[str] = []
+    u.transform_documents(batch, lambda document_paths: _merge_documents(state, document_paths), lambda document_paths: pathlib.Path(document_paths[0]).name, errors)
+    return u.batch_result(None, len(batch), errors)
+
 @typechecked
 def _merge_documents(state: str, document_paths: t.List[str]) -> int:
     """
@@ -82,10 +102,22 @@ if __name__ == '__main__':
         help = 'The number of sub processes used to transformation from in to out formats',
         type = int,
         default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-st', '--scan-threads',
+        help = 'The number of threads checking the files while scanning the folders',
+        type = int,
+        default = 1)
     args = parser.parse_args()
     print('--- merge_json_folders ---')
     print(f'folders in: {args.folders_in}')
     print(f'folder out: {args.folder_out}')
     print(f'sub process count: {args.sub_process_count}')
+    print(f'batch size: {args.batch_size}')
+    print(f'scan threads: {args.scan_threads}')
     print('---------')
-    merge_json_folders([pathlib.Path(folder) for folder in args.folders_in], args.folder_out, args.sub_process_count)
+    merge_json_folders([pathlib.Path(folder) for folder in args.folders_in], args.folder_out, args.sub_process_count, args.batch_size, args.scan_threads)
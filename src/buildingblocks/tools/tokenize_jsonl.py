@@ -1,14 +1,19 @@
+import multiprocessing as mp
 import pathlib
-import jsonlines as jl
+import re
+import sys
+import time
 import mp_boilerplate as mpb
 import typing as t
 import utils as u
 from argparse import ArgumentParser
-from nltk.tokenize import word_tokenize, sent_tokenize
+from collections import Counter, OrderedDict
+import nltk.data
+import nltk.tokenize
 from typeguard import typechecked
 
 @typechecked
-def tokenize_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, id_element: str, tokens: t.List[t.Tuple[str,str]], sub_process_count: int) -> None:
+def tokenize_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, id_element: str, tokens: t.List[t.Tuple[str,str]], sub_process_count: int, batch_size: int = 100, engine: str = 'nltk', cache_size: int = 0) -> None:
     """
     Tokenizes all the files into the standard form: one sentence per line, paragraphs have a blank line between them.
 
@@ -24,47 +29,215 @@ def tokenize_jsonl(jsonl_in: pathlib.Path, jsonl_out: pathlib.Path, id_element:
         Run the algorithm over these elements
     sub_process_count : int
         The number of sub processes used to transformation from in to out formats
+    batch_size : int
+        The number of documents sent to a sub process at a time
+    engine : str
+        'nltk' for Punkt + Penn Treebank.
+        'regex' for a compiled regex approximation of Punkt + the Penn Treebank words, remembering the words it has already seen
+    cache_size : int
+        The estimated bytes each sub process can use to remember the tokens of lines it has already seen.
+        0 turns the cache off
     """
 
     if jsonl_out.exists():
         jsonl_out.unlink()
 
+    counters = mp.Array('q', 2) if cache_size > 0 else None
+
     worker = mpb.EPTS(
-        extract = _collect_documents, extract_args = (jsonl_in),
-        transform = _tokenize_document, transform_init = _passthrough, transform_init_args = (id_element, tokens),
-        save = _save_documents_to_jsonl, save_args = (jsonl_out),
-        worker_count = sub_process_count,
-        show_progress = True)
+        extract = u.list_jsonl_batches, extract_args = (jsonl_in, batch_size),
+        transform = _tokenize_batch, transform_init = _tokenizer_init, transform_init_args = (id_element, tokens, engine, cache_size, counters),
+        save = u.save_batch_results, save_args = (u.save_jsonl_batches, (jsonl_out,), u.error_log_path(jsonl_out)),
+        worker_count = sub_process_count)
     worker.start()
     worker.join()
 
+    if counters is not None:
+        hits, misses = counters[0], counters[1]
+        print(f'cache hits: {hits} ({_ratio(hits, hits + misses)}), misses: {misses}')
+
 @typechecked
-def _collect_documents(jsonl_in: pathlib.Path) -> t.Iterator[dict]:
-    with open(jsonl_in, 'r', encoding = 'utf-8') as fp:
-        with jl.Reader(fp) as reader:
-            for item in reader:
-                yield item
+def tokenize_agreement(jsonl_in: pathlib.Path, tokens: t.List[t.Tuple[str,str]], sample_size: int) -> None:
+    """
+    Reports how closely the 'regex' engine agrees with the 'nltk' engine, and how much faster it is, on a sample of the documents.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the files
+    tokens : List[(str,str)]
+        Run the algorithm over these elements
+    sample_size : int
+        The number of documents, from the start of the file, to compare
+    """
+    lines: t.List[str] = []
+    documents = 0
+    for document in u.list_jsonl_documents(jsonl_in):
+        if documents >= sample_size:
+            break
+        documents = documents + 1
+        for token in tokens:
+            lines.extend(line.strip() for line in document[token[0]] if line.strip() != '')
+
+    results: t.Dict[str, t.List[t.List[str]]] = {}
+    seconds: t.Dict[str, float] = {}
+    for engine in ['nltk', 'regex']:
+        tokenizers = _tokenizers(engine)
+        start = time.perf_counter()
+        results[engine] = [[' '.join(tokenizers.words(sentence)) for sentence in tokenizers.sentences(line)] for line in lines]
+        seconds[engine] = max(time.perf_counter() - start, 1e-9)
+
+    same_lines = 0
+    sentences = Counter()
+    words = Counter()
+    for expected, actual in zip(results['nltk'], results['regex']):
+        if expected == actual:
+            same_lines = same_lines + 1
+        sentences['nltk'] += len(expected)
+        sentences['regex'] += len(actual)
+        sentences['both'] += sum((Counter(expected) & Counter(actual)).values())
+        expected_words = Counter(word for sentence in expected for word in sentence.split(' '))
+        actual_words = Counter(word for sentence in actual for word in sentence.split(' '))
+        words['nltk'] += sum(expected_words.values())
+        words['regex'] += sum(actual_words.values())
+        words['both'] += sum((expected_words & actual_words).values())
+
+    print(f'documents: {documents}')
+    print(f'lines: {len(lines)}')
+    print(f'identical lines: {_ratio(same_lines, len(lines))}')
+    print(f'sentences: precision {_ratio(sentences["both"], sentences["regex"])}, recall {_ratio(sentences["both"], sentences["nltk"])}')
+    print(f'tokens: precision {_ratio(words["both"], words["regex"])}, recall {_ratio(words["both"], words["nltk"])}')
+    print(f'nltk: {documents / seconds["nltk"]:.1f} docs/sec')
+    print(f'regex: {documents / seconds["regex"]:.1f} docs/sec ({seconds["nltk"] / seconds["regex"]:.1f}x)')
+
+def _ratio(part: int, whole: int) -> str:
+    return f'{100 * part / whole:.2f}%' if whole > 0 else 'n/a'
+
+class _tokenizers:
+    """
+    The sentence and word tokenizers of an engine
+    """
+    def __init__(self, engine: str):
+        if engine == 'regex':
+            self.sentences = _regex_sent_tokenize
+            self.words = _regex_word_tokenize
+        elif engine == 'nltk':
+            sentence_tokenize = _load_punkt().tokenize
+            # The same instance `nltk.word_tokenize` uses, so the tokens match it exactly
+            treebank_tokenize = nltk.tokenize._treebank_word_tokenizer.tokenize
+            def word_tokenize(sentence: str) -> t.List[str]:
+                # `nltk.word_tokenize` splits its input into sentences again before tokenizing
+                return [word for part in sentence_tokenize(sentence) for word in treebank_tokenize(part)]
+            self.sentences = sentence_tokenize
+            self.words = word_tokenize
+        else:
+            raise ValueError(f'Unknown tokenizer engine: {engine}')
+
+class _line_cache:
+    """
+    A least recently used cache of the tokenized sentences of lines, bounded by their estimated size in bytes.
+    Hits and misses are counted locally and added to the shared counters by `flush`.
+    """
+    def __init__(self, max_bytes: int, counters: t.Any):
+        self.lines: OrderedDict[str, t.List[str]] = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.counters = counters
+
+    def get(self, line: str) -> t.List[str] | None:
+        sentences = self.lines.get(line)
+        if sentences is None:
+            self.misses = self.misses + 1
+        else:
+            self.hits = self.hits + 1
+            self.lines.move_to_end(line)
+        return sentences
+
+    def put(self, line: str, sentences: t.List[str]) -> None:
+        self.lines[line] = sentences
+        self.size = self.size + _entry_size(line, sentences)
+        while self.size > self.max_bytes and len(self.lines) > 0:
+            old_line, old_sentences = self.lines.popitem(last = False)
+            self.size = self.size - _entry_size(old_line, old_sentences)
+
+    def flush(self) -> None:
+        with self.counters.get_lock():
+            self.counters[0] += self.hits
+            self.counters[1] += self.misses
+        self.hits = 0
+        self.misses = 0
+
+def _entry_size(line: str, sentences: t.List[str]) -> int:
+    return 100 + sys.getsizeof(line) + sys.getsizeof(sentences) + sum(sys.getsizeof(sentence) for sentence in sentences)
+
+_state = t.Tuple[str, t.List[t.Tuple[str,str]], _tokenizers, t.Optional[_line_cache]]
 
 @typechecked
-def _passthrough(id_element: str, tokens: t.List[t.Tuple[str,str]]) -> t.Tuple[str, t.List[t.Tuple[str,str]]]:
+def _tokenizer_init(id_element: str, tokens: t.List[t.Tuple[str,str]], engine: str, cache_size: int, counters: t.Any) -> _state:
     """
+    Builds the tokenizers, and the line cache, once per sub process, rather than having NLTK look them up for every line
+
     Parameters
     ----------
     id_element : str
         The name of the element used for correlation between processed files
     tokens : List[(str,str)]
         Passthrough
+    engine : str
+        The name of the tokenizer engine
+    cache_size : int
+        The estimated bytes the line cache can use, or 0 for no cache
+    counters : Array
+        The cache hits and misses shared by all the sub processes
     """
-    return (id_element, tokens)
+    cache = _line_cache(cache_size, counters) if cache_size > 0 else None
+    return (id_element, tokens, _tokenizers(engine), cache)
+
+def _load_punkt() -> t.Any:
+    """
+    Loads the English Punkt model the way `nltk.sent_tokenize` does for the installed version of NLTK
+    """
+    try:
+        from nltk.tokenize import PunktTokenizer
+        return PunktTokenizer('english')
+    except ImportError:
+        return nltk.data.load('tokenizers/punkt/english.pickle')
 
 @typechecked
-def _tokenize_document(state: t.Tuple[str, t.List[t.Tuple[str,str]]], document: dict) -> dict:
+def _tokenize_batch(state: _state, batch: bytes) -> u.batch_result:
+    """
+    Tokenizes a batch of raw `JSONL` lines into a block of `JSONL` text.
+    A document that fails to tokenize is logged and skipped.
+
+    Parameters
+    ----------
+    state : tuple
+        [0] The PK
+        [1] The elements to tokenize
+        [2] The tokenizers
+        [3] The line cache, if any
+    batch : bytes
+        The raw lines in question
+    """
+    errors: t.List[str] = []
+    lines = u.split_jsonl_batch(batch)
+    documents = u.transform_documents(lines, lambda line: _tokenize_document(state, u.json_loads(line)), u.describe_jsonl_line, errors)
+    if state[3] is not None:
+        state[3].flush()
+    return u.batch_result(u.write_jsonl_batch(documents), len(lines), errors)
+
+@typechecked
+def _tokenize_document(state: _state, document: dict) -> dict:
     """
         Parameters
     ----------
     state : tuple
         [0] The PK
         [1] The elements to tokenize
+        [2] The tokenizers
+        [3] The line cache, if any
     document : dict
         The document in question
     """
@@ -76,12 +249,12 @@ def _tokenize_document(state: t.Tuple[str, t.List[t.Tuple[str,str]]], document:
     json[pk] = document[pk]
 
     for token in tokens:
-        lines = [line for line in _tokenize_lines(document[token[0]])]
+        lines = [line for line in _tokenize_lines(document[token[0]], state[2], state[3])]
         json[token[1]] = lines
     return json
 
 @typechecked
-def _tokenize_lines(lines: t.List[str]) -> t.Iterator[str]:
+def _tokenize_lines(lines: t.List[str], tokenizers: _tokenizers, cache: t.Optional[_line_cache] = None) -> t.Iterator[str]:
     """
     Tokenizes all the lines into paragraphs/words using standard Punkt + Penn Treebank tokenizers
     """
@@ -91,20 +264,151 @@ def _tokenize_lines(lines: t.List[str]) -> t.Iterator[str]:
         if line == '':
             yield ''
         else:
-            sentences = sent_tokenize(line)
-            for sentence in sentences:
-                words = word_tokenize(sentence)
-                yield ' '.join(words)
+            sentences = None if cache is None else cache.get(line)
+            if sentences is None:
+                sentences = [' '.join(tokenizers.words(sentence)) for sentence in tokenizers.sentences(line)]
+                if cache is not None:
+                    cache.put(line, sentences)
+            yield from sentences
 
-@typechecked
-def _save_documents_to_jsonl(results: t.Iterator[dict], jsonl_out: pathlib.Path) -> None:
+_abbreviations = frozenset([
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'ft', 'vs', 'etc', 'inc', 'ltd', 'co', 'corp', 'no', 'fig', 'vol', 'pp',
+    'gen', 'gov', 'sen', 'rep', 'lt', 'col', 'capt', 'sgt', 'rev', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'])
+_sentence_end = re.compile(r'(\S*?)([.!?]+)(["\')\]}]*)\s+(?=\S)')
+# The rules of NLTK's Treebank word tokenizer, `nltk.tokenize.NLTKWordTokenizer`, in the order it applies them.
+# The `_end` rules only apply at the end of the sentence.
+_starting_quotes = [
+    (re.compile('([«“‘„]|[`]+)'), r' \1 '),
+    (re.compile(r'^"'), r'``'),
+    (re.compile(r'(``)'), r' \1 '),
+    (re.compile(r'([ \(\[{<])("|\'{2})'), r'\1 `` '),
+    (re.compile(r"(?i)(?<!\w)(')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)"), r'\1 ')]
+_punctuation = [
+    (re.compile(r'([:,])([^\d])'), r' \1 \2'),
+    (re.compile(r'\.{2,}'), r' \g<0> '),
+    (re.compile(r'[;@#$%&]'), r' \g<0> '),
+    (re.compile('[‒-―]'), r' \g<0> '),
+    (re.compile(r'[?!]'), r' \g<0> '),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+    (re.compile(r'[*]'), r' \g<0> '),
+    (re.compile(r'[\]\[\(\)\{\}\<\>]'), r' \g<0> '),
+    (re.compile(r'--'), r' -- ')]
+_punctuation_end = [
+    (re.compile(r'([^\.])(\.)([\]\)}>"\'' '»”’ ' r']*)\s*$'), r'\1 \2 \3 '),
+    (re.compile(r'([:,])([^\d])'), r' \1 \2'),
+    (re.compile(r'([:,])$'), r' \1 '),
+    (re.compile(r'\.{2,}'), r' \g<0> '),
+    (re.compile(r'[;@#$%&]'), r' \g<0> '),
+    (re.compile('[‒-―]'), r' \g<0> '),
+    (re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r'\1 \2\3 '),
+    (re.compile(r'[?!]'), r' \g<0> '),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+    (re.compile(r'[*]'), r' \g<0> '),
+    (re.compile(r'[\]\[\(\)\{\}\<\>]'), r' \g<0> '),
+    (re.compile(r'--'), r' -- ')]
+_ending_quotes = [
+    (re.compile('([»”’])'), r' \1 '),
+    (re.compile(r"''"), " '' "),
+    (re.compile(r'"'), " '' "),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r'\1 \2 '),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r'\1 \2 '),
+    (re.compile(r"(?i)\b(can)(?#X)(not)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(d)(?#X)('ye)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(gim)(?#X)(me)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(gon)(?#X)(na)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(got)(?#X)(ta)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(lem)(?#X)(me)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(more)(?#X)('n)\b"), r' \1 \2 '),
+    (re.compile(r"(?i)\b(wan)(?#X)(na)(?=\s)"), r' \1 \2 '),
+    (re.compile(r"(?i) ('t)(?#X)(is)\b"), r' \1 \2 '),
+    (re.compile(r"(?i) ('t)(?#X)(was)\b"), r' \1 \2 ')]
+_closing = frozenset(']})>"\'»”’')
+_other_space = re.compile(r'[^\S ]')
+_plain_word = re.compile(r'[^\W_]+')
+_plain_contractions = frozenset(['cannot', 'gimme', 'gonna', 'gotta', 'lemme', 'wanna'])
+_word_caches: t.Dict[t.Tuple[bool, bool], t.Dict[str, t.List[str]]] = { (at_start, at_end) : {} for at_start in [False, True] for at_end in [False, True] }
+_word_cache_size = 1 << 16
+
+def _regex_sent_tokenize(text: str) -> t.List[str]:
     """
-    Writes the relevant data to disk
+    Splits the text into sentences at terminal punctuation followed by white space.
+    Like Punkt, it does not split after common abbreviations, initials, or dotted forms such as 'U.S.'
     """
-    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
-        with jl.Writer(fp, compact = True, sort_keys = True) as writer:
-            for item in results:
-                writer.write(item)
+    result: t.List[str] = []
+    start = 0
+    for match in _sentence_end.finditer(text):
+        word, punct = match.group(1).lstrip('"\'([{<'), match.group(2)
+        if punct == '.' and (word.lower() in _abbreviations or '.' in word or (len(word) == 1 and word.isalpha())):
+            continue
+        if len(punct) > 1 and punct[0] == '.' and not text[match.end()].isupper():
+            continue
+        result.append(text[start:match.end(3)])
+        start = match.end()
+    if start < len(text):
+        result.append(text[start:].strip())
+    return result
+
+def _regex_word_tokenize(text: str) -> t.List[str]:
+    """
+    Splits the sentence into the same tokens as NLTK's Treebank word tokenizer.
+    Apart from the start and end of the sentence, its rules never reach past a space.
+    So each space separated word is tokenized on its own and remembered, and most words in a corpus are repeats.
+    The end is the last word along with any closing quotes and brackets after it, since the final period rule reaches past them.
+    Sentences with other white space are tokenized whole, the way NLTK does.
+    """
+    if _other_space.search(text) is not None:
+        return _treebank_tokenize(text, True, True)
+    words = text.split(' ')
+    end = len(words) - 1
+    while end > 0 and all(c in _closing for c in words[end]):
+        end = end - 1
+    if end == 0:
+        return list(_cached_treebank_tokenize(text, True, True))
+    result = list(_cached_treebank_tokenize(words[0], True, False))
+    middle = _word_caches[(False, False)]
+    for i in range(1, end):
+        tokens = middle.get(words[i])
+        if tokens is None:
+            tokens = _cached_treebank_tokenize(words[i], False, False)
+        result.extend(tokens)
+    result.extend(_cached_treebank_tokenize(' '.join(words[end:]), False, True))
+    return result
+
+def _cached_treebank_tokenize(text: str, at_start: bool, at_end: bool) -> t.List[str]:
+    """
+    Remembers the tokens of the part of a sentence, separately for each position in the sentence.
+    A cache that fills up is started over.
+    """
+    cache = _word_caches[(at_start, at_end)]
+    tokens = cache.get(text)
+    if tokens is None:
+        tokens = _treebank_tokenize(text, at_start, at_end)
+        if len(cache) >= _word_cache_size:
+            cache.clear()
+        cache[text] = tokens
+    return tokens
+
+def _treebank_tokenize(text: str, at_start: bool, at_end: bool) -> t.List[str]:
+    """
+    Applies the Treebank rules to part of a sentence.
+    `at_start` and `at_end` say if the part starts or ends the sentence, otherwise it is next to a space.
+    Only a few contractions split a word made of just letters and digits, so the rules are skipped for the rest.
+    """
+    if _plain_word.fullmatch(text) is not None and text.lower() not in _plain_contractions:
+        return [text]
+    if not at_start:
+        text = ' ' + text
+    if not at_end:
+        text = text + ' '
+    for regexp, substitution in _starting_quotes:
+        text = regexp.sub(substitution, text)
+    for regexp, substitution in (_punctuation_end if at_end else _punctuation):
+        text = regexp.sub(substitution, text)
+    text = ' ' + text + ' '
+    for regexp, substitution in _ending_quotes:
+        text = regexp.sub(substitution, text)
+    return text.split()
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -133,10 +437,36 @@ if __name__ == '__main__':
         help = 'The number of sub processes used to transformation from in to out formats',
         type = int,
         default = 1)
+    parser.add_argument(
+        '-bs', '--batch-size',
+        help = 'The number of documents sent to a sub process at a time',
+        type = int,
+        default = 100)
+    parser.add_argument(
+        '-engine', '--engine',
+        help = 'The tokenizer engine: nltk (Punkt + Penn Treebank) or regex (approximate Punkt + cached Penn Treebank)',
+        choices = ['nltk', 'regex'],
+        default = 'nltk')
+    parser.add_argument(
+        '-agree', '--agreement',
+        help = 'Instead of tokenizing, reports how closely regex agrees with nltk on this many documents',
+        type = int,
+        default = 0)
+    parser.add_argument(
+        '-cache', '--cache-size',
+        help = 'The ram, such as 64M, each sub process can use to remember the tokens of repeated lines',
+        type = u.byte_size,
+        default = '0')
     args = parser.parse_args()    
     print(f'jsonl in: {args.jsonl_in}')
     print(f'jsonl out: {args.jsonl_out}')
     print(f'id element: {args.id_element}')
     print(f'tokens: {args.tokens}')
     print(f'sub process count: {args.sub_process_count}')
-    tokenize_jsonl(args.jsonl_in, args.jsonl_out, args.id_element, args.tokens, args.sub_process_count)
+    print(f'batch size: {args.batch_size}')
+    print(f'engine: {args.engine}')
+    print(f'cache size: {args.cache_size}')
+    if args.agreement > 0:
+        tokenize_agreement(args.jsonl_in, args.tokens, args.agreement)
+    else:
+        tokenize_jsonl(args.jsonl_in, args.jsonl_out, args.id_element, args.tokens, args.sub_process_count, args.batch_size, args.engine, args.cache_size)
@@ -1,4 +1,23 @@
+import array
+import bisect
+import bz2
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import json
+import json.decoder
+import json.scanner
+import lzma
+import mmap
+import os
 import pathlib
+import re
+import struct
+import sys
+import tarfile
+import zipfile
 import jsonlines as jl
 import progressbar as pb
 import typing as t
@@ -15,29 +34,914 @@ def guess_encoding(file_name: pathlib.Path) -> str:
     file_name : pathlib.Path
         The file at issue
     """
-    with open(file_name, 'rb') as fp:
+    with open_file(file_name, 'rb') as fp:
         b = fp.read(2)
-    if ((len(b) >= 2) and ((b[0:2] == b'\xfe\xff') or (b[0:2] == b'\xff\xfe'))):
+    return guess_bytes_encoding(b)
+
+def guess_bytes_encoding(data: bytes) -> str:
+    """
+    Guess the encoding of the raw bytes of a file, the same way as `guess_encoding`
+
+    Parameters
+    ----------
+    data : bytes
+        The start of the file, at least
+    """
+    if ((len(data) >= 2) and ((data[0:2] == b'\xfe\xff') or (data[0:2] == b'\xff\xfe'))):
         return "utf-16"
     else:
         return "utf-8"
 
-def list_jsonl_documents(jsonl_in: pathlib.Path) -> t.Iterator[ct.Document]:
+def read_txt_lines(data: bytes) -> t.List[str]:
+    """
+    Decodes the raw bytes of a `TXT` file into its stripped lines.
+    Files without a BOM are 'utf-8'.
+
+    Parameters
+    ----------
+    data : bytes
+        The raw bytes of the file
+    """
+    encoding = guess_bytes_encoding(data)
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding = encoding).readlines()
+    if encoding == 'utf-8' and len(lines) > 0 and lines[0][0] == '\ufeff':
+        lines[0] = lines[0][1:]
+    return [line.strip() for line in lines]
+
+def _find_zstd() -> t.Any:
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+_zstd = _find_zstd()
+_compressions = { '.gz' : 'gzip', '.bz2' : 'bz2', '.xz' : 'xz', '.zst' : 'zstd' }
+_compress_block_size = 4 * 1024 * 1024
+compress_threads = min(4, os.cpu_count() or 1)
+
+def compression(file_name: pathlib.PurePath) -> str | None:
+    """
+    The codec of the file, picked from its extension: 'gzip', 'bz2', 'xz', 'zstd' or `None` when it is not compressed
+
+    Parameters
+    ----------
+    file_name : pathlib.Path
+        The file at issue
+    """
+    return _compressions.get(file_name.suffix.lower())
+
+def document_suffix(file_name: pathlib.PurePath) -> str:
+    """
+    The extension of the file, ignoring any compression extension, such as '.jsonl' for 'corpus.jsonl.gz'
+    """
+    if compression(file_name) is not None:
+        file_name = file_name.with_suffix('')
+    return file_name.suffix.lower()
+
+def open_file(file_name: pathlib.Path, mode: str = 'rb', encoding: str | None = None, threads: int | None = None) -> t.IO:
+    """
+    Opens the file, transparently compressing or decompressing it based on its extension.
+    Compressed writes are split into independent blocks compressed by a pool of threads, each block a member (gzip) or stream (bz2, xz) of its own.
+    Standard tools read such files like any other.
+    zstd uses its own threading instead.
+
+    Parameters
+    ----------
+    file_name : pathlib.Path
+        The file to open
+    mode : str
+        'rb', 'wb', 'ab', 'rt', 'wt' or 'at'.
+        'r', 'w' and 'a' alone are text
+    encoding : str | None
+        The encoding of text modes
+    threads : int | None
+        The number of threads compressing writes.
+        `None` uses `compress_threads`
+    """
+    codec = compression(file_name)
+    text = 'b' not in mode
+    binary_mode = mode.replace('t', '').replace('b', '') + 'b'
+    if codec is None:
+        return open(file_name, mode, encoding = encoding) if text else open(file_name, mode)
+    threads = compress_threads if threads is None else threads
+    if codec == 'zstd':
+        if _zstd is None:
+            raise ValueError(f'{file_name} needs the zstandard package')
+        if binary_mode == 'rb':
+            fp = _zstd.open(file_name, 'rb')
+        else:
+            fp = _zstd.open(file_name, binary_mode, cctx = _zstd.ZstdCompressor(threads = threads if threads > 1 else 0))
+    elif binary_mode == 'rb':
+        fp = { 'gzip' : gzip.open, 'bz2' : bz2.open, 'xz' : lzma.open }[codec](file_name, 'rb')
+    elif threads > 1:
+        compress = { 'gzip' : _gzip_compress, 'bz2' : bz2.compress, 'xz' : lzma.compress }[codec]
+        fp = io.BufferedWriter(_block_writer(open(file_name, binary_mode), compress, threads), _compress_block_size)
+    else:
+        fp = { 'gzip' : gzip.open, 'bz2' : bz2.open, 'xz' : lzma.open }[codec](file_name, binary_mode)
+    return io.TextIOWrapper(fp, encoding = encoding) if text else fp
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel = 6, mtime = 0)
+
+class _block_writer(io.RawIOBase):
+    """
+    Compresses the data written to it in independent blocks on a pool of threads, writing the blocks in order.
+    The compressors release the GIL, so the blocks compress in parallel.
+    """
+    def __init__(self, fp: t.BinaryIO, compress: t.Callable[[bytes], bytes], threads: int):
+        self.fp = fp
+        self.compress = compress
+        self.threads = threads
+        self.buffer = bytearray()
+        self.pool = concurrent.futures.ThreadPoolExecutor(threads)
+        self.pending: t.Deque[concurrent.futures.Future] = collections.deque()
+        self.blocks = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: t.Any) -> int:
+        self.buffer += data
+        if len(self.buffer) >= _compress_block_size:
+            self._submit()
+        return len(data)
+
+    def _submit(self) -> None:
+        self.pending.append(self.pool.submit(self.compress, bytes(self.buffer)))
+        self.buffer = bytearray()
+        self.blocks = self.blocks + 1
+        while len(self.pending) > self.threads * 2:
+            self.fp.write(self.pending.popleft().result())
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                if len(self.buffer) > 0 or self.blocks == 0:
+                    self._submit()
+                while len(self.pending) > 0:
+                    self.fp.write(self.pending.popleft().result())
+            finally:
+                self.pool.shutdown()
+                self.fp.close()
+        super().close()
+
+def _find_json_backend() -> t.Tuple[str, t.Callable[[bytes], t.Any]]:
+    """
+    Picks the fastest installed JSON decoder
+    """
+    try:
+        import orjson
+        return ('orjson', orjson.loads)
+    except ImportError:
+        pass
+    try:
+        import ujson
+        return ('ujson', ujson.loads)
+    except ImportError:
+        pass
+    return ('json', _stdlib_loads)
+
+def _stdlib_loads(line: bytes) -> t.Any:
+    return _json_decoder.decode(line.decode('utf-8'))
+
+def _fast_or_stdlib_loads(line: bytes) -> t.Any:
+    """
+    Decodes with the faster backend, handing the lines it rejects to the stdlib, so the result never depends on what is installed.
+    orjson rejects `NaN`, `Infinity` and lone surrogates, which `json` reads.
+    It also turns integers over 64 bits into floats, so lines with a run of 20 or more digits go straight to the stdlib.
+    A line neither accepts raises the stdlib's error.
+    """
+    if _json_long_digits not in line.translate(_json_digit_table):
+        try:
+            return _fast_loads(line)
+        except ValueError:
+            pass
+    return _stdlib_loads(line)
+
+_json_decoder = json.JSONDecoder()
+# Digits become '0' and everything else ' ', so a run of 20 digits is a plain substring search, which is much faster than a regex
+_json_digit_table = bytes(ord('0') if chr(i).isdigit() and i < 128 else ord(' ') for i in range(256))
+_json_long_digits = b'0' * 20
+json_backend, _fast_loads = _find_json_backend()
+json_loads = _stdlib_loads if json_backend == 'json' else _fast_or_stdlib_loads
+_block_size = 1024 * 1024
+_json_ws = re.compile(r'[ \t\r\n]*')
+_json_scan_once = json.scanner.make_scanner(_json_decoder)
+_json_scanstring = json.decoder.scanstring
+
+def list_jsonl_documents(jsonl_in: pathlib.Path, start: int = 0, end: int | None = None, fields: t.Collection[str] | None = None) -> t.Iterator[ct.Document]:
+    """
+    Lists the documents in the `JSONL` file.
+    Lines are decoded using `json_backend`, falling back to the stdlib for the lines it rejects.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    start : int
+        The byte offset at or after which the first document starts
+    end : int | None
+        The byte offset before which the last document starts.
+        `None` reads to the end of the file
+    fields : Collection[str] | None
+        The top level fields to keep.
+        With the stdlib backend, the values of the other fields are skipped by `project_json`.
+        orjson and ujson decode whole lines faster than the skipping can, so with them the other fields are dropped after decoding.
+        `None` keeps every field
+    """
+    if guess_encoding(jsonl_in) != 'utf-8':
+        with open_file(jsonl_in, 'rt', encoding = 'utf-16') as fp:
+            for line in fp:
+                line = line.strip()
+                if len(line) > 0:
+                    document = json.loads(line)
+                    if fields is not None:
+                        document = { key : value for key, value in document.items() if key in fields }
+                    yield document
+    elif fields is None:
+        loads = json_loads
+        for line in list_jsonl_lines(jsonl_in, start, end):
+            line = line.strip()
+            if len(line) > 0:
+                yield loads(line)
+    elif json_backend != 'json':
+        fields = set(fields)
+        loads = json_loads
+        for line in list_jsonl_lines(jsonl_in, start, end):
+            line = line.strip()
+            if len(line) > 0:
+                document = loads(line)
+                yield { key : value for key, value in document.items() if key in fields }
+    else:
+        fields = set(fields)
+        for line in list_jsonl_lines(jsonl_in, start, end):
+            line = line.strip()
+            if len(line) > 0:
+                yield project_json(line, fields)
+
+def project_json(line: bytes, fields: t.Set[str]) -> ct.Document:
+    """
+    Decodes only the requested top level fields of a `JSON` object.
+    Unrequested strings are skipped with `str.find` rather than decoded and scanning stops once every field is found.
+    Unrequested objects and arrays still go through the stdlib's C scanner, but are dropped straight away.
+    Anything the scanner does not expect is handed to the full decoder, so malformed lines still raise its errors.
+
+    Parameters
+    ----------
+    line : bytes
+        The `utf-8` encoded JSON object
+    fields : Set[str]
+        The names of the fields to keep
+    """
+    try:
+        return _project_json(line.decode('utf-8'), fields)
+    except (ValueError, IndexError, StopIteration):
+        document = json_loads(line)
+        return { key : value for key, value in document.items() if key in fields }
+
+def _project_json(text: str, fields: t.Set[str]) -> ct.Document:
+    result: ct.Document = {}
+    pos = _json_ws.match(text, 0).end()
+    if text[pos] != '{':
+        raise ValueError('Not a JSON object')
+    pos = _json_ws.match(text, pos + 1).end()
+    if text[pos] == '}':
+        return result
+    while True:
+        if text[pos] != '"':
+            raise ValueError('Expected a key')
+        key, pos = _json_scanstring(text, pos + 1)
+        pos = _json_ws.match(text, pos).end()
+        if text[pos] != ':':
+            raise ValueError('Expected a colon')
+        pos = _json_ws.match(text, pos + 1).end()
+        if key not in fields and text[pos] == '"':
+            end = text.find('"', pos + 1)
+            if end < 0:
+                raise ValueError('Unterminated string')
+            elif text[end - 1] == '\\':
+                _, end = _json_scanstring(text, pos + 1)
+            else:
+                end = end + 1
+        else:
+            value, end = _json_scan_once(text, pos)
+            if key in fields:
+                result[key] = value
+                if len(result) == len(fields):
+                    return result
+        pos = _json_ws.match(text, end).end()
+        if text[pos] == ',':
+            pos = _json_ws.match(text, pos + 1).end()
+        elif text[pos] == '}':
+            return result
+        else:
+            raise ValueError('Expected a comma')
+
+def list_jsonl_lines(jsonl_in: pathlib.Path, start: int = 0, end: int | None = None) -> t.Iterator[bytes]:
+    """
+    Lists the raw lines in the `utf-8` `JSONL` file, without their line feed.
+    The file is read in large blocks and split into lines here, rather than line by line.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    start : int
+        The byte offset at or after which the first line starts
+    end : int | None
+        The byte offset before which the last line starts.
+        `None` reads to the end of the file
+    """
+    for _, line in list_jsonl_line_offsets(jsonl_in, start, end):
+        yield line
+
+def list_jsonl_line_offsets(jsonl_in: pathlib.Path, start: int = 0, end: int | None = None) -> t.Iterator[t.Tuple[int, bytes]]:
+    """
+    Lists the raw lines in the `utf-8` `JSONL` file, without their line feed, along with the byte offset each starts at.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    start : int
+        The byte offset at or after which the first line starts
+    end : int | None
+        The byte offset before which the last line starts.
+        `None` reads to the end of the file
+    """
+    with open_file(jsonl_in, 'rb') as fp:
+        if start > 0:
+            fp.seek(start - 1)
+            fp.readline()
+        pos = fp.tell()
+        rest = b''
+        block = fp.read(_block_size)
+        if pos == 0 and block.startswith(b'\xef\xbb\xbf'):
+            block = block[3:]
+            pos = 3
+        while len(block) > 0:
+            lines = (rest + block).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                if end is not None and pos >= end:
+                    return
+                yield (pos, line)
+                pos = pos + len(line) + 1
+            block = fp.read(_block_size)
+        if len(rest) > 0 and (end is None or pos < end):
+            yield (pos, rest)
+
+def list_jsonl_shards(jsonl_files: t.Iterable[pathlib.Path], shard_size: int) -> t.Iterator[t.Tuple[pathlib.Path, int, int | None]]:
+    """
+    Splits the `JSONL` files into byte ranges of about `shard_size` bytes.
+    Each range is suitable for `list_jsonl_documents`.
+    Files with a current index sidecar are split exactly on document boundaries.
+    Files that are compressed or not `utf-8` are never split.
+
+    Parameters
+    ----------
+    jsonl_files : Iterable[pathlib.Path]
+        The JSONL files to split
+    shard_size : int
+        The target size, in bytes, of each range
+    """
+    for jsonl_file in jsonl_files:
+        file_size = jsonl_file.stat().st_size
+        if compression(jsonl_file) is not None or guess_encoding(jsonl_file) != 'utf-8' or file_size <= shard_size:
+            yield (jsonl_file, 0, None)
+            continue
+        index = load_jsonl_index(jsonl_file)
+        if index is not None:
+            parts = -(-file_size // shard_size)
+            with index:
+                ranges = split_jsonl_index(index, parts)
+            for start, end in ranges:
+                yield (jsonl_file, start, end)
+        else:
+            for start in range(0, file_size, shard_size):
+                end = start + shard_size
+                yield (jsonl_file, start, end if end < file_size else None)
+
+class jsonl_index:
+    """
+    The byte offsets of the documents in a `JSONL` file, as stored in its index sidecar.
+
+    Attributes
+    ----------
+    offsets : Sequence[int]
+        The byte offset each document starts at, followed by the size of the file
+    ids : List[str] | None
+        The id of each document, as a string, or `None` if the sidecar has no ids
+    """
+    def __init__(self, offsets: t.Sequence[int], ids: t.List[str] | None = None, view: mmap.mmap | None = None):
+        self.offsets = offsets
+        self.ids = ids
+        self._view = view
+        self._numbers: t.Dict[str, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __enter__(self) -> 'jsonl_index':
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Unmaps the offsets, after which the index can no longer be used
+        """
+        if self._view is not None:
+            if isinstance(self.offsets, memoryview):
+                self.offsets.release()
+            self._view.close()
+            self._view = None
+
+    def number_of(self, id: str | int) -> int | None:
+        """
+        Finds the number of the first document with the id, or `None` if there is no such document.
+        The ids are indexed as strings, so an id that is not a string is looked up as `str(id)`, the same way it was indexed.
+        """
+        if self.ids is None:
+            raise ValueError('The index has no ids')
+        if self._numbers is None:
+            self._numbers = {}
+            for i in range(len(self.ids) - 1, -1, -1):
+                self._numbers[self.ids[i]] = i
+        return self._numbers.get(id if type(id) == str else str(id))
+
+_index_header = struct.Struct('<4sBB2xQQq')
+_index_magic = b'BBJX'
+_index_version = 1
+
+def pack_index_header(magic: bytes, flags: int, count: int, file_in: pathlib.Path) -> bytes:
+    """
+    Packs the header shared by the index sidecars: magic, version, flags, entry count and the size and modified time of the indexed file
+
+    Parameters
+    ----------
+    magic : bytes
+        The 4 bytes naming the kind of index
+    flags : int
+        The index specific flags
+    count : int
+        The amount of entries in the index
+    file_in : pathlib.Path
+        The indexed file
+    """
+    stat = file_in.stat()
+    return _index_header.pack(magic, _index_version, flags, count, stat.st_size, stat.st_mtime_ns)
+
+def read_index_header(fp: t.BinaryIO, magic: bytes, kind: str, file_in: pathlib.Path) -> t.Tuple[int, int] | None:
+    """
+    Reads the header written by `pack_index_header`, leaving `fp` at the start of the index data.
+    Returns the flags and entry count, or `None` when the indexed file changed after it was indexed.
+
+    Parameters
+    ----------
+    fp : BinaryIO
+        The open index sidecar
+    magic : bytes
+        The 4 bytes naming the expected kind of index
+    kind : str
+        The kind of index, for the error message
+    file_in : pathlib.Path
+        The indexed file
+    """
+    found, version, flags, count, file_size, mtime = _index_header.unpack(fp.read(_index_header.size))
+    if found != magic or version != _index_version:
+        raise ValueError(f'{fp.name} is not a {kind} index')
+    stat = file_in.stat()
+    if file_size != stat.st_size or mtime != stat.st_mtime_ns:
+        return None
+    return (flags, count)
+
+def jsonl_index_path(jsonl_in: pathlib.Path) -> pathlib.Path:
+    """
+    The path of the index sidecar of the `JSONL` file
+    """
+    return jsonl_in.with_name(f'{jsonl_in.name}.idx')
+
+def save_jsonl_index(jsonl_in: pathlib.Path, offsets: t.Sequence[int], ids: t.List[str] | None = None) -> pathlib.Path:
+    """
+    Saves the index sidecar of the `JSONL` file.
+    The sidecar is a small header, the offsets as little endian 64 bit ints and, optionally, the ids as a JSON array.
+    The header records the size and modified time of the JSONL file so a stale sidecar is never used.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The indexed JSONL file
+    offsets : Sequence[int]
+        The byte offset each document starts at, followed by the size of the file
+    ids : List[str] | None
+        The id of each document
+    """
+    table = array.array('Q', offsets)
+    if sys.byteorder != 'little':
+        table.byteswap()
+    index_out = jsonl_index_path(jsonl_in)
+    with open(index_out, 'wb') as fp:
+        fp.write(pack_index_header(_index_magic, 0 if ids is None else 1, len(table) - 1, jsonl_in))
+        fp.write(table.tobytes())
+        if ids is not None:
+            fp.write(json.dumps(ids, ensure_ascii = False, separators = (',', ':')).encode('utf-8'))
+    return index_out
+
+def load_jsonl_index(jsonl_in: pathlib.Path, with_ids: bool = False) -> jsonl_index | None:
+    """
+    Loads the index sidecar of the `JSONL` file.
+    The offsets are memory mapped, not read, so loading is cheap no matter the size of the file.
+    Close the index, or use it in a `with` block, to unmap them.
+    Returns `None` when there is no sidecar or the JSONL file changed after it was indexed.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The indexed JSONL file
+    with_ids : bool
+        Also load the ids, if the sidecar has them
+    """
+    index_in = jsonl_index_path(jsonl_in)
+    if not index_in.exists():
+        return None
+    with open(index_in, 'rb') as fp:
+        header = read_index_header(fp, _index_magic, 'JSONL', jsonl_in)
+        if header is None:
+            return None
+        flags, count = header
+        start = _index_header.size
+        end = start + (count + 1) * 8
+        view = None
+        if sys.byteorder == 'little':
+            view = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+            offsets: t.Sequence[int] = memoryview(view)[start:end].cast('Q')
+        else:
+            offsets = array.array('Q')
+            offsets.frombytes(fp.read(end - start))
+            offsets.byteswap()
+        ids = None
+        if with_ids and flags & 1 == 1:
+            fp.seek(end)
+            ids = json.loads(fp.read().decode('utf-8'))
+    return jsonl_index(offsets, ids, view)
+
+def split_jsonl_index(index: jsonl_index, parts: int, by_documents: bool = False) -> t.List[t.Tuple[int, int | None]]:
     """
-    Lists the documents in the `JSONL` file
+    Splits the indexed `JSONL` file into byte ranges that start and end exactly on document boundaries.
+    Each range is suitable for `list_jsonl_documents`.
+
+    Parameters
+    ----------
+    index : jsonl_index
+        The index of the JSONL file
+    parts : int
+        The number of ranges.
+        Fewer come back if there are fewer documents
+    by_documents : bool
+        Give each range about the same number of documents instead of about the same number of bytes
+    """
+    offsets = index.offsets
+    count = len(index)
+    first = offsets[0] if count > 0 else 0
+    last = offsets[count]
+    bounds = [0]
+    for part in range(1, parts):
+        if by_documents:
+            number = count * part // parts
+        else:
+            number = bisect.bisect_left(offsets, first + (last - first) * part // parts, 0, count)
+        if number > bounds[-1]:
+            bounds.append(number)
+    result: t.List[t.Tuple[int, int | None]] = []
+    for i in range(len(bounds)):
+        start = offsets[bounds[i]]
+        end = offsets[bounds[i + 1]] if i + 1 < len(bounds) else None
+        result.append((0 if i == 0 else start, end))
+    return result
+
+def get_jsonl_document(jsonl_in: pathlib.Path, index: jsonl_index, number: int) -> ct.Document:
+    """
+    Reads a single document from the indexed `JSONL` file without scanning the lines before it.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    index : jsonl_index
+        The index of the JSONL file
+    number : int
+        The 0 based number of the document
+    """
+    return next(get_jsonl_documents(jsonl_in, index, [number]))
+
+def get_jsonl_documents(jsonl_in: pathlib.Path, index: jsonl_index, numbers: t.Iterable[int]) -> t.Iterator[ct.Document]:
+    """
+    Reads the documents, in the order given, from the indexed `JSONL` file.
+    The file is only opened once.
 
     Parameters
     ----------
     jsonl_in : pathlib.Path
         The JSONL containing all the documents
+    index : jsonl_index
+        The index of the JSONL file
+    numbers : Iterable[int]
+        The 0 based numbers of the documents
+    """
+    offsets = index.offsets
+    count = len(index)
+    loads = json_loads
+    with open(jsonl_in, 'rb') as fp:
+        for number in numbers:
+            if number < 0 or number >= count:
+                raise IndexError(f'Document {number} is not in {jsonl_in}')
+            fp.seek(offsets[number])
+            line = fp.read(offsets[number + 1] - offsets[number])
+            yield loads(line.strip())
+
+def find_jsonl_document(jsonl_in: pathlib.Path, index: jsonl_index, id: str | int) -> ct.Document | None:
+    """
+    Reads the document with the id from the indexed `JSONL` file, or `None` if there is no such document.
+    The index must be loaded `with_ids`.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    index : jsonl_index
+        The index of the JSONL file
+    id : str | int
+        The id of the document.
+        Ids are indexed as strings, so an id that is not a string is looked up as `str(id)`
+    """
+    number = index.number_of(id)
+    if number is None:
+        return None
+    return get_jsonl_document(jsonl_in, index, number)
+
+def list_jsonl_batches(jsonl_in: pathlib.Path, batch_size: int) -> t.Iterator[bytes]:
+    """
+    Lists the raw lines in the `JSONL` file in blocks of `batch_size` lines.
+    Sending a block of `utf-8` bytes to a worker costs far less than sending each decoded document.
+    Decode the blocks with `read_jsonl_batch`.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    batch_size : int
+        The number of lines in each block
+    """
+    if guess_encoding(jsonl_in) != 'utf-8':
+        with open_file(jsonl_in, 'rt', encoding = 'utf-16') as fp:
+            lines = (line.rstrip('\n').encode('utf-8') for line in fp)
+            for batch in list_batches(lines, batch_size):
+                yield b'\n'.join(batch)
+    else:
+        for batch in list_batches(list_jsonl_lines(jsonl_in), batch_size):
+            yield b'\n'.join(batch)
+
+def list_jsonl_payloads(jsonl_in: pathlib.Path) -> t.Iterator[bytes]:
+    """
+    Lists the documents in the `JSONL` file as raw `utf-8` bytes, without decoding them.
+    Blank lines are skipped.
+
+    Parameters
+    ----------
+    jsonl_in : pathlib.Path
+        The JSONL containing all the documents
+    """
+    if guess_encoding(jsonl_in) != 'utf-8':
+        with open_file(jsonl_in, 'rt', encoding = 'utf-16') as fp:
+            for text in fp:
+                text = text.strip()
+                if len(text) > 0:
+                    yield text.encode('utf-8')
+    else:
+        for line in list_jsonl_lines(jsonl_in):
+            line = line.strip()
+            if len(line) > 0:
+                yield line
+
+def validate_json_document(payload: bytes) -> bytes:
     """
-    encoding = guess_encoding(jsonl_in)
-    with open(jsonl_in, 'r', encoding = encoding) as fp:
-        with jl.Reader(fp) as reader:
-            for item in reader:
-                yield item
+    Checks the raw bytes hold a single JSON object, raising `ValueError` when they do not.
+    Returns the bytes as-is.
 
-def list_folder_documents(folder_in: pathlib.Path, is_document: t.Callable[[pathlib.Path], bool]) -> t.Iterator[str]:
+    Parameters
+    ----------
+    payload : bytes
+        The raw JSON of the document
+    """
+    document = json_loads(payload)
+    if type(document) != dict:
+        raise ValueError(f'Expected a JSON object, not {payload[:40]!r}')
+    return payload
+
+def read_jsonl_batch(batch: bytes) -> t.Iterator[ct.Document]:
+    """
+    Decodes the documents in a block from `list_jsonl_batches`
+
+    Parameters
+    ----------
+    batch : bytes
+        The raw lines
+    """
+    loads = json_loads
+    for line in batch.split(b'\n'):
+        line = line.strip()
+        if len(line) > 0:
+            yield loads(line)
+
+_jsonl_encoder = json.JSONEncoder(ensure_ascii = False, sort_keys = True, separators = (',', ':'))
+
+def write_jsonl_batch(documents: t.Iterable[ct.Document]) -> str:
+    """
+    Encodes the documents as a block of `JSONL` text.
+    The lines are exactly what `jsonlines.Writer(fp, compact = True, sort_keys = True)` writes.
+
+    Parameters
+    ----------
+    documents : Iterable[dict]
+        The documents to encode
+    """
+    encode = _jsonl_encoder.encode
+    return ''.join([f'{encode(document)}\n' for document in documents])
+
+def save_jsonl_batches(batches: t.Iterator[str], jsonl_out: pathlib.Path) -> None:
+    """
+    Writes the blocks from `write_jsonl_batch` to disk, as-is
+
+    Parameters
+    ----------
+    batches : Iterator[str]
+        The blocks of JSONL text
+    jsonl_out : pathlib.Path
+        The JSONL file containing all the documents
+    """
+    with open_file(jsonl_out, 'wt', encoding = 'utf-8') as fp:
+        for batch in batches:
+            fp.write(batch)
+
+def save_jsonl_lines(blocks: t.Iterator[bytes], jsonl_out: pathlib.Path) -> None:
+    """
+    Writes blocks of raw `utf-8` JSONL lines to disk, as-is.
+    Each block must end with a line feed.
+
+    Parameters
+    ----------
+    blocks : Iterator[bytes]
+        The blocks of JSONL lines
+    jsonl_out : pathlib.Path
+        The JSONL file containing all the documents
+    """
+    with open_file(jsonl_out, 'wb') as fp:
+        for block in blocks:
+            fp.write(block)
+
+def jsonl_shard_path(jsonl_out: pathlib.Path, number: int) -> pathlib.Path:
+    """
+    The path of a numbered shard of the `JSONL` file, such as 'corpus.00001.jsonl' for 'corpus.jsonl' or 'corpus.00001.jsonl.gz' for 'corpus.jsonl.gz'
+    """
+    prefix, suffix = _jsonl_shard_parts(jsonl_out)
+    return jsonl_out.with_name(f'{prefix}{number:05}{suffix}')
+
+def list_jsonl_shard_paths(jsonl_out: pathlib.Path) -> t.List[pathlib.Path]:
+    """
+    Lists the existing numbered shards of the `JSONL` file
+    """
+    if not jsonl_out.parent.is_dir():
+        return []
+    prefix, suffix = _jsonl_shard_parts(jsonl_out)
+    pattern = re.compile(re.escape(prefix) + r'\d{5,}' + re.escape(suffix))
+    return sorted(jsonl_out.with_name(name) for name in os.listdir(jsonl_out.parent) if pattern.fullmatch(name))
+
+def _jsonl_shard_parts(jsonl_out: pathlib.Path) -> t.Tuple[str, str]:
+    codec_suffix = jsonl_out.suffix if compression(jsonl_out) is not None else ''
+    base = jsonl_out.with_suffix('') if len(codec_suffix) > 0 else jsonl_out
+    return (f'{base.stem}.', f'{base.suffix}{codec_suffix}')
+
+class jsonl_shard_writer:
+    """
+    Appends blocks of `JSONL` text to numbered shards of the JSONL file, moving on to a new shard once the current one is full.
+    The shard numbers come from a counter shared by all the sub processes, so each shard has a single writer.
+    Each block is appended, and the shard closed again, so nothing is left unwritten when the sub process ends.
+
+    Attributes
+    ----------
+    jsonl_out : pathlib.Path
+        The JSONL file the shards are named after
+    max_documents : int
+        The number of documents in a full shard, or 0 for no limit
+    max_bytes : int
+        The number of bytes in a full shard, or 0 for no limit
+    counter : Value
+        The number of the next shard, shared by all the sub processes
+    """
+    def __init__(self, jsonl_out: pathlib.Path, max_documents: int, max_bytes: int, counter: t.Any):
+        self.jsonl_out = jsonl_out
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.counter = counter
+        self.shard: pathlib.Path | None = None
+        self.documents = 0
+        self.size = 0
+
+    def write(self, block: str) -> None:
+        """
+        Appends the lines of the block, splitting them between shards as they fill up
+        """
+        lines: t.List[bytes] = []
+        for line in block.encode('utf-8').split(b'\n')[:-1]:
+            if self.shard is None or self._full():
+                self._append(lines)
+                lines = []
+                self._next()
+            lines.append(line + b'\n')
+            self.documents = self.documents + 1
+            self.size = self.size + len(line) + 1
+        self._append(lines)
+
+    def _full(self) -> bool:
+        return \
+            (self.max_documents > 0 and self.documents >= self.max_documents) or \
+            (self.max_bytes > 0 and self.size >= self.max_bytes)
+
+    def _next(self) -> None:
+        with self.counter.get_lock():
+            number = self.counter.value
+            self.counter.value = number + 1
+        self.shard = jsonl_shard_path(self.jsonl_out, number)
+        self.documents = 0
+        self.size = 0
+
+    def _append(self, lines: t.List[bytes]) -> None:
+        if self.shard is not None and len(lines) > 0:
+            with open_file(self.shard, 'ab', threads = 1) as fp:
+                fp.write(b''.join(lines))
+
+def list_batches(items: t.Iterable[T], batch_size: int) -> t.Iterator[t.List[T]]:
+    """
+    Groups the items into lists of `batch_size` items.
+    The last list may be shorter.
+
+    Parameters
+    ----------
+    items : Iterable[T]
+        The items to group
+    batch_size : int
+        The number of items in each list
+    """
+    batch: t.List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+_scan_batch_size = 1024
+
+def scan_folder(folder_in: pathlib.Path, is_document: t.Callable[[os.DirEntry], bool], threads: int = 1, recursive: bool = False) -> t.Iterator[os.DirEntry]:
+    """
+    Lists the entries for the documents in the folder, as they are found.
+    `os.scandir` reads the type of each file along with its name, so most checks do not need a `stat`.
+
+    Parameters
+    ----------
+    folder_in : pathlib.Path
+        The folder path containing all the documents
+    is_document : Callable[[os.DirEntry], bool]
+        Determines if the entry is a document
+    threads : int
+        The number of threads checking the entries.
+        More than 1 only helps when the file system makes each check `stat` the file
+    recursive : bool
+        Also lists the documents in the sub folders, and theirs, after the ones in the folder
+    """
+    folders = [os.fspath(folder_in)]
+    pool = concurrent.futures.ThreadPoolExecutor(threads) if threads > 1 else None
+    try:
+        while len(folders) > 0:
+            sub_folders: t.List[str] = []
+            with os.scandir(folders.pop()) as entries:
+                for batch in list_batches(entries, _scan_batch_size):
+                    if recursive:
+                        sub_folders.extend(entry.path for entry in batch if entry.is_dir(follow_symlinks = False))
+                    keeps = map(is_document, batch) if pool is None else pool.map(is_document, batch)
+                    for entry, keep in zip(batch, keeps):
+                        if keep:
+                            yield entry
+            folders.extend(reversed(sub_folders))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def list_folder_documents(folder_in: pathlib.Path, is_document: t.Callable[[os.DirEntry], bool], threads: int = 1, recursive: bool = False, patterns: t.List[str] | None = None) -> t.Iterator[str]:
     """
     Lists the documents in the folder
 
@@ -45,30 +949,235 @@ def list_folder_documents(folder_in: pathlib.Path, is_document: t.Callable[[path
     ----------
     folder_in : pathlib.Path
         The folder path containing all the documents
+    is_document : Callable[[os.DirEntry], bool]
+        Determines if the entry is a document
+    threads : int
+        The number of threads checking the entries
+    recursive : bool
+        Also lists the documents in the sub folders
+    patterns : List[str] | None
+        Glob patterns, such as '*.txt' or 'news/*', matched against the path of the document relative to the folder.
+        A document must match at least one.
+        `None` lists all the documents
+    """
+    prefix = len(os.path.join(os.fspath(folder_in), ''))
+    for entry in scan_folder(folder_in, is_document, threads, recursive):
+        if patterns is None or any(pathlib.PurePath(entry.path[prefix:]).match(pattern) for pattern in patterns):
+            yield entry.path
+
+def archive_format(file_path: pathlib.Path) -> str | None:
+    """
+    The kind of archive the file is, picked from its extension: 'tar' for 'corpus.tar', 'corpus.tar.gz' or 'corpus.tgz', 'zip' for 'corpus.zip' or `None`
+    """
+    suffix = document_suffix(file_path)
+    if suffix == '.tar' or file_path.suffix.lower() == '.tgz':
+        return 'tar'
+    elif suffix == '.zip':
+        return 'zip'
+    else:
+        return None
+
+def is_archive(file_path: pathlib.Path) -> bool:
+    """
+    Determines if the file is a tar or zip archive of documents
+    """
+    result = \
+        archive_format(file_path) is not None and \
+        file_path.is_file()
+    return result
+
+def list_archive_documents(archive_in: pathlib.Path, is_document: t.Callable[[os.DirEntry], bool], recursive: bool = False, patterns: t.List[str] | None = None) -> t.Iterator[t.Tuple[str, bytes]]:
+    """
+    Lists the documents in the tar or zip archive, along with their raw bytes, reading the archive once from start to end.
+    Nothing is extracted to disk.
+    The path of each member in the archive stands in for its path relative to a folder, as in `list_folder_documents`.
+
+    Parameters
+    ----------
+    archive_in : pathlib.Path
+        The archive containing all the documents
+    is_document : Callable[[os.DirEntry], bool]
+        Determines if the member is a document
+    recursive : bool
+        Also lists the documents in the sub folders of the archive
+    patterns : List[str] | None
+        Glob patterns matched against the path of the document in the archive.
+        `None` lists all the documents
+    """
+    if document_suffix(archive_in) == '.zip':
+        with zipfile.ZipFile(archive_in) as zip_file:
+            for info in zip_file.infolist():
+                name = _member_name(info.filename)
+                if _is_member_document(name, not info.is_dir(), is_document, recursive, patterns):
+                    yield (name, zip_file.read(info))
+    else:
+        with open_file(archive_in, 'rb') as fp:
+            with tarfile.open(fileobj = fp, mode = 'r|*') as tar_ball:
+                for info in tar_ball:
+                    name = _member_name(info.name)
+                    if _is_member_document(name, info.isfile(), is_document, recursive, patterns):
+                        tar_file = tar_ball.extractfile(info)
+                        if tar_file is not None:
+                            yield (name, tar_file.read())
+
+def _member_name(name: str) -> str:
+    return pathlib.PurePosixPath(name.lstrip('/')).as_posix()
+
+def _is_member_document(name: str, is_file: bool, is_document: t.Callable[[t.Any], bool], recursive: bool, patterns: t.List[str] | None) -> bool:
+    path = pathlib.PurePosixPath(name)
+    result = \
+        (recursive or len(path.parts) == 1) and \
+        is_document(_archive_member(path.name, is_file)) and \
+        (patterns is None or any(path.match(pattern) for pattern in patterns))
+    return result
+
+class _archive_member:
+    """
+    Lets the `is_*_document` checks look at an archive member the way they look at an `os.DirEntry`
+    """
+    def __init__(self, name: str, is_file: bool):
+        self.name = name
+        self._is_file = is_file
+
+    def is_file(self) -> bool:
+        return self._is_file
+
+def read_document(document: ct.Source) -> t.Tuple[str, bytes]:
     """
-    for file_name in folder_in.iterdir():
-        if is_document(file_name):
-            yield str(file_name)
+    The file name and raw bytes of a document.
+    Paths from `list_folder_documents` are read here; documents from `list_archive_documents` were read with the archive.
 
-def list_merged_folder_documents(folders_in: t.List[pathlib.Path], is_document: t.Callable[[pathlib.Path], bool]) -> t.Iterator[t.List[str]]:
+    Parameters
+    ----------
+    document : str | Tuple[str, bytes]
+        The path of the document, or its path in the archive along with its raw bytes
+    """
+    if isinstance(document, str):
+        with open(document, 'rb') as fp:
+            return (os.path.basename(document), fp.read())
+    return (pathlib.PurePosixPath(document[0]).name, document[1])
+
+def output_layout(folder_out: pathlib.Path, sharded: bool = False) -> str:
+    """
+    How the extracted documents are laid out in the output.
+    'archive' when the output is named like a tar or zip archive, otherwise 'sharded' or 'folder'
+
+    Parameters
+    ----------
+    folder_out : pathlib.Path
+        The folder, or archive, containing all the documents after being extracted
+    sharded : bool
+        Spreads the documents over hash-prefix sub folders
+    """
+    if archive_format(folder_out) is not None:
+        return 'archive'
+    elif sharded:
+        return 'sharded'
+    else:
+        return 'folder'
+
+def make_output(folder_out: pathlib.Path, layout: str) -> None:
     """
-    Lists the documents in the merge folders
+    Creates the output folder, along with all the hash-prefix sub folders for the 'sharded' layout, so the sub processes never have to
+    """
+    if layout == 'archive':
+        folder_out.parent.mkdir(parents = True, exist_ok = True)
+    else:
+        folder_out.mkdir(parents = True, exist_ok = True)
+    if layout == 'sharded':
+        for i in range(16 ** _document_shard_width):
+            folder_out.joinpath(f'{i:0{_document_shard_width}x}').mkdir(exist_ok = True)
+
+_document_shard_width = 2
+
+def document_shard(name: str) -> str:
+    """
+    The hash-prefix sub folder of the document in the 'sharded' layout.
+    There are 256, so no single folder holds more than a small part of the documents
+    """
+    return hashlib.md5(name.encode('utf-8')).hexdigest()[:_document_shard_width]
+
+def save_named_documents(folder_out: str, documents: t.List[t.Tuple[str, str]], layout: str, errors: t.List[str] | None = None) -> t.List[t.Tuple[str, str]]:
+    """
+    Saves a batch of named documents from a sub process.
+    The 'folder' and 'sharded' layouts write each document to a file of its own, returning nothing.
+    The 'archive' layout returns the documents for `save_archive_documents` to add to the archive.
+
+    Parameters
+    ----------
+    folder_out : str
+        The folder, or archive, containing all the documents after being extracted
+    documents : List[Tuple[str, str]]
+        The file name and text of each document
+    layout : str
+        See `output_layout`
+    errors : List[str] | None
+        Gets a line for each document that can not be written, which is then skipped.
+        `None` raises the error instead
+    """
+    if layout == 'archive':
+        return documents
+    if errors is not None:
+        transform_documents(documents, lambda document: save_named_documents(folder_out, [document], layout), lambda document: document[0], errors)
+        return []
+    for name, text in documents:
+        if layout == 'sharded':
+            file_name = os.path.join(folder_out, document_shard(name), name)
+        else:
+            file_name = os.path.join(folder_out, name)
+        with open(file_name, 'w', encoding = 'utf-8') as fp:
+            fp.write(text)
+    return []
+
+def save_archive_documents(batches: t.Iterator[t.List[t.Tuple[str, str]]], archive_out: pathlib.Path) -> None:
+    """
+    Adds the batches of named documents to a tar or zip archive, in the order they arrive.
+    A tar archive is compressed by its extension, such as 'corpus.tar.gz'.
+
+    Parameters
+    ----------
+    batches : Iterator[List[Tuple[str, str]]]
+        The file name and text of each document
+    archive_out : pathlib.Path
+        The archive containing all the documents after being extracted
+    """
+    if archive_format(archive_out) == 'zip':
+        with zipfile.ZipFile(archive_out, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for batch in batches:
+                for name, text in batch:
+                    zip_file.writestr(name, text)
+    else:
+        mode = 'w|gz' if archive_out.suffix.lower() == '.tgz' else 'w|'
+        with open_file(archive_out, 'wb') as fp:
+            with tarfile.open(fileobj = fp, mode = mode) as tar_ball:
+                for batch in batches:
+                    for name, text in batch:
+                        data = text.encode('utf-8')
+                        info = tarfile.TarInfo(name)
+                        info.size = len(data)
+                        tar_ball.addfile(info, io.BytesIO(data))
+
+def list_merged_folder_documents(folders_in: t.List[pathlib.Path], is_document: t.Callable[[os.DirEntry], bool], threads: int = 1) -> t.Iterator[t.List[str]]:
+    """
+    Lists the documents in the merge folders.
+    The names in each folder are read once, so joining a document to its matches in the other folders costs no `stat`.
 
     Parameters
     ----------
     folders_in : pathlib.Path
         The folders containing the documents to merge 
+    is_document : Callable[[os.DirEntry], bool]
+        Determines if the entry is a document
+    threads : int
+        The number of threads checking the entries
     """
+    names = [set(os.listdir(folder)) for folder in folders_in]
     for i in range(len(folders_in)):
-        folder = folders_in[i]
-        for file_name in folder.iterdir():
-            if is_document(file_name):
-                result = [f.joinpath(file_name.name) for f in folders_in]
-                exists = [f.exists() for f in result]
-                if i > 0 and any(exists[0:i]):
-                    continue
-                docs = [str(result[i]) for i in range(len(result)) if exists[i]]
-                yield docs
+        for entry in scan_folder(folders_in[i], is_document, threads):
+            if any(entry.name in names[j] for j in range(i)):
+                continue
+            docs = [str(folders_in[j].joinpath(entry.name)) for j in range(len(folders_in)) if entry.name in names[j]]
+            yield docs
 
 def csv_list(text: str) -> t.List[str]:
     """
@@ -93,36 +1202,198 @@ def csv_tuple(text: str) -> t.List[t.Tuple[str, str]]:
     result = [tuple(target.split(':')) for target in text.split(',')]
     return result
 
-def is_txt_document(file_path: pathlib.Path) -> bool:
+def int_list(text: str) -> t.List[int]:
     """
-    Determines if the file should be included in the processing
+    Converts a CSV string of ints and inclusive ranges, such as '1-3,5', into a list of ints
+
+    Parameters
+    ----------
+    text : str
+        The CSV text
+    """
+    result: t.List[int] = []
+    for item in csv_list(text):
+        if '-' in item:
+            first, last = item.split('-')
+            result.extend(range(int(first), int(last) + 1))
+        else:
+            result.append(int(item))
+    return result
+
+def byte_size(text: str) -> int:
+    """
+    Converts a size such as '512M' or '8G' into bytes
+
+    Parameters
+    ----------
+    text : str
+        The size, optionally followed by a K, M, G or T multiplier
+    """
+    units = { 'K' : 1024, 'M' : 1024 ** 2, 'G' : 1024 ** 3, 'T' : 1024 ** 4 }
+    text = text.strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def is_txt_document(file_path: pathlib.Path | os.DirEntry) -> bool:
+    """
+    Determines if the file should be included in the processing.
+    The name is checked first, as `is_file` costs a `stat` for a `pathlib.Path`, but usually not for an `os.DirEntry`.
     """
+    name = pathlib.PurePath(file_path.name)
     result = \
-        file_path.is_file() and \
-        file_path.suffix.lower() == '.txt' and \
-        not file_path.stem.startswith('_')
+        name.suffix.lower() == '.txt' and \
+        not name.stem.startswith('_') and \
+        file_path.is_file()
     return result
 
-def is_json_document(file_path: pathlib.Path) -> bool:
+def is_json_document(file_path: pathlib.Path | os.DirEntry) -> bool:
     """
     Determines if the file should be included in the processing
     """
+    name = pathlib.PurePath(file_path.name)
     result = \
-        file_path.is_file() and \
-        file_path.suffix.lower() == '.json' and \
-        not file_path.stem.startswith('_')
+        name.suffix.lower() == '.json' and \
+        not name.stem.startswith('_') and \
+        file_path.is_file()
     return result
 
-def is_jsonl_document(file_path: pathlib.Path) -> bool:
+def is_jsonl_document(file_path: pathlib.Path | os.DirEntry) -> bool:
     """
     Determines if the file should be included in the processing
     """
+    name = pathlib.PurePath(file_path.name)
     result = \
-        file_path.is_file() and \
-        file_path.suffix.lower() == '.jsonl' and \
-        not file_path.stem.startswith('_')
+        document_suffix(name) == '.jsonl' and \
+        not name.stem.startswith('_') and \
+        file_path.is_file()
+    return result
+
+class batch_result:
+    """
+    What a sub process made of a batch.
+
+    Attributes
+    ----------
+    output : Any
+        What the tool saves for the batch
+    documents : int
+        The number of documents in the batch, including the ones that failed
+    errors : List[str]
+        A line for the error log for each document that failed
+    """
+    def __init__(self, output: t.Any, documents: int, errors: t.List[str]):
+        self.output = output
+        self.documents = documents
+        self.errors = errors
+
+def transform_documents(items: t.Sequence[T], transform: t.Callable[[T], t.Any], describe: t.Callable[[T], str], errors: t.List[str]) -> t.List[t.Any]:
+    """
+    Transforms each item of a batch, skipping the ones that fail so the rest of the batch is still saved.
+    An exception in a sub process would otherwise end it, along with the whole batch.
+
+    Parameters
+    ----------
+    items : Sequence[T]
+        The documents of the batch
+    transform : Callable[[T], Any]
+        Transforms a single document
+    describe : Callable[[T], str]
+        Names the document in the error log
+    errors : List[str]
+        Gets a line for each document that fails
+    """
+    result: t.List[t.Any] = []
+    for item in items:
+        try:
+            result.append(transform(item))
+        except Exception as ex:
+            errors.append(f'{describe(item)}: {type(ex).__name__}: {ex}')
     return result
 
+def split_jsonl_batch(batch: bytes) -> t.List[bytes]:
+    """
+    Splits a block from `list_jsonl_batches` into its non blank lines, so each document can be decoded on its own
+    """
+    return [line for line in (line.strip() for line in batch.split(b'\n')) if len(line) > 0]
+
+def describe_jsonl_line(line: bytes) -> str:
+    """
+    Names a raw `JSONL` line in an error log by its start, since a batch does not know its line numbers
+    """
+    text = line[:80].decode('utf-8', errors = 'replace')
+    return text if len(line) <= 80 else f'{text}...'
+
+def describe_source(document: ct.Source) -> str:
+    """
+    Names the document in an error log by its path, or its path in the archive
+    """
+    return document if isinstance(document, str) else document[0]
+
+def error_log_path(file_out: pathlib.Path) -> pathlib.Path:
+    """
+    The error log kept next to the output file, or folder, of a tool
+    """
+    return file_out.parent.joinpath(f'{file_out.stem}.error.log')
+
+def save_batch_results(results: t.Iterator[batch_result], save: t.Callable[..., None], save_args: tuple, error_log: pathlib.Path) -> None:
+    """
+    Passes the output of each `batch_result` on to `save`, showing the progress in documents rather than batches.
+    The errors are written to the `error_log`, which is only made when there are any.
+
+    Parameters
+    ----------
+    results : Iterator[batch_result]
+        The results of the sub processes
+    save : Callable
+        Saves the outputs in the form `def save(iterator, *save_args) -> None`
+    save_args : tuple
+        The other arguments of `save`
+    error_log : pathlib.Path
+        The file the errors are written to
+    """
+    if error_log.exists():
+        error_log.unlink()
+    log = _error_log(error_log)
+    try:
+        save(_list_batch_outputs(results, log), *save_args)
+    finally:
+        log.close()
+    if log.count > 0:
+        print(f'{log.count} documents failed and were skipped, see {error_log}')
+
+class _error_log:
+    """
+    An error log that is only made once the first error is written
+    """
+    def __init__(self, file_name: pathlib.Path):
+        self.file_name = file_name
+        self.fp: t.TextIO | None = None
+        self.count = 0
+
+    def write(self, errors: t.List[str]) -> None:
+        if len(errors) > 0:
+            if self.fp is None:
+                self.fp = open(self.file_name, 'w', encoding = 'utf-8')
+            self.fp.writelines(f'{error}\n' for error in errors)
+            self.count = self.count + len(errors)
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+
+def _list_batch_outputs(results: t.Iterator[batch_result], log: _error_log) -> t.Iterator[t.Any]:
+    documents = 0
+    widgets = ['Saving Document # ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
+    with pb.ProgressBar(widgets = widgets) as bar:
+        for result in results:
+            documents = documents + result.documents
+            bar.update(documents)
+            log.write(result.errors)
+            yield result.output
+
 def drain_iterator(completes: t.Iterator[int]) -> None:
     """
     Runs through the iterator, doing nothing
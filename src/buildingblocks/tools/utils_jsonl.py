@@ -25,7 +25,7 @@ def save_documents(jsonl_out: pathlib.Path, documents: t.Iterator[dict]) -> None
     bar_i = 0
     widgets = [ 'Saving JSONL # ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
     with pb.ProgressBar(widgets = widgets) as bar:
-        with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
+        with u.open_file(jsonl_out, 'wt', encoding = 'utf-8') as fp:
             with jl.Writer(fp, compact = True, sort_keys = True) as writer:
                 for document in documents:
                     writer.write(document)
@@ -1,32 +1,189 @@
+import array
 import json
 import pathlib
 import progressbar as pb
+import sys
 import tarfile as tf
 import typing as t
-from io import BytesIO
+import utils as u
 from typeguard import typechecked
 
+_index_magic = b'BBTX'
+
+@typechecked
+def list_documents(jsont_in: pathlib.Path, start: int = 0, end: t.Optional[int] = None) -> t.Iterator[dict]:
+    """
+    Lists all the documents in the `JSONT` file.
+
+    Parameters
+    ----------
+    jsont_in : pathlib.Path
+        The JSONT file containing all the documents
+    start : int
+        The 0 based number of the first document
+    end : int | None
+        The number of the document after the last one.
+        `None` reads to the end of the file
+    """
+    for payload in list_payloads(jsont_in, start, end):
+        yield json.loads(payload.decode('utf-8'))
+
 @typechecked
-def list_documents(jsont_in: pathlib.Path) -> t.Iterator[dict]:
+def list_payloads(jsont_in: pathlib.Path, start: int = 0, end: t.Optional[int] = None) -> t.Iterator[bytes]:
     """
-    Lists all the documents in the `JSONT` file
+    Lists the raw bytes of the documents in the `JSONT` file, without decoding them.
+    Asking for a range of documents uses the member index, building it first if needed, to seek straight to the first one.
+    Compressed files have no index and are always read from the start.
 
     Parameters
     ----------
     jsont_in : pathlib.Path
         The JSONT file containing all the documents
+    start : int
+        The 0 based number of the first document
+    end : int | None
+        The number of the document after the last one.
+        `None` reads to the end of the file
+    """
+    if u.compression(jsont_in) is not None:
+        with u.open_file(jsont_in, 'rb') as fp:
+            with tf.open(fileobj = fp, mode = 'r|') as tar_ball:
+                number = 0
+                for tar_info in tar_ball:
+                    if end is not None and number >= end:
+                        break
+                    if tar_info.isfile():
+                        tar_file = tar_ball.extractfile(tar_info)
+                        if tar_file is not None:
+                            if number >= start:
+                                yield tar_file.read()
+                            number = number + 1
+    elif start == 0 and end is None and load_index(jsont_in) is None:
+        with tf.open(jsont_in, 'r') as tar_ball:
+            tar_info = tar_ball.next()
+            while tar_info is not None:
+                if tar_info.isfile():
+                    tar_file = tar_ball.extractfile(tar_info)
+                    if tar_file is not None:
+                        yield tar_file.read()
+                tar_info = tar_ball.next()
+    else:
+        index = load_index(jsont_in)
+        if index is None:
+            index = build_index(jsont_in)
+        count = len(index) // 2
+        end = count if end is None else min(end, count)
+        with open(jsont_in, 'rb') as fp:
+            for i in range(start, end):
+                fp.seek(index[2 * i])
+                yield fp.read(index[2 * i + 1])
+
+@typechecked
+def get_document(jsont_in: pathlib.Path, number: int) -> dict:
+    """
+    Reads a single document from the `JSONT` file without reading the members before it
+
+    Parameters
+    ----------
+    jsont_in : pathlib.Path
+        The JSONT file containing all the documents
+    number : int
+        The 0 based number of the document
+    """
+    for document in list_documents(jsont_in, number, number + 1):
+        return document
+    raise IndexError(f'Document {number} is not in {jsont_in}')
+
+@typechecked
+def split_documents(jsont_in: pathlib.Path, parts: int) -> t.List[t.Tuple[int, int]]:
+    """
+    Splits the documents in the `JSONT` file into ranges of about the same number of bytes.
+    Each range is suitable for `list_documents`.
+
+    Parameters
+    ----------
+    jsont_in : pathlib.Path
+        The JSONT file containing all the documents
+    parts : int
+        The number of ranges.
+        Fewer come back if there are fewer documents
+    """
+    index = load_index(jsont_in)
+    if index is None:
+        index = build_index(jsont_in)
+    count = len(index) // 2
+    total = sum(index[1::2])
+    result: t.List[t.Tuple[int, int]] = []
+    start = 0
+    size = 0
+    for i in range(count):
+        size = size + index[2 * i + 1]
+        if size * parts >= total * (len(result) + 1) or i == count - 1:
+            result.append((start, i + 1))
+            start = i + 1
+    return result
+
+def index_path(jsont_in: pathlib.Path) -> pathlib.Path:
     """
+    The path of the member index sidecar of the `JSONT` file
+    """
+    return jsont_in.with_name(f'{jsont_in.name}.idx')
+
+@typechecked
+def build_index(jsont_in: pathlib.Path) -> t.Sequence[int]:
+    """
+    Walks the member headers of the `JSONT` file, without reading the documents, and saves the member index
+
+    Parameters
+    ----------
+    jsont_in : pathlib.Path
+        The JSONT file containing all the documents
+    """
+    if u.compression(jsont_in) is not None:
+        raise ValueError(f'{jsont_in} is compressed, so it can not be indexed')
+    index = array.array('Q')
     with tf.open(jsont_in, 'r') as tar_ball:
         tar_info = tar_ball.next()
         while tar_info is not None:
             if tar_info.isfile():
-                tar_file = tar_ball.extractfile(tar_info)
-                if tar_file is not None:
-                    txt = tar_file.read()
-                    txt = txt.decode('utf-8')
-                    document = json.loads(txt)
-                    yield document
+                index.append(tar_info.offset_data)
+                index.append(tar_info.size)
             tar_info = tar_ball.next()
+    _save_index(jsont_in, index)
+    return index
+
+@typechecked
+def load_index(jsont_in: pathlib.Path) -> t.Optional[t.Sequence[int]]:
+    """
+    Loads the member index of the `JSONT` file: the byte offset and size of each document, flattened.
+    Returns `None` when there is no index or the JSONT file changed after it was indexed.
+
+    Parameters
+    ----------
+    jsont_in : pathlib.Path
+        The JSONT file containing all the documents
+    """
+    index_in = index_path(jsont_in)
+    if u.compression(jsont_in) is not None or not index_in.exists():
+        return None
+    with open(index_in, 'rb') as fp:
+        header = u.read_index_header(fp, _index_magic, 'JSONT', jsont_in)
+        if header is None:
+            return None
+        _, count = header
+        index = array.array('Q')
+        index.frombytes(fp.read(count * 16))
+    if sys.byteorder != 'little':
+        index.byteswap()
+    return index
+
+def _save_index(jsont_in: pathlib.Path, index: array.array) -> None:
+    data = array.array('Q', index)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    with open(index_path(jsont_in), 'wb') as fp:
+        fp.write(u.pack_index_header(_index_magic, 0, len(data) // 2, jsont_in))
+        fp.write(data.tobytes())
 
 @typechecked
 def save_documents(jsont_out: pathlib.Path, documents: t.Iterator[dict]) -> None:
@@ -40,16 +197,50 @@ def save_documents(jsont_out: pathlib.Path, documents: t.Iterator[dict]) -> None
     documents : Iterator[dict]
         The JSON documents to save
     """
+    payloads = (encode_document(document) for document in documents)
+    save_payloads(jsont_out, payloads)
+
+def encode_document(document: dict) -> bytes:
+    """
+    Encodes the document the way it is stored in a `JSONT` file
+    """
+    return json.dumps(document, indent = None, sort_keys = True).encode('utf-8')
+
+@typechecked
+def save_payloads(jsont_out: pathlib.Path, payloads: t.Iterator[bytes]) -> None:
+    """
+    Saves the encoded documents to a `JSONT` file, along with its member index.
+    The tar headers and payloads are written straight to the file, giving the same bytes as `tarfile` without copying each payload into a `BytesIO`.
+    A compression extension, such as '.jsont.gz', compresses the file, which then has no member index.
+
+    Parameters
+    ----------
+    jsont_out : pathlib.Path
+        The JSONT file to contain all the documents
+    payloads : Iterator[bytes]
+        The encoded JSON documents to save
+    """
     bar_i = 0
+    index = array.array('Q')
     widgets = [ 'Saving JSONT # ', pb.Counter(), ' ', pb.Timer(), ' ', pb.BouncingBar(marker = '.', left = '[', right = ']')]
     with pb.ProgressBar(widgets = widgets) as bar:
-        with tf.open(jsont_out, 'w') as tar_ball:
-            for document in documents:
-                txt = json.dumps(document, indent = None, sort_keys = True)
-                txt = txt.encode('utf-8')
-                with BytesIO(txt) as tar_file:
-                    info = tf.TarInfo(name = f'{bar_i}.json')
-                    info.size = len(txt)
-                    tar_ball.addfile(info, fileobj = tar_file)
-                    bar_i = bar_i + 1
-                    bar.update(bar_i)
+        with u.open_file(jsont_out, 'wb') as fp:
+            offset = 0
+            for payload in payloads:
+                info = tf.TarInfo(name = f'{bar_i}.json')
+                info.size = len(payload)
+                header = info.tobuf(tf.DEFAULT_FORMAT, tf.ENCODING, 'surrogateescape')
+                padding = -len(payload) % tf.BLOCKSIZE
+                fp.write(header)
+                fp.write(payload)
+                fp.write(tf.NUL * padding)
+                index.append(offset + len(header))
+                index.append(len(payload))
+                offset = offset + len(header) + len(payload) + padding
+                bar_i = bar_i + 1
+                bar.update(bar_i)
+            fp.write(tf.NUL * (tf.BLOCKSIZE * 2))
+            offset = offset + tf.BLOCKSIZE * 2
+            fp.write(tf.NUL * (-offset % tf.RECORDSIZE))
+    if u.compression(jsont_out) is None:
+        _save_index(jsont_out, index)
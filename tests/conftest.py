@@ -0,0 +1,11 @@
+import pathlib
+import sys
+
+_src = pathlib.Path(__file__).resolve().parent.parent.joinpath('src')
+sys.path.insert(0, str(_src))
+# The script style tools import `utils` and `utils_jsonl` as top level modules, so they are aliased to the package's copies
+import buildingblocks.tools.utils
+sys.modules.setdefault('utils', buildingblocks.tools.utils)
+import buildingblocks.tools.utils_jsonl
+sys.modules.setdefault('utils_jsonl', buildingblocks.tools.utils_jsonl)
+sys.path.insert(1, str(_src.joinpath('buildingblocks', 'tools')))
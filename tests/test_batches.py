@@ -0,0 +1,41 @@
+import json
+import pathlib
+import pytest
+import convert_jsonl
+import extract_txt_from_jsonl
+import utils as u
+
+@pytest.fixture
+def jsonl_in(tmp_path: pathlib.Path) -> pathlib.Path:
+    """
+    A corpus with a broken line in the middle of a batch
+    """
+    lines = [json.dumps({ 'id' : str(i), 'text' : [f'line {i}'], 'other' : i }) for i in range(10)]
+    lines.insert(5, '{"id": "broken", "text": [')
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_text(''.join(f'{line}\n' for line in lines), encoding = 'utf-8')
+    return jsonl_in
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_skips_bad_document(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, workers: int) -> None:
+    jsonl_out = tmp_path.joinpath('out.jsonl')
+    convert_jsonl.convert_jsonl(jsonl_in, jsonl_out, ['id', 'text'], workers, batch_size = 4)
+    documents = [json.loads(line) for line in jsonl_out.read_text(encoding = 'utf-8').splitlines()]
+    assert sorted(int(document['id']) for document in documents) == list(range(10))
+    assert all('other' not in document for document in documents)
+    errors = u.error_log_path(jsonl_out).read_text(encoding = 'utf-8').splitlines()
+    assert len(errors) == 1 and errors[0].startswith('{"id": "broken"')
+
+def test_extract_skips_bad_document(jsonl_in: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    folder_out = tmp_path.joinpath('out')
+    extract_txt_from_jsonl.extract_txt_from_jsonl(jsonl_in, folder_out, 'id', ['text'], 2, batch_size = 4)
+    assert sorted(int(path.stem) for path in folder_out.iterdir()) == list(range(10))
+    assert len(u.error_log_path(folder_out).read_text(encoding = 'utf-8').splitlines()) == 1
+
+def test_no_error_log_without_errors(tmp_path: pathlib.Path) -> None:
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_text(''.join(json.dumps({ 'id' : str(i), 'text' : ['x'] }) + '\n' for i in range(3)), encoding = 'utf-8')
+    jsonl_out = tmp_path.joinpath('out.jsonl')
+    u.error_log_path(jsonl_out).write_text('stale\n', encoding = 'utf-8')
+    convert_jsonl.convert_jsonl(jsonl_in, jsonl_out, ['id'], 1)
+    assert not u.error_log_path(jsonl_out).exists()
@@ -0,0 +1,130 @@
+import csv
+import importlib
+import json
+import pathlib
+import random
+import pytest
+
+count_ngrams = importlib.import_module('buildingblocks.tools.count_ngrams')
+
+@pytest.fixture(scope = 'module')
+def corpus(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    """
+    A corpus of Zipf distributed words, the way word frequencies fall off in real text
+    """
+    rng = random.Random(0)
+    words = [f'w{i}' for i in range(5000)]
+    weights = [1 / (i + 1) ** 1.1 for i in range(len(words))]
+    jsonl_out = tmp_path_factory.mktemp('corpus').joinpath('corpus.jsonl')
+    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
+        for i in range(2000):
+            text = [' '.join(rng.choices(words, weights, k = 20)) for _ in range(5)]
+            fp.write(json.dumps({ 'id' : str(i), 'text' : text }) + '\n')
+    return jsonl_out
+
+def _top_ngrams(csv_in: pathlib.Path) -> set:
+    with open(csv_in, 'r', encoding = 'utf-8', newline = '') as fp:
+        return { row['ngram'] for row in csv.DictReader(fp) }
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('verify', [False, True])
+def test_approx_recall(corpus: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, workers: int, verify: bool) -> None:
+    monkeypatch.setattr(count_ngrams, '_min_shard_size', 64 * 1024)
+    exact_out = tmp_path.joinpath('exact.csv')
+    approx_out = tmp_path.joinpath('approx.csv')
+    count_ngrams.count_ngrams(corpus, exact_out, ['text'], 3, 100, 1000000, False, False, ties = 'truncate')
+    count_ngrams.count_ngrams(corpus, approx_out, ['text'], 3, 100, 1000000, False, False, workers = workers, memory = 1000000, approx = True, verify = verify, ties = 'truncate')
+    exact = _top_ngrams(exact_out)
+    recall = len(_top_ngrams(approx_out) & exact) / len(exact)
+    assert recall >= (0.98 if verify else 0.85)
+
+def test_store_survives_top_zero(corpus: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    """
+    A `top` of 0 saves no n-grams, but the store still has to keep every count
+    """
+    lines = corpus.read_text(encoding = 'utf-8').splitlines(keepends = True)
+    first = tmp_path.joinpath('first.jsonl')
+    second = tmp_path.joinpath('second.jsonl')
+    first.write_text(''.join(lines[:1000]), encoding = 'utf-8')
+    second.write_text(''.join(lines[1000:]), encoding = 'utf-8')
+    store = tmp_path.joinpath('store')
+    count_ngrams.count_ngrams(first, tmp_path.joinpath('first.csv'), ['text'], 2, 0, 1000000, False, False, store = store)
+    count_ngrams.count_ngrams(first, tmp_path.joinpath('stored.csv'), ['text'], 2, 0, 1000000, False, False, store = store)
+    count_ngrams.count_ngrams(second, tmp_path.joinpath('stored.csv'), ['text'], 2, 50, 1000000, False, False, store = store)
+    count_ngrams.count_ngrams(corpus, tmp_path.joinpath('direct.csv'), ['text'], 2, 50, 1000000, False, False)
+    assert tmp_path.joinpath('stored.csv').read_bytes() == tmp_path.joinpath('direct.csv').read_bytes()
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('ties', ['keep', 'truncate'])
+def test_intern_matches_strings(corpus: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, workers: int, ties: str) -> None:
+    """
+    A small `chunk_size` caches many chunks, so the packed merge is exercised along with sizes past 4 tokens
+    """
+    monkeypatch.setattr(count_ngrams, '_min_shard_size', 64 * 1024)
+    string_out = tmp_path.joinpath('string.csv')
+    intern_out = tmp_path.joinpath('intern.csv')
+    count_ngrams.count_ngrams(corpus, string_out, ['text'], [1, 2, 3, 4, 5], 200, 20000, False, False, ties = ties)
+    count_ngrams.count_ngrams(corpus, intern_out, ['text'], [1, 2, 3, 4, 5], 200, 20000, False, False, workers = workers, intern = True, ties = ties)
+    assert intern_out.read_bytes() == string_out.read_bytes()
+
+def _write_chunks(tmp_path: pathlib.Path, rng: random.Random, count: int, codec: str = 'none') -> tuple:
+    """
+    Sorted chunks of random n-grams, along with the summed counts they should merge into
+    """
+    expected: dict = {}
+    chunks = []
+    for _ in range(count):
+        ngrams = {}
+        for _ in range(rng.randint(0, 300)):
+            gram = ' '.join(rng.choices(['a', 'b', 'é', 'dog', 'cat'], k = 3))
+            ngrams[gram] = ngrams.get(gram, 0) + rng.randint(1, 1000)
+        for gram, value in ngrams.items():
+            expected[gram] = expected.get(gram, 0) + value
+        chunks.append(count_ngrams._write_ngram_chunk(iter(sorted(ngrams.items())), tmp_path, codec))
+    return (chunks, sorted(expected.items()))
+
+@pytest.mark.parametrize('fan_in', [2, 3, 4096])
+def test_merge_sums_every_chunk(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, fan_in: int) -> None:
+    """
+    A small fan-in makes the merge go through rounds of batches merged back to disk first
+    """
+    monkeypatch.setattr(count_ngrams, '_max_fan_in', lambda: fan_in)
+    chunks, expected = _write_chunks(tmp_path, random.Random(fan_in), 11)
+    assert list(count_ngrams._merge_ngram_chunks(chunks, tmp_path, 2, 'none')) == expected
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_chunked_counts_match_single_chunk(corpus: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, workers: int) -> None:
+    monkeypatch.setattr(count_ngrams, '_max_fan_in', lambda: 4)
+    single_out = tmp_path.joinpath('single.csv')
+    chunked_out = tmp_path.joinpath('chunked.csv')
+    count_ngrams.count_ngrams(corpus, single_out, ['text'], [1, 3], 300, 10000000, False, False, ties = 'truncate')
+    count_ngrams.count_ngrams(corpus, chunked_out, ['text'], [1, 3], 300, 5000, False, False, workers = workers, ties = 'truncate')
+    assert chunked_out.read_bytes() == single_out.read_bytes()
+
+@pytest.mark.parametrize('codec', ['none', 'zlib', 'lzma'])
+def test_chunk_round_trip(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, codec: str) -> None:
+    """
+    A tiny block size splits records, and their varints, across the block boundaries
+    """
+    monkeypatch.setattr(count_ngrams, '_block_size', 7)
+    ngrams = sorted({ 'a' : 1, 'é b' : 127, 'x' * 200 : 128, 'z y' : 2 ** 40, '' : 3, '日本 語' : 16384 }.items())
+    chunk = count_ngrams._write_ngram_chunk(iter(ngrams), tmp_path, codec)
+    assert chunk.name.endswith(count_ngrams._chunk_suffixes[codec])
+    assert list(count_ngrams._read_ngram_chunk(chunk, False)) == ngrams
+    assert list(count_ngrams._read_ngram_chunk(chunk)) == ngrams
+    assert not chunk.exists()
+
+def test_partial_chunk_raises(tmp_path: pathlib.Path) -> None:
+    chunk = count_ngrams._write_ngram_chunk(iter([('a b', 5), ('c d', 300)]), tmp_path, 'none')
+    chunk.write_bytes(chunk.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        list(count_ngrams._read_ngram_chunk(chunk, False))
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_compressed_chunks_match(corpus: pathlib.Path, tmp_path: pathlib.Path, codec: str) -> None:
+    plain_out = tmp_path.joinpath('plain.csv')
+    compressed_out = tmp_path.joinpath('compressed.csv')
+    count_ngrams.count_ngrams(corpus, plain_out, ['text'], 2, 100, 5000, False, False)
+    count_ngrams.count_ngrams(corpus, compressed_out, ['text'], 2, 100, 5000, False, False, codec = codec)
+    assert compressed_out.read_bytes() == plain_out.read_bytes()
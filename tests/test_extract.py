@@ -0,0 +1,83 @@
+import json
+import pathlib
+import tarfile
+import zipfile
+import pytest
+import extract_itxt_from_jsonl
+import extract_json_from_jsonl
+import extract_txt_from_jsonl
+import utils as u
+
+@pytest.fixture
+def jsonl_in(tmp_path: pathlib.Path) -> pathlib.Path:
+    lines = [json.dumps({ 'text' : [f'line {i}', f'é {i}'], 'tags' : ['a', 'b'], 'id' : f'doc{i}' }) for i in range(60)]
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_text(''.join(f'{line}\n' for line in lines), encoding = 'utf-8')
+    return jsonl_in
+
+def _read_output(folder_out: pathlib.Path) -> dict:
+    """
+    The name and bytes of every document in a folder or archive output
+    """
+    if u.archive_format(folder_out) == 'zip':
+        with zipfile.ZipFile(folder_out) as zip_file:
+            return { name : zip_file.read(name) for name in zip_file.namelist() }
+    elif u.archive_format(folder_out) == 'tar':
+        with tarfile.open(folder_out, 'r:*') as tar_ball:
+            return { info.name : tar_ball.extractfile(info).read() for info in tar_ball.getmembers() }
+    result = {}
+    for path in folder_out.rglob('*'):
+        if path.is_file():
+            if path.parent != folder_out:
+                assert path.parent.name == u.document_shard(path.name)
+            result[path.name] = path.read_bytes()
+    return result
+
+_extracts = {
+    'txt' : lambda jsonl_in, folder_out, sharded: extract_txt_from_jsonl.extract_txt_from_jsonl(jsonl_in, folder_out, 'id', ['text', 'tags'], 2, 7, sharded),
+    'itxt' : lambda jsonl_in, folder_out, sharded: extract_itxt_from_jsonl.extract_itxt_from_jsonl(jsonl_in, folder_out, 'id', ['text', 'tags'], 2, 7, sharded),
+    'json' : lambda jsonl_in, folder_out, sharded: extract_json_from_jsonl.extract_json_from_jsonl(jsonl_in, folder_out, 'id', 2, 7, sharded),
+}
+
+# The name and text of one document, the way the tools wrote it before the other layouts were added
+_doc3 = {
+    'txt' : ('doc3.txt', 'line 3\né 3\na\nb\n'.encode('utf-8')),
+    'itxt' : ('doc3.txt', 'line 3\na\n\né 3\nb\n'.encode('utf-8')),
+    'json' : ('doc3.json', json.dumps({ 'text' : ['line 3', 'é 3'], 'tags' : ['a', 'b'], 'id' : 'doc3' }, sort_keys = True).encode('utf-8')),
+}
+
+@pytest.mark.parametrize('tool', list(_extracts))
+def test_layouts_hold_the_same_documents(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, tool: str) -> None:
+    extract = _extracts[tool]
+    extract(jsonl_in, tmp_path.joinpath('folder'), False)
+    expected = _read_output(tmp_path.joinpath('folder'))
+    assert len(expected) == 60
+    name, text = _doc3[tool]
+    assert expected[name] == text
+    extract(jsonl_in, tmp_path.joinpath('sharded'), True)
+    assert _read_output(tmp_path.joinpath('sharded')) == expected
+    for archive in ['corpus.tar', 'corpus.tar.gz', 'corpus.tgz', 'corpus.zip']:
+        extract(jsonl_in, tmp_path.joinpath(archive), False)
+        assert _read_output(tmp_path.joinpath(archive)) == expected
+
+def _baseline_json_documents(jsonl_in: pathlib.Path) -> dict:
+    """
+    What the single process `extract_json_from_jsonl` wrote, before it ran on EPTS
+    """
+    documents = (json.loads(line) for line in jsonl_in.read_text(encoding = 'utf-8').splitlines())
+    return { f'{document["id"]}.json' : json.dumps(document, sort_keys = True, indent = None).encode('utf-8') for document in documents if 'id' in document }
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_json_matches_serial(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, workers: int) -> None:
+    folder_out = tmp_path.joinpath('out')
+    extract_json_from_jsonl.extract_json_from_jsonl(jsonl_in, folder_out, 'id', workers, 7)
+    assert _read_output(folder_out) == _baseline_json_documents(jsonl_in)
+
+@pytest.mark.parametrize('backend', ['json', u.json_backend])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_raw_json_keeps_lines(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, workers: int, backend: str) -> None:
+    monkeypatch.setattr(u, 'json_backend', backend)
+    folder_out = tmp_path.joinpath('out')
+    extract_json_from_jsonl.extract_json_from_jsonl(jsonl_in, folder_out, 'id', workers, 7, raw = True)
+    lines = jsonl_in.read_bytes().splitlines()
+    assert _read_output(folder_out) == { f'{json.loads(line)["id"]}.json' : line for line in lines }
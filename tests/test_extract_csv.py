@@ -0,0 +1,51 @@
+import csv
+import importlib
+import json
+import pathlib
+import pytest
+
+extract_csv_from_jsonl = importlib.import_module('buildingblocks.tools.extract_csv_from_jsonl')
+
+@pytest.fixture
+def source(tmp_path: pathlib.Path) -> pathlib.Path:
+    """
+    A folder of JSONL files with quotes, commas, line feeds, nested lists and missing fields in the values
+    """
+    folder = tmp_path.joinpath('source')
+    folder.mkdir()
+    for f in range(3):
+        with open(folder.joinpath(f'part{f}.jsonl'), 'w', encoding = 'utf-8') as fp:
+            for i in range(400):
+                document = { 'id' : f'{f}-{i}', 'text' : [f'say "hi", {i}', 'é\nnext'], 'tokens' : [['a', 'b'], ['c']] }
+                if i % 7 == 0:
+                    del document['tokens']
+                fp.write(json.dumps(document) + '\n')
+    return folder
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_workers_match_serial(source: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, workers: int) -> None:
+    monkeypatch.setattr(extract_csv_from_jsonl, '_shard_size', 4096)
+    fields = ['id', 'text', 'tokens']
+    serial_out = tmp_path.joinpath('serial.csv')
+    ordered_out = tmp_path.joinpath('ordered.csv')
+    unordered_out = tmp_path.joinpath('unordered.csv')
+    extract_csv_from_jsonl.extract_csv_from_jsonl(source, serial_out, fields)
+    extract_csv_from_jsonl.extract_csv_from_jsonl(source, ordered_out, fields, workers)
+    extract_csv_from_jsonl.extract_csv_from_jsonl(source, unordered_out, fields, workers, unordered = True)
+    assert ordered_out.read_bytes() == serial_out.read_bytes()
+    with open(serial_out, 'r', encoding = 'utf-8', newline = '') as fp:
+        serial_rows = list(csv.reader(fp))
+    with open(unordered_out, 'r', encoding = 'utf-8', newline = '') as fp:
+        unordered_rows = list(csv.reader(fp))
+    assert unordered_rows[0] == serial_rows[0] == fields
+    assert sorted(unordered_rows[1:]) == sorted(serial_rows[1:])
+    assert len(serial_rows) == 1201
+
+def test_single_file_matches_serial(source: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(extract_csv_from_jsonl, '_shard_size', 1000)
+    source_file = source.joinpath('part1.jsonl')
+    serial_out = tmp_path.joinpath('serial.csv')
+    parallel_out = tmp_path.joinpath('parallel.csv')
+    extract_csv_from_jsonl.extract_csv_from_jsonl(source_file, serial_out, ['text', 'id'])
+    extract_csv_from_jsonl.extract_csv_from_jsonl(source_file, parallel_out, ['text', 'id'], 2)
+    assert parallel_out.read_bytes() == serial_out.read_bytes()
@@ -0,0 +1,131 @@
+import multiprocessing as mp
+import pathlib
+import tarfile
+import zipfile
+import pytest
+import combine_json_to_jsonl
+import combine_txt_to_jsonl
+import utils as u
+
+def _make_folder(folder: pathlib.Path, names: list) -> pathlib.Path:
+    for name in names:
+        document = folder.joinpath(name)
+        document.parent.mkdir(parents = True, exist_ok = True)
+        document.write_text(f'{name}\nsecond line\n', encoding = 'utf-8')
+    return folder
+
+def _baseline_folder_documents(folder_in: pathlib.Path) -> list:
+    """
+    How the documents were listed before the folders were scanned with `os.scandir`
+    """
+    return [str(file_name) for file_name in folder_in.iterdir() if u.is_txt_document(file_name)]
+
+def _baseline_merged_documents(folders_in: list) -> list:
+    result = []
+    for i in range(len(folders_in)):
+        for file_name in folders_in[i].iterdir():
+            if u.is_txt_document(file_name):
+                paths = [folder.joinpath(file_name.name) for folder in folders_in]
+                exists = [path.exists() for path in paths]
+                if i > 0 and any(exists[0:i]):
+                    continue
+                result.append([str(paths[j]) for j in range(len(paths)) if exists[j]])
+    return result
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_scan_matches_iterdir(tmp_path: pathlib.Path, threads: int) -> None:
+    names = [f'd{i}.txt' for i in range(3000)] + ['_skipped.txt', 'notes.md', 'sub/d0.txt']
+    folder_in = _make_folder(tmp_path.joinpath('in'), names)
+    folder_in.joinpath('folder.txt').mkdir()
+    documents = list(u.list_folder_documents(folder_in, u.is_txt_document, threads))
+    assert sorted(documents) == sorted(_baseline_folder_documents(folder_in))
+    assert len(documents) == 3000
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_merged_documents_match_baseline(tmp_path: pathlib.Path, threads: int) -> None:
+    folders_in = [
+        _make_folder(tmp_path.joinpath('a'), ['1.txt', '2.txt', '3.txt']),
+        _make_folder(tmp_path.joinpath('b'), ['2.txt', '4.txt']),
+        _make_folder(tmp_path.joinpath('c'), ['1.txt', '4.txt', '5.txt', '_6.txt']),
+    ]
+    expected = _baseline_merged_documents(folders_in)
+    assert sorted(u.list_merged_folder_documents(folders_in, u.is_txt_document, threads)) == sorted(expected)
+    assert len(expected) == 5
+
+def test_recursive_patterns(tmp_path: pathlib.Path) -> None:
+    names = ['top.txt', 'news/a.txt', 'news/2020/b.txt', 'blogs/c.txt', 'blogs/_d.txt']
+    folder_in = _make_folder(tmp_path.joinpath('in'), names)
+    def relative(documents: list) -> list:
+        return sorted(pathlib.Path(document).relative_to(folder_in).as_posix() for document in documents)
+    assert relative(u.list_folder_documents(folder_in, u.is_txt_document)) == ['top.txt']
+    assert relative(u.list_folder_documents(folder_in, u.is_txt_document, recursive = True)) == sorted(names[:4])
+    assert relative(u.list_folder_documents(folder_in, u.is_txt_document, recursive = True, patterns = ['news/*'])) == ['news/a.txt']
+    assert relative(u.list_folder_documents(folder_in, u.is_txt_document, recursive = True, patterns = ['news/*/*', 'top.*'])) == ['news/2020/b.txt', 'top.txt']
+
+@pytest.mark.parametrize('max_documents, max_bytes', [(3, 0), (0, 40), (4, 40), (1000, 0)])
+def test_shard_writer_boundaries(tmp_path: pathlib.Path, max_documents: int, max_bytes: int) -> None:
+    lines = [f'{{"id":"{i}","text":["{"x" * (i % 9)}"]}}\n' for i in range(25)]
+    jsonl_out = tmp_path.joinpath('corpus.jsonl')
+    writer = u.jsonl_shard_writer(jsonl_out, max_documents, max_bytes, mp.Value('q', 0))
+    for start in range(0, len(lines), 7):
+        writer.write(''.join(lines[start:start + 7]))
+    shards = u.list_jsonl_shard_paths(jsonl_out)
+    assert shards == [u.jsonl_shard_path(jsonl_out, i) for i in range(len(shards))]
+    assert b''.join(shard.read_bytes() for shard in shards) == ''.join(lines).encode('utf-8')
+    for shard in shards[:-1]:
+        lines_in_shard = shard.read_bytes().splitlines(True)
+        size = sum(len(line) for line in lines_in_shard)
+        # Only a full shard is moved on from, so it stops at the document limit or with the line that reaches the byte limit
+        at_documents = max_documents > 0 and len(lines_in_shard) == max_documents
+        at_bytes = max_bytes > 0 and size - len(lines_in_shard[-1]) < max_bytes <= size
+        assert at_documents or at_bytes
+        assert max_documents == 0 or len(lines_in_shard) <= max_documents
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sharded_combine_matches_single_file(tmp_path: pathlib.Path, workers: int) -> None:
+    folder_in = _make_folder(tmp_path.joinpath('in'), [f'd{i}.txt' for i in range(45)])
+    single_out = tmp_path.joinpath('single.jsonl')
+    sharded_out = tmp_path.joinpath('out', 'sharded.jsonl')
+    sharded_out.parent.mkdir()
+    combine_txt_to_jsonl.combine_txt_to_jsonl(folder_in, single_out, 1, 4)
+    combine_txt_to_jsonl.combine_txt_to_jsonl(folder_in, sharded_out, workers, 4, shard_documents = 10)
+    shards = u.list_jsonl_shard_paths(sharded_out)
+    lines = [line for shard in shards for line in shard.read_bytes().splitlines(True)]
+    assert all(len(shard.read_bytes().splitlines()) <= 10 for shard in shards)
+    if workers == 1:
+        assert len(shards) == 5
+        assert b''.join(lines) == single_out.read_bytes()
+    else:
+        assert sorted(lines) == sorted(single_out.read_bytes().splitlines(True))
+    # Each sub process fills its own shard, and the shards of the last run are removed first
+    combine_txt_to_jsonl.combine_txt_to_jsonl(folder_in, sharded_out, workers, 4, shard_documents = 50)
+    shards = u.list_jsonl_shard_paths(sharded_out)
+    assert shards == [u.jsonl_shard_path(sharded_out, i) for i in range(len(shards))] and len(shards) <= workers
+    assert sum(len(shard.read_bytes().splitlines()) for shard in shards) == 45
+
+def _make_archive(folder_in: pathlib.Path, archive_out: pathlib.Path) -> pathlib.Path:
+    paths = sorted(path for path in folder_in.rglob('*') if path.is_file())
+    if archive_out.suffix == '.zip':
+        with zipfile.ZipFile(archive_out, 'w') as zip_file:
+            for path in paths:
+                zip_file.write(path, path.relative_to(folder_in).as_posix())
+    else:
+        with tarfile.open(archive_out, 'w:gz' if archive_out.suffix in ['.gz', '.tgz'] else 'w') as tar_ball:
+            for path in paths:
+                tar_ball.add(path, path.relative_to(folder_in).as_posix())
+    return archive_out
+
+@pytest.mark.parametrize('archive', ['corpus.tar', 'corpus.tar.gz', 'corpus.tgz', 'corpus.zip'])
+@pytest.mark.parametrize('recursive, patterns', [(False, None), (True, None), (True, ['news/*'])])
+def test_archive_matches_folder(tmp_path: pathlib.Path, archive: str, recursive: bool, patterns: list | None) -> None:
+    names = [f'd{i}.txt' for i in range(20)] + ['_skipped.txt', 'news/a.txt', 'news/2020/b.txt', 'blogs/c.txt']
+    folder_in = _make_folder(tmp_path.joinpath('in'), names)
+    for i in range(5):
+        folder_in.joinpath('news', f'j{i}.json').write_text(f'{{"text": ["json {i}"]}}', encoding = 'utf-8')
+    archive_in = _make_archive(folder_in, tmp_path.joinpath(archive))
+    for combine in [combine_txt_to_jsonl.combine_txt_to_jsonl, combine_json_to_jsonl.combine_json_to_jsonl]:
+        folder_out = tmp_path.joinpath('folder.jsonl')
+        archive_out = tmp_path.joinpath('archive.jsonl')
+        combine(folder_in, folder_out, 1, 4, recursive = recursive, patterns = patterns)
+        combine(archive_in, archive_out, 2, 4, recursive = recursive, patterns = patterns)
+        assert sorted(archive_out.read_bytes().splitlines()) == sorted(folder_out.read_bytes().splitlines())
@@ -0,0 +1,75 @@
+import importlib
+import json
+import os
+import pathlib
+import pytest
+import buildingblocks.tools.utils as u
+
+index_jsonl = importlib.import_module('buildingblocks.tools.index_jsonl')
+
+@pytest.fixture
+def jsonl_in(tmp_path: pathlib.Path) -> pathlib.Path:
+    """
+    Documents of uneven sizes, with integer ids, a blank line and non ASCII text
+    """
+    jsonl_out = tmp_path.joinpath('corpus.jsonl')
+    with open(jsonl_out, 'w', encoding = 'utf-8') as fp:
+        for i in range(500):
+            fp.write(json.dumps({ 'id' : 1000 + i, 'text' : [f'café {i} ' * (i % 17)] }, ensure_ascii = False) + '\n')
+            if i == 250:
+                fp.write('\n')
+    return jsonl_out
+
+def test_build_and_load(jsonl_in: pathlib.Path) -> None:
+    index_jsonl.index_jsonl(jsonl_in, 'id')
+    documents = list(u.list_jsonl_documents(jsonl_in))
+    with u.load_jsonl_index(jsonl_in, with_ids = True) as index:
+        assert len(index) == len(documents)
+        assert index.offsets[len(index)] == jsonl_in.stat().st_size
+        assert list(u.get_jsonl_documents(jsonl_in, index, range(len(index)))) == documents
+        assert u.get_jsonl_document(jsonl_in, index, 499) == documents[499]
+        with pytest.raises(IndexError):
+            u.get_jsonl_document(jsonl_in, index, 500)
+
+def test_find_by_id(jsonl_in: pathlib.Path) -> None:
+    index_jsonl.index_jsonl(jsonl_in, 'id')
+    with u.load_jsonl_index(jsonl_in, with_ids = True) as index:
+        assert u.find_jsonl_document(jsonl_in, index, 1042)['id'] == 1042
+        assert u.find_jsonl_document(jsonl_in, index, '1042')['id'] == 1042
+        assert u.find_jsonl_document(jsonl_in, index, 42) is None
+    with u.load_jsonl_index(jsonl_in) as index:
+        with pytest.raises(ValueError):
+            u.find_jsonl_document(jsonl_in, index, 1042)
+
+def test_stale_index_is_ignored(jsonl_in: pathlib.Path) -> None:
+    index_jsonl.index_jsonl(jsonl_in)
+    with u.load_jsonl_index(jsonl_in) as index:
+        assert index is not None
+    stat = jsonl_in.stat()
+    os.utime(jsonl_in, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert u.load_jsonl_index(jsonl_in) is None
+    index_jsonl.index_jsonl(jsonl_in)
+    with open(jsonl_in, 'a', encoding = 'utf-8') as fp:
+        fp.write(json.dumps({ 'id' : 0, 'text' : [] }) + '\n')
+    assert u.load_jsonl_index(jsonl_in) is None
+
+def test_close_unmaps(jsonl_in: pathlib.Path) -> None:
+    index_jsonl.index_jsonl(jsonl_in)
+    index = u.load_jsonl_index(jsonl_in)
+    index.close()
+    with pytest.raises(ValueError):
+        index.offsets[0]
+    index.close()
+
+@pytest.mark.parametrize('by_documents', [False, True])
+@pytest.mark.parametrize('parts', [1, 3, 7, 1000])
+def test_split_covers_every_document_once(jsonl_in: pathlib.Path, parts: int, by_documents: bool) -> None:
+    index_jsonl.index_jsonl(jsonl_in)
+    documents = list(u.list_jsonl_documents(jsonl_in))
+    with u.load_jsonl_index(jsonl_in) as index:
+        ranges = u.split_jsonl_index(index, parts, by_documents)
+    assert len(ranges) == min(parts, len(documents)) if by_documents else len(ranges) <= parts
+    assert [document for start, end in ranges for document in u.list_jsonl_documents(jsonl_in, start, end)] == documents
+    if by_documents:
+        sizes = [len(list(u.list_jsonl_documents(jsonl_in, start, end))) for start, end in ranges]
+        assert max(sizes) - min(sizes) <= 1
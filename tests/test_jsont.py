@@ -0,0 +1,124 @@
+import io
+import json
+import pathlib
+import tarfile
+import pytest
+import convert_jsonl_to_jsont
+import convert_jsont_to_jsonl
+import utils_jsonl as ul
+import utils_jsont as ut
+
+def _documents(count: int) -> list:
+    return [{ 'id' : str(i), 'text' : [f'line {i}', 'é' * (i % 7)], 'n' : i } for i in range(count)]
+
+def _save_with_tarfile(jsont_out: pathlib.Path, documents: list) -> None:
+    """
+    How `save_documents` wrote the file before it streamed the members itself
+    """
+    with tarfile.open(jsont_out, 'w') as tar_ball:
+        for i, document in enumerate(documents):
+            txt = json.dumps(document, indent = None, sort_keys = True).encode('utf-8')
+            info = tarfile.TarInfo(name = f'{i}.json')
+            info.size = len(txt)
+            tar_ball.addfile(info, fileobj = io.BytesIO(txt))
+
+@pytest.mark.parametrize('count', [0, 1, 37, 500])
+def test_save_documents_matches_tarfile(tmp_path: pathlib.Path, count: int) -> None:
+    documents = _documents(count)
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    expected_out = tmp_path.joinpath('expected.jsont')
+    ut.save_documents(jsont_out, iter(documents))
+    _save_with_tarfile(expected_out, documents)
+    assert jsont_out.read_bytes() == expected_out.read_bytes()
+    assert list(ut.list_documents(jsont_out)) == documents
+
+def test_index_matches_members(tmp_path: pathlib.Path) -> None:
+    documents = _documents(200)
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    ut.save_documents(jsont_out, iter(documents))
+    index = ut.load_index(jsont_out)
+    with tarfile.open(jsont_out, 'r') as tar_ball:
+        assert list(index) == [value for member in tar_ball.getmembers() for value in (member.offset_data, member.size)]
+    ut.index_path(jsont_out).unlink()
+    assert list(ut.build_index(jsont_out)) == list(index)
+    assert list(ut.load_index(jsont_out)) == list(index)
+
+def test_ranges_seek_to_documents(tmp_path: pathlib.Path) -> None:
+    documents = _documents(200)
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    ut.save_documents(jsont_out, iter(documents))
+    assert list(ut.list_documents(jsont_out, 50, 60)) == documents[50:60]
+    assert list(ut.list_documents(jsont_out, 190, 500)) == documents[190:]
+    assert ut.get_document(jsont_out, 123) == documents[123]
+    with pytest.raises(IndexError):
+        ut.get_document(jsont_out, 200)
+    ranges = ut.split_documents(jsont_out, 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(documents)
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+    assert [document for start, end in ranges for document in ut.list_documents(jsont_out, start, end)] == documents
+
+def test_stale_index_is_rebuilt(tmp_path: pathlib.Path) -> None:
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    ut.save_documents(jsont_out, iter(_documents(10)))
+    documents = _documents(20)
+    _save_with_tarfile(jsont_out, documents)
+    assert ut.load_index(jsont_out) is None
+    assert list(ut.list_documents(jsont_out, 15)) == documents[15:]
+    assert ut.load_index(jsont_out) is not None
+
+@pytest.mark.parametrize('suffix', ['.gz', '.bz2', '.xz'])
+def test_compressed_round_trip(tmp_path: pathlib.Path, suffix: str) -> None:
+    documents = _documents(100)
+    jsont_out = tmp_path.joinpath(f'corpus.jsont{suffix}')
+    ut.save_documents(jsont_out, iter(documents))
+    assert not ut.index_path(jsont_out).exists()
+    assert list(ut.list_documents(jsont_out)) == documents
+    assert list(ut.list_documents(jsont_out, 40, 45)) == documents[40:45]
+
+@pytest.fixture
+def jsonl_in(tmp_path: pathlib.Path) -> pathlib.Path:
+    """
+    Lines with unsorted keys, spacing and escapes, which only a raw copy keeps as they are
+    """
+    lines = [f'{{"text": ["line {i}", "\\u00e9 é"], "id": "{i}",  "n": {i}.50}}' for i in range(300)]
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_bytes(''.join(f'{line}\n' for line in lines).encode('utf-8'))
+    return jsonl_in
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('validate', [False, True])
+def test_raw_copy_keeps_lines(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, workers: int, validate: bool) -> None:
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    jsonl_out = tmp_path.joinpath('out.jsonl')
+    convert_jsonl_to_jsont.convert_jsonl_to_jsont(jsonl_in, jsont_out, workers, 7, validate)
+    assert list(ut.list_payloads(jsont_out)) == jsonl_in.read_bytes().splitlines()
+    convert_jsont_to_jsonl.convert_jsont_to_jsonl(jsont_out, jsonl_out, workers, validate)
+    assert jsonl_out.read_bytes() == jsonl_in.read_bytes()
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_canonical_matches_decoded_copy(jsonl_in: pathlib.Path, tmp_path: pathlib.Path, workers: int) -> None:
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    expected_jsont = tmp_path.joinpath('expected.jsont')
+    convert_jsonl_to_jsont.convert_jsonl_to_jsont(jsonl_in, jsont_out, workers, 7, canonical = True)
+    ut.save_documents(expected_jsont, ul.list_documents(jsonl_in))
+    assert jsont_out.read_bytes() == expected_jsont.read_bytes()
+    jsonl_out = tmp_path.joinpath('out.jsonl')
+    expected_jsonl = tmp_path.joinpath('expected.jsonl')
+    convert_jsont_to_jsonl.convert_jsont_to_jsonl(jsont_out, jsonl_out, workers, canonical = True)
+    ul.save_documents(expected_jsonl, ut.list_documents(jsont_out))
+    assert jsonl_out.read_bytes() == expected_jsonl.read_bytes()
+
+def test_multi_line_members_fit_on_one_line(tmp_path: pathlib.Path) -> None:
+    documents = _documents(5)
+    jsont_out = tmp_path.joinpath('corpus.jsont')
+    ut.save_payloads(jsont_out, (json.dumps(document, indent = 2).encode('utf-8') for document in documents))
+    jsonl_out = tmp_path.joinpath('out.jsonl')
+    convert_jsont_to_jsonl.convert_jsont_to_jsonl(jsont_out, jsonl_out)
+    assert [json.loads(line) for line in jsonl_out.read_bytes().splitlines()] == documents
+
+def test_validate_rejects_non_objects(tmp_path: pathlib.Path) -> None:
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_bytes(b'{"id": "0"}\n[1, 2]\n')
+    convert_jsonl_to_jsont.convert_jsonl_to_jsont(jsonl_in, tmp_path.joinpath('raw.jsont'))
+    with pytest.raises(ValueError):
+        convert_jsonl_to_jsont.convert_jsonl_to_jsont(jsonl_in, tmp_path.joinpath('checked.jsont'), validate = True)
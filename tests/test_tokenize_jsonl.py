@@ -0,0 +1,47 @@
+import nltk.tokenize
+import pytest
+import tokenize_jsonl
+
+_treebank = nltk.tokenize._treebank_word_tokenizer.tokenize
+
+@pytest.mark.parametrize('sentence', [
+    'A.I.-driven tools are everywhere.',
+    "Rock 'n' roll never dies.",
+    "I'd've gone, but I cannot; we're gonna wanna leave.",
+    "'Tis the season, d'ye hear? Gimme more'n that!",
+    '"Quoted," she said (twice) -- and left...',
+    'He paid $5,000.00 for it, i.e. 50% more.',
+    '« Bonjour » — “hello” ‘there’ at 3:30.',
+    "It's the end.'\"  ",
+    'tabs\tand\nnew lines.'])
+def test_regex_words_match_treebank(sentence: str) -> None:
+    assert tokenize_jsonl._regex_word_tokenize(sentence) == _treebank(sentence)
+
+def test_regex_words_match_treebank_on_real_text() -> None:
+    """
+    The Python documentation topics ship with Python, so they are real English text that is always at hand
+    """
+    from pydoc_data.topics import topics
+    sentences = [
+        sentence
+        for key in sorted(topics)
+        for paragraph in topics[key].split('\n\n')
+        for sentence in tokenize_jsonl._regex_sent_tokenize(' '.join(paragraph.split()))]
+    mismatches = [sentence for sentence in sentences if tokenize_jsonl._regex_word_tokenize(sentence) != _treebank(sentence)]
+    assert mismatches == []
+
+def test_nltk_engine_matches_nltk_functions(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    The `nltk` engine builds its tokenizers once, and has to give the same tokens as `nltk.sent_tokenize` / `nltk.word_tokenize`.
+    The trained Punkt model needs a download, so both use the same untrained one.
+    """
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+    from pydoc_data.topics import topics
+    punkt = PunktSentenceTokenizer()
+    monkeypatch.setattr(nltk.tokenize, '_get_punkt_tokenizer', lambda language = 'english': punkt)
+    monkeypatch.setattr(tokenize_jsonl, '_load_punkt', lambda: punkt)
+    tokenizers = tokenize_jsonl._tokenizers('nltk')
+    lines = [' '.join(paragraph.split()) for key in sorted(topics)[:40] for paragraph in topics[key].split('\n\n')]
+    for line in lines:
+        expected = [nltk.tokenize.word_tokenize(sentence) for sentence in nltk.tokenize.sent_tokenize(line)]
+        assert [tokenizers.words(sentence) for sentence in tokenizers.sentences(line)] == expected
@@ -0,0 +1,48 @@
+import json
+import pathlib
+import pytest
+import buildingblocks.tools.utils as u
+
+_codecs = ['', '.gz', '.bz2', '.xz', pytest.param('.zst', marks = pytest.mark.skipif(u._zstd is None, reason = 'zstandard is not installed'))]
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('suffix', _codecs)
+def test_open_file_round_trip(tmp_path: pathlib.Path, suffix: str, threads: int) -> None:
+    data = b''.join(f'{{"id":"{i}","text":["line {i}"]}}\n'.encode('utf-8') for i in range(50000))
+    file_name = tmp_path.joinpath(f'corpus.jsonl{suffix}')
+    with u.open_file(file_name, 'wb', threads = threads) as fp:
+        fp.write(data)
+    with u.open_file(file_name, 'rb') as fp:
+        assert fp.read() == data
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('suffix', _codecs)
+def test_open_file_appends(tmp_path: pathlib.Path, suffix: str, threads: int) -> None:
+    file_name = tmp_path.joinpath(f'corpus.jsonl{suffix}')
+    for block in [b'first\n', b'second\n']:
+        with u.open_file(file_name, 'ab', threads = threads) as fp:
+            fp.write(block)
+    with u.open_file(file_name, 'rt', encoding = 'utf-8') as fp:
+        assert fp.read() == 'first\nsecond\n'
+
+_stdlib_only_lines = [
+    b'{"id":"nan","score":NaN,"low":-Infinity,"high":Infinity}',
+    b'{"id":"big","value":123456789012345678901234567890,"negative":-18446744073709551617}',
+    b'{"id":"surrogate","text":"\\ud800"}',
+]
+
+@pytest.mark.parametrize('line', _stdlib_only_lines)
+def test_json_loads_matches_stdlib(line: bytes) -> None:
+    # repr, since NaN never equals itself
+    assert repr(u.json_loads(line)) == repr(json.loads(line))
+    with pytest.raises(ValueError):
+        u.json_loads(line[:-1])
+
+@pytest.mark.parametrize('fields', [None, ['id', 'value']])
+def test_list_jsonl_documents_matches_stdlib(tmp_path: pathlib.Path, fields: list | None) -> None:
+    jsonl_in = tmp_path.joinpath('corpus.jsonl')
+    jsonl_in.write_bytes(b''.join(line + b'\n' for line in _stdlib_only_lines))
+    expected = [json.loads(line) for line in _stdlib_only_lines]
+    if fields is not None:
+        expected = [{ key : value for key, value in document.items() if key in fields } for document in expected]
+    assert repr(list(u.list_jsonl_documents(jsonl_in, fields = fields))) == repr(expected)